@@ -0,0 +1,7 @@
+'''Core of the Auto Face Rig tool.
+
+Auto_Face_Rig_v7.py holds the Maya UI, the rig stages its buttons run are in
+face_rig.stages and the other modules of this package hold the work the
+stages rely on. Importing the package does no scene or UI work, the stages
+import the modules they need when they first run (see face_rig.lazy).
+'''
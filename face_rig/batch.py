@@ -0,0 +1,237 @@
+'''Headless batch rigging of many heads.
+
+A manifest lists the heads to rig, each with the scene file holding its
+'Head', 'Left_eye' and 'Right_eye' meshes and the 24 face picks, in the same
+order the artist would pick them in the UI:
+
+    {
+        "heads": [
+            {"name": "hero", "mesh": "heads/hero.mb", "faces": [812, 790, 766, ...]},
+            {"name": "crowd_01", "mesh": "heads/crowd_01.obj", "faces": [[40, 41], 73, ...],
+             "output": "rigs/crowd_01.ma"}
+        ]
+    }
+
+A pick is a face index or a list of face indices. With "faces": "auto" the
+picks are found by face_rig.landmarks instead. A head can name its own rig
+template with "template", the default is face_rig/templates/default_face.json, override how
+its controls drive the joints with "connections", "constraints" or "matrix" (see
+face_rig.connections), and name saved skin weights to put back after the auto skin with "weights"
+(see face_rig.weights_io).
+Relative paths are relative to the manifest. Every head is rigged in its own worker process and a report
+with the result, the time of every stage, the hits and misses of the scene
+query cache, the time of the control cleanup passes and the node count and graph depth of the
+built rig is written at the end:
+
+    mayapy -m face_rig.batch heads.json --workers 4 --report report.json
+
+With --scene fake the heads are rigged in face_rig.fake_scene's FakeScene
+instead of Maya, which only needs NumPy and reads OBJ files. --trace DIR
+traces every scene command of each build (see face_rig.tracing) and writes
+<head>.trace.json and <head>.folded to DIR.
+'''
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+import time
+import traceback
+
+from face_rig import connections, controls, geometry, scene, stages, template, tracing, transaction
+
+# the stages the UI buttons run, in button order
+PIPELINE = [
+    ('create_joints', stages.create_joints),
+    ('create_head_joint', stages.create_head_joint),
+    ('mirror_joints', stages.mirror_joints),
+    ('create_controls', stages.create_controls),
+    ('auto_skin', stages.auto_skin),
+]
+
+
+def read_manifest(path):
+    '''load a manifest and return its heads with absolute file paths
+    '''
+    with open(path) as manifest_file:
+        manifest = json.load(manifest_file)
+    root = os.path.dirname(os.path.abspath(path))
+    heads = []
+    for index, head in enumerate(manifest['heads']):
+        if 'mesh' not in head or 'faces' not in head:
+            raise ValueError('head %d of %s needs a "mesh" and a "faces" entry' % (index, path))
+        head = dict(head)
+        head.setdefault('name', os.path.splitext(os.path.basename(head['mesh']))[0])
+        for key in ('mesh', 'output', 'template', 'weights'):
+            if head.get(key):
+                head[key] = os.path.join(root, head[key])
+        heads.append(head)
+    return heads
+
+
+def face_selections(faces, mesh_name='Head'):
+    '''turn the picks of a manifest into the (mesh, face_indices) list the stages read
+    '''
+    return [(mesh_name, [pick] if isinstance(pick, int) else list(pick)) for pick in faces]
+
+
+def run_pipeline(faces, mesh_name='Head', timings=None):
+    '''run every stage on the open scene and return the (stage, seconds) of each. If a stage
+    fails, the build is rolled back and the stages that ran, the failed one last, are already
+    in the timings list passed in
+    '''
+    stages.generated_joints = []
+    pipeline = PIPELINE
+    if faces == 'auto':
+        pipeline = [('auto_place_faces', stages.auto_place_faces)] + PIPELINE
+    else:
+        stages.selected_faces = face_selections(faces, mesh_name)
+    timings = [] if timings is None else timings
+    # the whole build is one transaction, a failing stage rolls back the stages before it too
+    with transaction.run('build'):
+        for stage_name, stage in pipeline:
+            start = time.perf_counter()
+            try:
+                stage()
+            finally:
+                timings.append((stage_name, time.perf_counter() - start))
+    return timings
+
+
+def _start_worker(scene_kind):
+    '''process pool initializer, sets up the scene backend once per worker
+    '''
+    if scene_kind == 'maya':
+        import maya.standalone
+        maya.standalone.initialize(name='python')
+        scene.get_scene().cmds.loadPlugin('objExport', quiet=True)
+    else:
+        from face_rig.fake_scene import FakeScene
+        scene.set_scene(FakeScene())
+
+
+def rig_head(head):
+    '''rig a single head in the current worker and return its report entry
+    '''
+    cmds = scene.cmds
+    result = {'name': head['name'], 'mesh': head['mesh'], 'pid': os.getpid()}
+    start = time.perf_counter()
+    timings = []
+    build_trace = None
+    stage_name = 'template'
+    try:
+        # compiled before the scene is touched, so a broken template fails the head straight away
+        plan = None
+        if head.get('template') or head.get('connections'):
+            rig_template = template.load_template(head.get('template') or template.DEFAULT_TEMPLATE)
+            if head.get('connections'):
+                rig_template['controls']['connections'] = head['connections']
+            plan = template.compile_template(rig_template)
+        template.set_active_plan(plan)
+        if head.get('trace'):
+            build_trace = tracing.start(head['name'])
+        stage_name = 'open'
+        cmds.file(new=True, force=True)
+        cmds.file(head['mesh'], i=True)
+        geometry.cache.invalidate()
+        geometry.cache.reset_counters()
+        controls.clear()
+        stage_name = None
+        run_pipeline(head['faces'], head.get('mesh_name', 'Head'), timings)
+        if head.get('weights'):
+            stage_name = 'load_skin_weights'
+            weights_start = time.perf_counter()
+            stages.load_skin_weights(head['weights'], head.get('mesh_name', 'Head'))
+            timings.append((stage_name, time.perf_counter() - weights_start))
+        stage_name = 'save'
+        if head.get('output'):
+            cmds.file(rename=head['output'])
+            cmds.file(save=True, type='mayaAscii')
+        result['status'] = 'ok'
+        result['joints'] = len(cmds.ls('*', type='joint'))
+        result['rig'] = connections.rig_stats(controls=controls.registry)
+        result['rig']['mode'] = template.active_plan().connections
+    except Exception as error:
+        result['status'] = 'failed'
+        result['failed_stage'] = stage_name or (timings[-1][0] if timings else 'select_faces')
+        result['error'] = '%s: %s' % (type(error).__name__, error)
+        result['traceback'] = traceback.format_exc()
+    finally:
+        # stopped whatever happened, the next head of the worker starts its own trace
+        if build_trace is not None:
+            tracing.stop()
+    if build_trace is not None:
+        json_path, folded_path = tracing.write(build_trace, head['trace'])
+        result['trace'] = {'json': json_path, 'folded': folded_path,
+                           'top': [[command['command'], command['self_seconds']]
+                                   for command in tracing.summary(build_trace)['commands'][:3]]}
+    result['query_cache'] = geometry.cache.stats()
+    result['cleanup'] = [{'pass': label, 'controls': count, 'seconds': round(seconds, 6)}
+                         for label, count, seconds in controls.timings]
+    result['stages'] = dict((name, round(seconds, 6)) for name, seconds in timings)
+    result['seconds'] = round(time.perf_counter() - start, 6)
+    return result
+
+
+def rig_heads(heads, workers=None, scene_kind='maya'):
+    '''rig every head in a pool of worker processes, results come back in manifest order
+    '''
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_start_worker,
+                                                initargs=(scene_kind,)) as pool:
+        return list(pool.map(rig_head, heads))
+
+
+def format_report(results):
+    '''a table of the results for the console
+    '''
+    stage_names = [name for name, stage in PIPELINE]
+    if any('auto_place_faces' in result['stages'] for result in results):
+        stage_names.insert(0, 'auto_place_faces')
+    if any('load_skin_weights' in result['stages'] for result in results):
+        stage_names.append('load_skin_weights')
+    lines = ['%-20s %-7s %8s  %s  %6s %5s' % ('head', 'status', 'total',
+                                              '  '.join('%10s' % s[:10] for s in stage_names), 'nodes', 'depth')]
+    for result in results:
+        times = ['%10s' % ('%.3f' % result['stages'][s] if s in result['stages'] else '-') for s in stage_names]
+        rig = result.get('rig', {})
+        lines.append('%-20s %-7s %8.3f  %s  %6s %5s' % (result['name'][:20], result['status'], result['seconds'],
+                                                         '  '.join(times), rig.get('nodes', '-'),
+                                                         rig.get('depth', '-')))
+        if result['status'] != 'ok':
+            lines.append('    %s in %s' % (result['error'], result['failed_stage']))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Rig every head of a manifest without the UI.')
+    parser.add_argument('manifest', help='JSON manifest listing the heads to rig')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, defaults to the CPU count')
+    parser.add_argument('--report', help='write the per head results to this JSON file')
+    parser.add_argument('--scene', choices=('maya', 'fake'), default='maya',
+                        help='rig in Maya standalone or in the in-memory stand-in scene')
+    parser.add_argument('--trace', help='trace the scene commands of every head and write the traces to this directory')
+    args = parser.parse_args(argv)
+
+    heads = read_manifest(args.manifest)
+    if args.trace:
+        if not os.path.isdir(args.trace):
+            os.makedirs(args.trace)
+        for head in heads:
+            head['trace'] = os.path.join(os.path.abspath(args.trace), head['name'])
+    start = time.perf_counter()
+    results = rig_heads(heads, args.workers, args.scene)
+    elapsed = time.perf_counter() - start
+
+    print(format_report(results))
+    failed = sum(1 for result in results if result['status'] != 'ok')
+    print('%d heads rigged, %d failed, %.2f seconds' % (len(results) - failed, failed, elapsed))
+    if args.trace:
+        print('command traces written to %s' % args.trace)
+    if args.report:
+        with open(args.report, 'w') as report_file:
+            json.dump({'seconds': elapsed, 'heads': results}, report_file, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
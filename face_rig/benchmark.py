@@ -0,0 +1,345 @@
+'''Benchmarks of the rig stages on synthetic heads.
+
+Every stage of the pipeline is run in a FakeScene on heads made by
+face_rig.synthetic, from 1k to 1M faces. The picks come from
+face_rig.landmarks and are found before the clock starts. For every stage
+the wall time, the commands sent to the scene and the hits and misses of
+the scene query cache are recorded, and the results are written as JSON so
+two versions of the tool can be compared:
+
+    python -m face_rig.benchmark --output before.json
+    python -m face_rig.benchmark --output after.json --compare before.json
+
+--compare prints the change of every stage and exits with 1 when a stage got
+slower than the tolerance or sends more commands than before. --obj-dir also
+writes the synthetic heads as OBJ files, to rig them in Maya with
+face_rig.batch.
+
+--sessions rigs that many characters of the first head size one after the
+other in the same scene instead, each in its own face_rig.session
+RigSession, and prints the time and the memory every one of them took, which
+should stay the same however many were rigged before:
+
+    python -m face_rig.benchmark --faces 10000 --sessions 20
+
+--proxy times the landmarks and the skin weights of every head size on the
+full head and on its face_rig.proxy proxy, and prints the speed-up with the
+error the proxy made: how far the picks moved, the largest and the mean
+change of a skin weight and the distance of the head to the proxy surface:
+
+    python -m face_rig.benchmark --faces 100000 1000000 --proxy
+
+--import-time times a cold import of face_rig.stages, the core the UI and
+the batch driver start from, in fresh interpreters and lists the heavy
+modules it pulled in. Importing it does no scene or UI work and leaves
+NumPy and maya.cmds for the first stage that needs them, see face_rig.lazy,
+so it exits with 1 when the import takes longer than IMPORT_BUDGET seconds
+or brings them in:
+
+    python -m face_rig.benchmark --import-time
+'''
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from face_rig import batch, geometry, landmarks, proxy, scene, session, skinning, stages, transaction
+from face_rig.fake_scene import FakeScene
+from face_rig.mesh_io import save_obj
+from face_rig.synthetic import make_head
+
+FACE_COUNTS = [1000, 10000, 100000, 1000000]
+RESULTS_VERSION = 1
+# the longest a cold import of the core may take, and the modules it should not import
+IMPORT_BUDGET = 0.02
+HEAVY_MODULES = ['numpy', 'maya', 'face_rig.geometry', 'face_rig.skinning']
+# run in a fresh interpreter, prints the import time and the heavy modules loaded
+_IMPORT_SCRIPT = '''import sys, time
+start = time.perf_counter()
+import %s
+print(time.perf_counter() - start)
+print(' '.join(name for name in %r if name in sys.modules))
+'''
+
+
+def bench_head(face_count, repeat=1):
+    '''rig a synthetic head repeat times and return its results, the fastest time of every stage
+    '''
+    start = time.perf_counter()
+    meshes = make_head(face_count)
+    picks = landmarks.detect_face_picks(meshes['Head'], meshes['Left_eye'], meshes['Right_eye'])
+    result = {
+        'faces': meshes['Head'].num_faces,
+        'vertices': meshes['Head'].num_points,
+        'setup_seconds': round(time.perf_counter() - start, 6),
+        'stages': {},
+    }
+    for run in range(repeat):
+        fake = FakeScene()
+        with scene.use_scene(fake):
+            for name, mesh in meshes.items():
+                fake.add_mesh(name, mesh)
+            stages.generated_joints = []
+            stages.selected_faces = batch.face_selections(picks)
+            geometry.cache.invalidate()
+            with transaction.run('benchmark'):
+                for stage_name, stage in batch.PIPELINE:
+                    fake.calls.clear()
+                    geometry.cache.reset_counters()
+                    stage_start = time.perf_counter()
+                    stage()
+                    seconds = time.perf_counter() - stage_start
+                    previous = result['stages'].get(stage_name)
+                    if previous is None or seconds < previous['seconds']:
+                        result['stages'][stage_name] = {
+                            'seconds': round(seconds, 6),
+                            'calls': sum(fake.calls.values()),
+                            'commands': dict(sorted(fake.calls.items())),
+                            'query_cache': geometry.cache.stats(),
+                        }
+    result['seconds'] = round(sum(stage['seconds'] for stage in result['stages'].values()), 6)
+    return result
+
+
+def bench_sessions(face_count, count):
+    '''rig count characters in one scene, each in a RigSession of its own, and return the metrics of
+    every session with the bytes of memory it kept
+    '''
+    meshes = make_head(face_count)
+    picks = landmarks.detect_face_picks(meshes['Head'], meshes['Left_eye'], meshes['Right_eye'])
+    fake = FakeScene()
+    results = []
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    try:
+        with scene.use_scene(fake):
+            for index in range(count):
+                gc.collect()
+                before = tracemalloc.get_traced_memory()[0]
+                rig = session.RigSession('character_%03d' % index)
+                with rig.activate():
+                    for name, mesh in meshes.items():
+                        fake.add_mesh(name, mesh)
+                rig.selected_faces = batch.face_selections(picks)
+                for stage_name, stage in batch.PIPELINE:
+                    rig.run(stage_name, stage)
+                # the stand-in scene keeps a copy of the whole scene per undo step, like a crowd
+                # build in Maya would drop the undo queue between characters
+                fake.flushUndo()
+                gc.collect()
+                metrics = rig.metrics()
+                metrics['memory'] = tracemalloc.get_traced_memory()[0] - before
+                results.append(metrics)
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+    return results
+
+
+def format_sessions(results):
+    lines = ['%-16s %9s %7s %9s %10s' % ('session', 'seconds', 'joints', 'controls', 'memory KiB')]
+    for metrics in results:
+        lines.append('%-16s %9.4f %7d %9d %10d' % (metrics['name'], metrics['seconds'], metrics['joints'],
+                                                   metrics['controls'], metrics['memory'] // 1024))
+    return '\n'.join(lines)
+
+
+def bench_proxy(face_count, target=proxy.PROXY_TARGET):
+    '''time the landmarks and the skin weights of a head on the head and on its proxy, and measure
+    what the proxy changed
+    '''
+    meshes = make_head(face_count)
+    head = meshes['Head']
+    size = float(np.ptp(head.points, axis=0).max())
+    start = time.perf_counter()
+    frame, positions = landmarks.detect_landmarks(head, meshes['Left_eye'], meshes['Right_eye'])
+    full_picks = landmarks.nearest_faces(head, [positions[name] for name in landmarks.FACE_JOINT_NAMES])
+    names = list(positions)
+    weights = skinning.heat_weights(head, names, [positions[name] for name in names])
+    full_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    head_proxy = proxy.decimate(head, target)
+    decimate_seconds = time.perf_counter() - start
+    proxy_picks = landmarks.detect_face_picks(head, meshes['Left_eye'], meshes['Right_eye'],
+                                              search_mesh=head_proxy.mesh)
+    proxy_weights = proxy.transfer_weights(
+        head_proxy, skinning.heat_weights(head_proxy.mesh, names, [positions[name] for name in names]), head.points)
+    proxy_seconds = time.perf_counter() - start
+
+    centres = head.face_centroids(np.r_[full_picks, proxy_picks])
+    moved = np.linalg.norm(centres[:len(full_picks)] - centres[len(full_picks):], axis=1)
+    error = np.abs(weights.dense() - proxy_weights.dense(weights.joint_names)).max(axis=1)
+    return {
+        'faces': head.num_faces,
+        'points': head.num_points,
+        'proxy_points': head_proxy.mesh.num_points,
+        'full_seconds': round(full_seconds, 6),
+        'decimate_seconds': round(decimate_seconds, 6),
+        'proxy_seconds': round(proxy_seconds, 6),
+        'speedup': round(full_seconds / proxy_seconds, 3),
+        # distances are shares of the size of the head
+        'pick_moved': round(float(moved.max()) / size, 6),
+        'weight_error_max': round(float(error.max()), 6),
+        'weight_error_mean': round(float(error.mean()), 6),
+        'surface_distance_max': round(proxy.last_transfer['max_distance'] / size, 6),
+        'surface_distance_mean': round(proxy.last_transfer['mean_distance'] / size, 6),
+    }
+
+
+def format_proxy(results):
+    lines = ['%9s %8s %9s %9s %8s %10s %10s %10s %10s' % (
+        'faces', 'proxy', 'full s', 'proxy s', 'speedup', 'pick moved', 'weight max', 'weight avg', 'surface')]
+    for result in results:
+        lines.append('%9d %8d %9.3f %9.3f %7.1fx %10.4f %10.3f %10.4f %10.5f' % (
+            result['faces'], result['proxy_points'], result['full_seconds'], result['proxy_seconds'],
+            result['speedup'], result['pick_moved'], result['weight_error_max'], result['weight_error_mean'],
+            result['surface_distance_max']))
+    return '\n'.join(lines)
+
+
+def bench_import(module='face_rig.stages', repeat=5):
+    '''time a cold import of module in repeat fresh interpreters. Returns {'module', 'seconds', 'loaded'}
+    with the fastest time and the HEAVY_MODULES the import loaded
+    '''
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    times = []
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', _IMPORT_SCRIPT % (module, HEAVY_MODULES)],
+                                         cwd=root, universal_newlines=True).split('\n')
+        times.append(float(output[0]))
+        loaded = output[1].split()
+    return {'module': module, 'seconds': min(times), 'loaded': loaded}
+
+
+def format_import(result):
+    return 'import %s: %.1f ms, %s' % (result['module'], result['seconds'] * 1000,
+                                       'loaded ' + ', '.join(result['loaded']) if result['loaded']
+                                       else 'no heavy modules loaded')
+
+
+def run_benchmarks(face_counts=FACE_COUNTS, repeat=1, label=None):
+    '''benchmark every head size, returns the results document
+    '''
+    return {
+        'version': RESULTS_VERSION,
+        'label': label,
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'repeat': repeat,
+        'heads': [bench_head(face_count, repeat) for face_count in face_counts],
+    }
+
+
+def compare(old, new, tolerance=1.2, min_seconds=0.01):
+    '''lines comparing two results documents head by head and stage by stage, and whether any stage
+    regressed: slower than tolerance times the old time and by more than min_seconds, or sending
+    more commands
+    '''
+    old_heads = dict((head['faces'], head) for head in old['heads'])
+    lines = ['%9s %-18s %10s %10s %7s %8s %8s' % ('faces', 'stage', 'old s', 'new s', 'ratio', 'old cmd', 'new cmd')]
+    regressed = False
+    for head in new['heads']:
+        old_head = old_heads.get(head['faces'])
+        if old_head is None:
+            continue
+        for stage_name, stage in head['stages'].items():
+            old_stage = old_head['stages'].get(stage_name)
+            if old_stage is None:
+                continue
+            ratio = stage['seconds'] / old_stage['seconds'] if old_stage['seconds'] else float('inf')
+            flag = ''
+            slower = ratio > tolerance and stage['seconds'] - old_stage['seconds'] > min_seconds
+            if slower or stage['calls'] > old_stage['calls']:
+                flag = '  <- regression'
+                regressed = True
+            lines.append('%9d %-18s %10.4f %10.4f %7.2f %8d %8d%s' % (
+                head['faces'], stage_name, old_stage['seconds'], stage['seconds'], ratio,
+                old_stage['calls'], stage['calls'], flag))
+    return lines, regressed
+
+
+def format_results(results):
+    stage_names = [name for name, stage in batch.PIPELINE]
+    lines = ['%9s %9s  %s' % ('faces', 'setup', '  '.join('%17s' % name[:17] for name in stage_names))]
+    for head in results['heads']:
+        cells = ['%10.4fs %5d' % (head['stages'][name]['seconds'], head['stages'][name]['calls'])
+                 for name in stage_names]
+        lines.append('%9d %8.3fs  %s' % (head['faces'], head['setup_seconds'], '  '.join(cells)))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time every rig stage on synthetic heads in the stand-in scene.')
+    parser.add_argument('--faces', type=int, nargs='+', default=FACE_COUNTS, help='head sizes in faces')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per head, the fastest is kept')
+    parser.add_argument('--label', help='name stored with the results, such as a version')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='results JSON of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=1.2, help='slowdown ratio counted as a regression')
+    parser.add_argument('--min-seconds', type=float, default=0.01,
+                        help='smallest slowdown in seconds counted as a regression, below it is noise')
+    parser.add_argument('--obj-dir', help='also write the synthetic heads as OBJ files to this directory')
+    parser.add_argument('--sessions', type=int,
+                        help='rig this many characters of the first head size in one scene instead')
+    parser.add_argument('--proxy', action='store_true',
+                        help='time the landmarks and skin weights on every head and on its proxy instead')
+    parser.add_argument('--import-time', action='store_true',
+                        help='time a cold import of the core in fresh interpreters instead')
+    args = parser.parse_args(argv)
+
+    if args.import_time:
+        result = bench_import(repeat=max(args.repeat, 5))
+        print(format_import(result))
+        if args.output:
+            with open(args.output, 'w') as output_file:
+                json.dump({'version': RESULTS_VERSION, 'label': args.label, 'import': result}, output_file, indent=2)
+        return 1 if result['seconds'] > IMPORT_BUDGET or result['loaded'] else 0
+
+    if args.proxy:
+        results = [bench_proxy(face_count) for face_count in args.faces]
+        print(format_proxy(results))
+        if args.output:
+            with open(args.output, 'w') as output_file:
+                json.dump({'version': RESULTS_VERSION, 'label': args.label, 'proxy': results}, output_file, indent=2)
+        return 0
+
+    if args.sessions:
+        results = bench_sessions(args.faces[0], args.sessions)
+        print(format_sessions(results))
+        if args.output:
+            with open(args.output, 'w') as output_file:
+                json.dump({'version': RESULTS_VERSION, 'label': args.label, 'sessions': results}, output_file, indent=2)
+        return 0
+
+    if args.obj_dir:
+        if not os.path.isdir(args.obj_dir):
+            os.makedirs(args.obj_dir)
+        for face_count in args.faces:
+            save_obj(make_head(face_count), os.path.join(args.obj_dir, 'head_%d.obj' % face_count))
+
+    results = run_benchmarks(args.faces, args.repeat, args.label)
+    print(format_results(results))
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+    if args.compare:
+        with open(args.compare) as compare_file:
+            lines, regressed = compare(json.load(compare_file), results, args.tolerance, args.min_seconds)
+        print('\n'.join(lines))
+        return 1 if regressed else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,344 @@
+'''Incremental rebuilds of the rig when a face pick changes.
+
+Where every joint and control of a build ends up follows from the face picks
+and the meshes alone:
+
+    picks -> pick joints -> jaw and mouth joints -> mirrored joints -> controls
+
+Graph keeps such values as nodes, each computed from the nodes it names as
+its inputs. Setting a new value recomputes only the nodes downstream of it,
+and stops wherever a node comes out the same as before. RigGraph is that
+graph for a rig template. After a build, a corrected pick moves only the
+joints and controls that depend on it, in place, so nothing is deleted and
+nothing has to be built again:
+
+    graph = build_graph.RigGraph(plan, picks, mesh, width)
+    changed = graph.set_pick('cheek_joint_L', ('Head', 812))
+    build_graph.apply(graph, changed, plan.control_suffix)
+
+The placement rules of the derived joints and of the controls live here too,
+the stages build with the same functions, so a pick that is changed in place
+and a full rebuild come out the same.
+'''
+import collections
+
+import numpy as np
+
+from face_rig import connections, geometry, shapes, template
+from face_rig.edge_loops import place_loops
+from face_rig.mesh import bounding_box_center, distance
+from face_rig.mirror import follow_surface
+from face_rig.scene import cmds, get_scene
+from face_rig.spatial import REFLECTION
+
+
+class Placement(object):
+    '''where a control goes: a shape of face_rig.shapes placed at a position with a scale, an xyz
+    rotation and an offset, pivoting at pivot
+    '''
+    def __init__(self, shape, position, scale=1.0, rotation=(0, 0, 0), offset=(0, 0, 0), pivot=None):
+        self.shape = shape
+        self.position = tuple(float(value) for value in position)
+        self.scale = float(scale)
+        self.rotation = tuple(float(value) for value in rotation)
+        self.offset = tuple(float(value) for value in offset)
+        self.pivot = self.position if pivot is None else tuple(float(value) for value in pivot)
+
+    def __eq__(self, other):
+        return isinstance(other, Placement) and self._key() == other._key()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'Placement(%r, %r)' % (self.shape, self.position)
+
+    def _key(self):
+        return (self.shape, self.position, self.scale, self.rotation, self.offset, self.pivot)
+
+    def curves(self):
+        '''(suffix, world cvs) of every curve of the control
+        '''
+        placed = shapes.place(self.shape, [self.position], self.scale, [self.rotation], self.offset)
+        return [(curve[0], points[0]) for curve, points in zip(shapes.unit_shape(self.shape), placed)]
+
+
+# ---------------------------------------------------------------- placement rules
+
+def jaw_position(head, cheek):
+    '''the jaw sits on the middle line, half way between the head and the cheek joints in Y and Z
+    '''
+    return (0, (head[1] + cheek[1]) / 2, (head[2] + cheek[2]) / 2)
+
+
+def mouth_inside_position(cheek, mouth_top, jaw):
+    '''the mouth inside joints sit at the height of the top lip, half way between the cheek and the jaw in Z
+    '''
+    return (0, mouth_top[1], (cheek[2] + jaw[2]) / 2)
+
+
+def control_diameter(ear_left, ear_right):
+    '''the face is 12 controls wide, measured between the ear joints
+    '''
+    return float(distance(ear_left, ear_right)) / 12
+
+
+def face_control(position, rotation, diameter):
+    '''a circle on its joint, moved slightly away from the mesh
+    '''
+    return Placement('circle', position, diameter / 4, rotation, (0, 0, diameter / 4))
+
+
+def mouth_control(mouth_tip, mouth_inside, diameter):
+    '''the arrow circle beside the mouth, pivoting inside the mouth
+    '''
+    return Placement('arrow_circle', (mouth_tip[0] + 2 * diameter, mouth_tip[1], mouth_tip[2]), diameter,
+                     pivot=mouth_inside)
+
+
+def eyebrow_controls(eyebrow_left, eyebrow_right, diameter):
+    '''the arrow circles beside the outer eyebrow joints, left then right
+    '''
+    return [Placement('arrow_circle', (eyebrow_left[0] + diameter, eyebrow_left[1], eyebrow_left[2]), diameter / 1.5),
+            Placement('arrow_circle', (eyebrow_right[0] - diameter, eyebrow_right[1], eyebrow_right[2]), diameter / 1.5)]
+
+
+def mouth_inside_joint(plan):
+    '''the joint the mouth control pivots at, the first mouth inside joint or the jaw
+    '''
+    return plan.mouth_inside_joints[0] if plan.mouth_inside_joints else plan.jaw_joint
+
+
+def head_control(head, width):
+    '''a flat circle above the head, pivoting at the head joint
+    '''
+    return Placement('circle', (head[0], head[1] + width * 4.5, head[2]), width * 3, (-90, 0, 0), pivot=head)
+
+
+def jaw_control(chin, jaw, width):
+    '''the jaw shape in front of the chin, pivoting at the jaw joint
+    '''
+    return Placement('jaw', (chin[0], chin[1], chin[2] + width / 3), width / 2, pivot=jaw)
+
+
+# ---------------------------------------------------------------- the graph
+
+def _same(old, new):
+    if isinstance(old, np.ndarray) or isinstance(new, np.ndarray):
+        return np.array_equal(old, new)
+    return old == new
+
+
+class Graph(object):
+    '''values computed from other values. A node is added after its inputs, so the nodes are kept in an
+    order where every node comes after everything it is computed from
+    '''
+    def __init__(self):
+        self.values = {}
+        self._inputs = collections.OrderedDict()
+        self._compute = {}
+        self._order = {}
+        self._dependents = collections.defaultdict(list)
+
+    def __contains__(self, name):
+        return name in self._inputs
+
+    def __len__(self):
+        return len(self._inputs)
+
+    def source(self, name, value):
+        '''add a node that is set from outside
+        '''
+        self.add(name, [], None)
+        self.values[name] = value
+
+    def add(self, name, inputs, compute):
+        '''add a node computed by compute(*input_values)
+        '''
+        if name in self._inputs:
+            raise ValueError('the graph already has a node %s' % name)
+        missing = [node for node in inputs if node not in self._inputs]
+        if missing:
+            raise ValueError('%s is computed from %s, which are not in the graph' % (name, ', '.join(missing)))
+        self._order[name] = len(self._inputs)
+        self._inputs[name] = list(inputs)
+        self._compute[name] = compute
+        for node in inputs:
+            self._dependents[node].append(name)
+
+    def inputs(self, name):
+        return list(self._inputs[name])
+
+    def evaluate(self):
+        '''compute every node from scratch
+        '''
+        for name, inputs in self._inputs.items():
+            if self._compute[name] is not None:
+                self.values[name] = self._compute[name](*[self.values[node] for node in inputs])
+
+    def downstream(self, names):
+        '''the nodes computed from the given ones, directly or not, in graph order
+        '''
+        found = set()
+        pending = list(names)
+        while pending:
+            for dependent in self._dependents[pending.pop()]:
+                if dependent not in found:
+                    found.add(dependent)
+                    pending.append(dependent)
+        return sorted(found, key=self._order.get)
+
+    def set(self, values):
+        '''set source nodes from a {name: value} dict and recompute what depends on them. A node is
+        recomputed only when one of its inputs changed. Returns the changed nodes in graph order
+        '''
+        changed = set()
+        for name, value in values.items():
+            if self._compute.get(name, 0) is not None:
+                raise ValueError('%s is not a source node' % name)
+            if not _same(self.values[name], value):
+                self.values[name] = value
+                changed.add(name)
+        for name in self.downstream(changed):
+            inputs = self._inputs[name]
+            if not changed.intersection(inputs):
+                continue
+            value = self._compute[name](*[self.values[node] for node in inputs])
+            if not _same(self.values[name], value):
+                self.values[name] = value
+                changed.add(name)
+        return sorted(changed, key=self._order.get)
+
+
+class RigGraph(Graph):
+    '''the positions of the joints and the placements of the controls of a template, from its picks.
+    picks are the (mesh name, face) of every pick joint in pick order, mesh is the Mesh of the head the
+    right joints follow, see face_rig.mirror.follow_surface, and width the joint size of the build.
+    Joint nodes are named after their joints, control nodes after their controls, the picks are the
+    nodes 'pick:<joint>' and the placed joints of an edge loop the node 'loop:<name>'. The eye and head
+    controls do not depend on any pick and are left out
+    '''
+    def __init__(self, plan, picks, mesh, width):
+        Graph.__init__(self)
+        if len(picks) != len(plan.picks):
+            raise ValueError('the %s template has %d picks, not %d' % (plan.name, len(plan.picks), len(picks)))
+        self.plan = plan
+        self.mesh = mesh
+        self.joints = []
+        self.controls = []
+        for joint, pick in zip(plan.picks, picks):
+            self.source('pick:' + joint, tuple(pick))
+            self._joint(joint, ['pick:' + joint], _face_centre)
+        for stage in ('create_joints', 'create_head_joint'):
+            for joint, mesh_name in plan.centre_joints(stage):
+                self.source(joint, tuple(bounding_box_center(geometry.bounding_box(mesh_name))))
+                self.joints.append(joint)
+        # the joints the placement rules read, see template.ROLES
+        roles = plan.roles
+        self._joint(plan.jaw_joint, [roles['head'], roles['cheek']], jaw_position)
+        for joint in plan.mouth_inside_joints:
+            self._joint(joint, [roles['cheek'], roles['mouth_top'], plan.jaw_joint], mouth_inside_position)
+        for joint in plan.left_joints():
+            self._joint(joint.replace(plan.mirror['search'], plan.mirror['replace']), [joint], self._mirror)
+        for loop in plan.edge_loops:
+            self.add('loop:' + loop.name, loop.through, self._loop(loop))
+            for pivot in loop.pivots:
+                self._joint(pivot, [loop.pivot], tuple)
+            for index, joint in enumerate(loop.joints):
+                self._joint(joint, ['loop:' + loop.name], lambda placed, index=index: placed[index])
+
+        suffix = plan.control_suffix
+        self.add('diameter', [roles['ear'], plan.mirrored(roles['ear'])], control_diameter)
+        for joint in self.joints:
+            if joint in (roles['head'], plan.jaw_joint):
+                continue
+            rotation = tuple(plan.control_rotations.get(joint + suffix, (0, 0, 0)))
+            self._control(joint + suffix, [joint, 'diameter'],
+                          lambda position, diameter, rotation=rotation: face_control(position, rotation, diameter))
+        eyebrows = [roles['eyebrow'], plan.mirrored(roles['eyebrow'])]
+        named = plan.named_controls
+        self._control(named['mouth'], [roles['mouth_tip'], mouth_inside_joint(plan), 'diameter'], mouth_control)
+        self._control(named['eyebrow_left'], eyebrows + ['diameter'],
+                      lambda left, right, diameter: eyebrow_controls(left, right, diameter)[0])
+        self._control(named['eyebrow_right'], eyebrows + ['diameter'],
+                      lambda left, right, diameter: eyebrow_controls(left, right, diameter)[1])
+        self._control(plan.jaw_joint + suffix, [roles['chin'], plan.jaw_joint],
+                      lambda chin, jaw: jaw_control(chin, jaw, width))
+        self.evaluate()
+
+    def _joint(self, name, inputs, compute):
+        self.add(name, inputs, compute)
+        self.joints.append(name)
+
+    def _control(self, name, inputs, compute):
+        self.add(name, inputs, compute)
+        self.controls.append(name)
+
+    def _mirror(self, position):
+        mirrored = np.asarray(position, dtype=np.float64) * REFLECTION
+        return tuple(follow_surface(self.mesh, [position], [mirrored])[0].tolist())
+
+    def _loop(self, loop):
+        def place(*through):
+            placed = place_loops(self.mesh, [through], [loop.count], [loop.closed])[0]
+            return tuple(tuple(point) for point in placed.tolist())
+        return place
+
+    def set_pick(self, joint, pick):
+        '''give a pick joint a new (mesh name, face), returns the nodes that changed
+        '''
+        return self.set({'pick:' + joint: tuple(pick)})
+
+
+def _face_centre(pick):
+    mesh_name, face = pick
+    return tuple(geometry.get_mesh(mesh_name).face_centroids([face])[0].tolist())
+
+
+def _depth(node):
+    depth = 0
+    parent = cmds.listRelatives(node, parent=True)
+    while parent:
+        depth += 1
+        parent = cmds.listRelatives(parent[0], parent=True)
+    return depth
+
+
+def apply(graph, changed, suffix='_anim'):
+    '''move the joints and controls of the changed nodes of a RigGraph that exist in the scene. A joint
+    driven by its control follows the control, the others are moved keeping their children in place.
+    Returns the names of the moved nodes
+    '''
+    changed = set(changed)
+    moved = []
+    # controls keep their transforms frozen, a moved control gets new CVs and a new pivot
+    placements = [(name, graph.values[name]) for name in graph.controls if name in changed and cmds.objExists(name)]
+    if placements:
+        names, points, pivots = [], [], []
+        for name, placement in placements:
+            for curve_suffix, cvs in placement.curves():
+                names.append(name + curve_suffix)
+                points.append(cvs)
+            pivots.extend([placement.pivot] + [None] * (len(placement.curves()) - 1))
+        get_scene().set_curve_points(names, points, pivots)
+        if template.active_plan().connections == connections.MATRIX:
+            # a joint driven by its control's world matrix keeps the pivot as its translate
+            connections.follow_pivots([name for name, placement in placements], suffix)
+        moved.extend(name for name, placement in placements)
+
+    joints = [joint for joint in graph.joints if joint in changed
+              and cmds.objExists(joint) and not cmds.objExists(joint + suffix)]
+    if joints:
+        # parents first, the children that do not move are put back where they were
+        joints.sort(key=_depth)
+        moving = set(joints)
+        held = [child for joint in joints for child in cmds.listRelatives(joint, children=True, type='joint') or []
+                if child not in moving]
+        held_positions = [geometry.position(child) for child in held]
+        for joint in joints:
+            cmds.xform(joint, worldSpace=True, translation=graph.values[joint])
+        for child, position in zip(held, held_positions):
+            cmds.xform(child, worldSpace=True, translation=position)
+        moved.extend(joints)
+    geometry.cache.invalidate_joints()
+    return moved
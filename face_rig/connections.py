@@ -0,0 +1,203 @@
+'''How the controls drive the joints, and what the rig costs to evaluate.
+
+The rig template picks one of two ways with "connections" in its controls
+entry (see face_rig.template):
+
+- "constraints", the way the rig has always been built: a parentConstraint
+  from every control to its joint, an aimConstraint from each eye control
+  to its eye joint and a scaleConstraint from the head control to the rig
+  group, one node for Maya to evaluate in between every driver and what it
+  drives.
+- "matrix": the control's world matrix is connected straight into its
+  joint's offsetParentMatrix (Maya 2020 and later). The joint stops
+  inheriting its parent's transform and keeps the control's pivot as its
+  translate, which puts it where the constraint would without any node in
+  between. Each eye is driven by one aimMatrix node and the rig group's
+  scale is connected from the head control.
+
+Both build the same rest pose. rig_stats() reports what the built rig costs:
+the nodes Maya evaluates to move the joints, by type, the connections
+between them and the depth of the graph, the longest chain of nodes from a
+top group down to a joint:
+
+    stats = connections.rig_stats()
+    print(connections.format_stats(stats))
+'''
+import collections
+
+import numpy as np
+
+from face_rig.scene import cmds
+
+CONSTRAINTS = 'constraints'
+MATRIX = 'matrix'
+CONSTRAINT_TYPES = ['aimConstraint', 'orientConstraint', 'parentConstraint', 'pointConstraint', 'scaleConstraint']
+MATRIX_TYPES = ['aimMatrix', 'blendMatrix', 'composeMatrix', 'decomposeMatrix', 'multMatrix', 'pickMatrix']
+# the world up the eyes keep, like the aim constraints' vector world up
+WORLD_UP = (0.0, 1.0, 0.0)
+
+
+def _matrices(nodes):
+    '''(nodes, 4, 4) world matrices of the nodes, in one query
+    '''
+    return np.reshape(cmds.xform(nodes, query=True, worldSpace=True, matrix=True), (-1, 4, 4))
+
+
+def _local_pivots(controls):
+    '''the pivot of every control in its own space, where a joint driven by its world matrix goes
+    '''
+    pivots = np.reshape(cmds.xform(controls, query=True, worldSpace=True, rotatePivot=True), (-1, 3))
+    inverses = np.linalg.inv(_matrices(controls))
+    return np.einsum('ni,nij->nj', np.c_[pivots, np.ones(len(pivots))], inverses)[:, :3]
+
+
+def _drive(source_plug, joint, translate=(0, 0, 0)):
+    '''drive a joint by a world matrix plug alone, the joint's own transform is only the translate
+    '''
+    cmds.setAttr(joint + '.inheritsTransform', 0)
+    cmds.setAttr(joint + '.translate', *[float(value) for value in translate])
+    cmds.setAttr(joint + '.rotate', 0, 0, 0)
+    cmds.setAttr(joint + '.jointOrient', 0, 0, 0)
+    cmds.connectAttr(source_plug, joint + '.offsetParentMatrix', force=True)
+
+
+def drive_joints(controls, joints, mode=CONSTRAINTS):
+    '''make every joint follow its control, a parentConstraint each or a world matrix connection each
+    '''
+    controls, joints = list(controls), list(joints)
+    if mode == CONSTRAINTS:
+        for control, joint in zip(controls, joints):
+            cmds.parentConstraint(control, joint)
+        return
+    if not controls:
+        return
+    for control, joint, pivot in zip(controls, joints, _local_pivots(controls)):
+        _drive(control + '.worldMatrix[0]', joint, pivot)
+
+
+def is_matrix_driven(joint):
+    return bool(cmds.listConnections(joint + '.offsetParentMatrix', source=True, destination=False))
+
+
+def follow_pivots(controls, suffix='_anim'):
+    '''after controls got new pivots, move the joints they drive by matrix to the pivots, the way a
+    parentConstraint follows them. Returns the moved joints
+    '''
+    pairs = [(control, control[:-len(suffix)]) for control in controls
+             if control.endswith(suffix) and cmds.objExists(control[:-len(suffix)])]
+    pairs = [(control, joint) for control, joint in pairs if is_matrix_driven(joint)]
+    if not pairs:
+        return []
+    for (control, joint), pivot in zip(pairs, _local_pivots([control for control, joint in pairs])):
+        cmds.setAttr(joint + '.translate', *[float(value) for value in pivot])
+    return [joint for control, joint in pairs]
+
+
+def _origin_to_pivot(control):
+    '''move a control's transform to its pivot leaving its curve where it is, an aimMatrix aims at the
+    position of its target's world matrix and not at the pivot like an aimConstraint
+    '''
+    pivot = np.asarray(cmds.xform(control, query=True, worldSpace=True, rotatePivot=True))
+    delta = (pivot - _matrices([control])[0, 3, :3]).tolist()
+    cmds.move(delta[0], delta[1], delta[2], control, relative=True, worldSpace=True)
+    cmds.move(-delta[0], -delta[1], -delta[2], control + '.cv[*]', control + '.rotatePivot',
+              relative=True, worldSpace=True)
+
+
+def aim_eye(control, eye_joint, mode=CONSTRAINTS):
+    '''aim an eye joint at its control keeping its rest orientation, with an aimConstraint or an
+    aimMatrix node fed by the eye's parent. Returns the node made
+    '''
+    if mode == CONSTRAINTS:
+        return cmds.aimConstraint(control, eye_joint, aimVector=[1, 0, 0], upVector=[0, 1, 0],
+                                  worldUpType='vector', maintainOffset=True)[0]
+    _origin_to_pivot(control)
+    parents = cmds.listRelatives(eye_joint, parent=True)
+    eye, target = _matrices([eye_joint, control])
+    parent_world = _matrices(parents)[0] if parents else np.identity(4)
+    # the aim and up axes in the eye's rest space, so the rest pose does not turn the eye
+    inverse = np.linalg.inv(eye[:3, :3])
+    aim_axis = (target[3, :3] - eye[3, :3]).dot(inverse)
+    up_axis = np.asarray(WORLD_UP).dot(inverse)
+    node = cmds.createNode('aimMatrix', name=eye_joint + '_aimMatrix')
+    if parents:
+        cmds.connectAttr(parents[0] + '.worldMatrix[0]', node + '.inputMatrix')
+    cmds.setAttr(node + '.preSpaceMatrix', *eye.dot(np.linalg.inv(parent_world)).ravel().tolist(), type='matrix')
+    cmds.connectAttr(control + '.worldMatrix[0]', node + '.primaryTargetMatrix')
+    cmds.setAttr(node + '.primaryInputAxis', *aim_axis.tolist())
+    cmds.setAttr(node + '.primaryMode', 1)
+    cmds.setAttr(node + '.secondaryInputAxis', *up_axis.tolist())
+    cmds.setAttr(node + '.secondaryMode', 2)
+    cmds.setAttr(node + '.secondaryTargetVector', *WORLD_UP)
+    _drive(node + '.outputMatrix', eye_joint)
+    return node
+
+
+def follow_scale(driver, driven, mode=CONSTRAINTS):
+    '''scale driven with driver, the two are under the same parent
+    '''
+    if mode == CONSTRAINTS:
+        cmds.scaleConstraint(driver, driven, weight=1)
+    else:
+        cmds.connectAttr(driver + '.scale', driven + '.scale', force=True)
+
+
+def rig_stats(joints=None, controls=None):
+    '''the cost of evaluating the rig: {'nodes', 'types', 'connections', 'depth'}. The nodes are the
+    joints, the controls, the constraint and matrix nodes and the groups above them, connections the
+    inputs they take from each other and depth the longest chain of them ending at a joint. A node
+    that does not inherit its parent's transform does not depend on it
+    '''
+    joints = cmds.ls('*', type='joint') if joints is None else list(joints)
+    controls = [] if controls is None else [control for control in controls if cmds.objExists(control)]
+    evaluated = cmds.ls('*', type=CONSTRAINT_TYPES + MATRIX_TYPES)
+    parent_of = {}
+    nodes = []
+    pending = list(joints) + controls + evaluated
+    while pending:
+        node = pending.pop()
+        if node in parent_of:
+            continue
+        parents = cmds.listRelatives(node, parent=True)
+        parent_of[node] = parents[0] if parents else None
+        nodes.append(node)
+        if parents:
+            pending.append(parents[0])
+    types = set(CONSTRAINT_TYPES + MATRIX_TYPES)
+    kinds = dict((node, cmds.nodeType(node)) for node in nodes)
+    inputs = {}
+    for node in nodes:
+        sources = [source for source in cmds.listConnections(node, source=True, destination=False) or []
+                   if source in parent_of]
+        if kinds[node] in types:
+            # a constraint sits under the node it drives and reads its parent space from it
+            sources = [source for source in sources if source != parent_of[node]]
+        elif parent_of[node] is not None and cmds.getAttr(node + '.inheritsTransform'):
+            sources.append(parent_of[node])
+        else:
+            sources = [source for source in sources if source != parent_of[node]]
+        inputs[node] = list(collections.OrderedDict.fromkeys(sources))
+
+    depth = {}
+
+    def chain(node, visiting):
+        if node not in depth:
+            visiting.add(node)
+            depth[node] = 1 + max([chain(source, visiting) for source in inputs[node] if source not in visiting]
+                                  or [0])
+            visiting.discard(node)
+        return depth[node]
+
+    counts = collections.Counter(kinds[node] for node in nodes)
+    return {'nodes': len(nodes),
+            'types': dict(counts),
+            'connections': sum(len(sources) for sources in inputs.values()),
+            'depth': max([chain(joint, set()) for joint in joints] or [0])}
+
+
+def format_stats(stats):
+    '''one line of rig stats for the console
+    '''
+    types = ', '.join('%d %s' % (count, kind) for kind, count in sorted(stats['types'].items()))
+    return '%d nodes (%s), %d connections, depth %d' % (stats['nodes'], types, stats['connections'],
+                                                        stats['depth'])
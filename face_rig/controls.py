@@ -0,0 +1,101 @@
+'''The controls a build creates, and the cleanup pass over them.
+
+Every control a stage makes is registered here. The cleanup deletes the
+history of the build's own controls and freezes their transforms with one
+command each, instead of listing the whole scene and selecting every
+control in turn, so it only grows with the size of the rig and never picks
+up the nodes of other assets. Every pass is timed in timings.
+
+create() makes controls of one shape from face_rig.shapes with their final
+CVs, all of them placed in one NumPy transform and created with one call to
+the scene backend per curve of the shape. create_placed() does the same for
+the Placements of face_rig.build_graph.
+'''
+import collections
+import time
+
+from face_rig import shapes
+from face_rig.scene import cmds, get_scene
+
+# names of the controls of the current build, in creation order
+registry = []
+# (label, control count, seconds) of every freeze pass of the current build
+timings = []
+
+
+def clear():
+    '''start a new build, forget the registered controls and the timings
+    '''
+    del registry[:]
+    del timings[:]
+
+
+def register(*names):
+    for name in names:
+        if name not in registry:
+            registry.append(name)
+
+
+def create(names, shape, positions, scales=1.0, rotations=None, offsets=None, pivots=None):
+    '''create and register controls of a shape at the given positions, see shapes.place. The pivots
+    default to the positions, the extra curves of a shape go under their control. Returns the names
+    '''
+    names = list(names)
+    if not names:
+        return []
+    placed = shapes.place(shape, positions, scales, rotations, offsets)
+    pivots = positions if pivots is None else pivots
+    scene = get_scene()
+    created = []
+    for (suffix, cvs, degree, periodic), points in zip(shapes.unit_shape(shape), placed):
+        if not suffix:
+            created = scene.create_curves(names, points, degree, periodic, pivots=pivots)
+        else:
+            scene.create_curves([name + suffix for name in created], points, degree, periodic, parents=created)
+    register(*created)
+    return created
+
+
+def create_placed(names, placements):
+    '''create and register controls from face_rig.build_graph Placements, one create() per shape.
+    Returns the names
+    '''
+    groups = collections.OrderedDict()
+    for name, placement in zip(names, placements):
+        groups.setdefault(placement.shape, []).append((name, placement))
+    created = []
+    for shape, group in groups.items():
+        placed = [placement for name, placement in group]
+        created.extend(create([name for name, placement in group], shape, [p.position for p in placed],
+                              [p.scale for p in placed], [p.rotation for p in placed], [p.offset for p in placed],
+                              [p.pivot for p in placed]))
+    return created
+
+
+def forget(*names):
+    '''take deleted controls out of the registry
+    '''
+    for name in names:
+        if name in registry:
+            registry.remove(name)
+
+
+def freeze(controls, label='freeze'):
+    '''delete the history of the given controls and freeze their transforms, one command each.
+    Returns the seconds it took
+    '''
+    controls = list(controls)
+    if not controls:
+        return 0.0
+    start = time.perf_counter()
+    cmds.delete(controls, constructionHistory=True)
+    cmds.makeIdentity(controls, apply=True, t=1, r=1, s=1, n=0)
+    seconds = time.perf_counter() - start
+    timings.append((label, len(controls), seconds))
+    return seconds
+
+
+def cleanup(suffix='_anim'):
+    '''freeze every registered control whose name ends with suffix
+    '''
+    return freeze([name for name in registry if name.endswith(suffix)], 'cleanup')
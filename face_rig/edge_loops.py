@@ -0,0 +1,267 @@
+'''Joints spread along the lips and the eyelids at any density.
+
+The default rig has three joints on every eyelid and on each side of each
+lip. A rig template can ask for more with "edge_loops" (see
+face_rig.template): a loop runs over the head through some joints, the lip
+tips and middles or the eyelid joints, and gets its own count of joints
+spread evenly along it.
+
+The loop follows the mesh edges. vertex_adjacency() keeps the edges of a
+mesh as CSR arrays, the neighbours of vertex v are
+neighbours[offsets[v]:offsets[v + 1]], made once per mesh. edge_path() finds
+the shortest run of edges between two vertices with A*, which only visits
+the vertices near the straight line between them. On a head modelled with
+edge loops around the mouth and the eyes that run is the loop itself. The
+vertices nearest the joints are found in a grid of the vertices, also made
+once per mesh, so a dense head is never scanned whole.
+
+fit_curves() smooths every run of edges into a curve that still passes
+through the joints it was made from, and sample_curves() places the joints
+of all loops at even arc lengths in one vectorized pass:
+
+    positions = edge_loops.place_loops(mesh, [lip_positions, eyelid_positions], [12, 7])
+'''
+import heapq
+import math
+import weakref
+
+import numpy as np
+
+from face_rig.mesh import face_edges
+from face_rig.scene import cmds, get_scene
+from face_rig.spatial import mesh_index, scan_nearest
+
+# smoothing passes over the run of edges of a loop
+SMOOTHING = 32
+# the most vertices of the run of edges kept between two of the joints a loop runs through
+THINNED = 8
+# how far around the positions nearest_vertices scans, as a share of the mesh size
+NEAR_REACH = 0.02
+INFINITY = float('inf')
+
+_adjacency = weakref.WeakKeyDictionary()
+_grids = weakref.WeakKeyDictionary()
+
+
+def vertex_adjacency(mesh):
+    '''(offsets, neighbours) CSR of the vertices every vertex shares an edge with, made once and kept for
+    as long as the Mesh is
+    '''
+    adjacency = _adjacency.get(mesh)
+    if adjacency is None:
+        start, end = face_edges(mesh)
+        # both directions of every face edge, sorted by the vertex they start from. An edge between two
+        # faces is listed twice, which costs the walk nothing and saves making the edges unique
+        starts, ends = np.r_[start, end], np.r_[end, start]
+        order = np.argsort(starts, kind='stable')
+        offsets = np.zeros(mesh.num_points + 1, dtype=np.int64)
+        np.cumsum(np.bincount(starts, minlength=mesh.num_points), out=offsets[1:])
+        adjacency = _adjacency[mesh] = (offsets, ends[order])
+    return adjacency
+
+
+def edge_path(mesh, start, end):
+    '''the vertices of the shortest run of edges from vertex start to vertex end, both included.
+    Raises ValueError when no edges join them
+    '''
+    start, end = int(start), int(end)
+    offsets, neighbours = vertex_adjacency(mesh)
+    points = mesh.points
+    goal_x, goal_y, goal_z = points[end].tolist()
+    position = {}
+
+    def coordinates(vertex):
+        if vertex not in position:
+            position[vertex] = points[vertex].tolist()
+        return position[vertex]
+
+    x, y, z = coordinates(start)
+    cost = {start: 0.0}
+    came_from = {start: -1}
+    heap = [(math.sqrt((x - goal_x) ** 2 + (y - goal_y) ** 2 + (z - goal_z) ** 2), 0.0, start)]
+    while heap:
+        estimate, so_far, vertex = heapq.heappop(heap)
+        if vertex == end:
+            break
+        if so_far > cost[vertex]:
+            continue
+        x, y, z = coordinates(vertex)
+        for neighbour in neighbours[offsets[vertex]:offsets[vertex + 1]].tolist():
+            next_x, next_y, next_z = coordinates(neighbour)
+            new_cost = so_far + math.sqrt((next_x - x) ** 2 + (next_y - y) ** 2 + (next_z - z) ** 2)
+            if new_cost < cost.get(neighbour, INFINITY):
+                cost[neighbour] = new_cost
+                came_from[neighbour] = vertex
+                remaining = math.sqrt((next_x - goal_x) ** 2 + (next_y - goal_y) ** 2 + (next_z - goal_z) ** 2)
+                heapq.heappush(heap, (new_cost + remaining, new_cost, neighbour))
+    if end not in came_from:
+        raise ValueError('no edges of %s join vertex %d to vertex %d' % (mesh.name, start, end))
+    path = [end]
+    while path[-1] != start:
+        path.append(came_from[path[-1]])
+    return np.array(path[::-1], dtype=np.int64)
+
+
+def nearest_vertices(mesh, positions, reach=NEAR_REACH):
+    '''the vertex nearest to each position. Only the vertices in the grid cells around the positions,
+    reach times the mesh size past them, are scanned. face_rig.spatial looks up the positions with no
+    vertex that close
+    '''
+    positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+    offsets, order, low, cell, cells = _vertex_grid(mesh)
+    margin = reach * cell * cells
+    first = np.clip(((positions.min(axis=0) - margin - low) // cell).astype(np.int64), 0, cells - 1)
+    last = np.clip(((positions.max(axis=0) + margin - low) // cell).astype(np.int64), 0, cells - 1)
+    blocks = np.ix_(*[np.arange(start, stop + 1) for start, stop in zip(first, last)])
+    ids = ((blocks[0] * cells + blocks[1]) * cells + blocks[2]).ravel()
+    starts, lengths = offsets[ids], offsets[ids + 1] - offsets[ids]
+    candidates = order[np.arange(lengths.sum()) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)]
+    result = np.full(len(positions), -1, dtype=np.int64)
+    if len(candidates):
+        distances, nearest = scan_nearest(mesh.points[candidates], positions)
+        # a vertex outside the cells is further than margin from every position
+        found = distances <= margin
+        result[found] = candidates[nearest[found]]
+    missing = result < 0
+    if missing.any():
+        result[missing] = mesh_index(mesh).nearest_vertices(positions[missing])
+    return result
+
+
+def _vertex_grid(mesh):
+    '''(offsets, order, low, cell, cells): the vertices sorted by the cell of a cells ** 3 grid over the
+    mesh they fall in, the vertices of cell c are order[offsets[c]:offsets[c + 1]]
+    '''
+    grid = _grids.get(mesh)
+    if grid is None:
+        points = mesh.points
+        cells = max(1, int(round(mesh.num_points ** (1.0 / 3) / 2)))
+        low = points.min(axis=0) if mesh.num_points else np.zeros(3)
+        cell = max(float(np.ptp(points, axis=0).max()) / cells, 1e-9) if mesh.num_points else 1.0
+        index = np.minimum(((points - low) // cell).astype(np.int64), cells - 1)
+        ids = (index[:, 0] * cells + index[:, 1]) * cells + index[:, 2]
+        offsets = np.zeros(cells ** 3 + 1, dtype=np.int64)
+        np.cumsum(np.bincount(ids, minlength=cells ** 3), out=offsets[1:])
+        grid = _grids[mesh] = (offsets, np.argsort(ids, kind='stable'), low, cell, cells)
+    return grid
+
+
+def loop_path(mesh, positions, closed=False):
+    '''the vertices of the run of edges through the vertices nearest to positions, in order, and the
+    index in it of every one of those vertices. A closed loop runs back to the first
+    '''
+    waypoints = nearest_vertices(mesh, positions).tolist()
+    stops = list(waypoints) + ([waypoints[0]] if closed else [])
+    path = [np.array([stops[0]], dtype=np.int64)]
+    for start, end in zip(stops[:-1], stops[1:]):
+        path.append(edge_path(mesh, start, end)[1:])
+    marks = np.cumsum([len(part) for part in path]) - 1
+    path = np.concatenate(path)
+    if closed:
+        path, marks = path[:-1], marks[:-1]
+    return path, marks
+
+
+def thin_path(path, marks, closed=False, between=THINNED):
+    '''keep at most between + 1 evenly picked vertices of a path from every mark to the next, so a loop
+    over a dense head smooths as fast as over a light one. Returns the path and its marks
+    '''
+    ends = list(marks) + ([len(path)] if closed else [])
+    keep = [np.asarray(marks, dtype=np.int64)]
+    for start, end in zip(ends[:-1], ends[1:]):
+        keep.append(np.linspace(start, end, min(end - start, between) + 1).round().astype(np.int64))
+    keep = np.unique(np.concatenate(keep) % len(path))
+    return path[keep], np.searchsorted(keep, marks)
+
+
+def fit_curves(polylines, pinned, closed, iterations=SMOOTHING):
+    '''smooth (n, 3) polylines into curves. Every pass moves each point half way to the middle of its
+    neighbours, the pinned points and the ends of an open polyline stay. All polylines are smoothed
+    together
+    '''
+    lengths = [len(polyline) for polyline in polylines]
+    starts = np.r_[0, np.cumsum(lengths)[:-1]].astype(np.int64)
+    points = np.concatenate([np.asarray(polyline, dtype=np.float64) for polyline in polylines])
+    index = np.arange(len(points))
+    loop_start = np.repeat(starts, lengths)
+    loop_length = np.repeat(lengths, lengths)
+    local = index - loop_start
+    # the neighbours of every point within its own polyline, wrapping around the closed ones
+    previous = loop_start + (local - 1) % loop_length
+    following = loop_start + (local + 1) % loop_length
+    fixed = np.zeros(len(points), dtype=bool)
+    for start, length, marks, is_closed in zip(starts, lengths, pinned, closed):
+        fixed[start + np.asarray(marks, dtype=np.int64)] = True
+        if not is_closed:
+            fixed[[start, start + length - 1]] = True
+    moving = ~fixed
+    for _ in range(iterations):
+        middle = 0.5 * (points[previous] + points[following])
+        points[moving] = 0.5 * (points[moving] + middle[moving])
+    return [points[start:start + length] for start, length in zip(starts, lengths)]
+
+
+def sample_curves(curves, counts, closed):
+    '''count points at even arc lengths along every curve, the ends of an open curve included and a
+    closed curve wrapping around, worked out for all curves at once. Returns a (count, 3) array per curve
+    '''
+    counts = np.asarray(counts, dtype=np.int64)
+    closed = np.asarray(closed, dtype=bool)
+    # a closed curve runs back to its first point
+    curves = [np.r_[curve, curve[:1]] if is_closed else np.asarray(curve, dtype=np.float64)
+              for curve, is_closed in zip(curves, closed)]
+    lengths = np.array([len(curve) for curve in curves], dtype=np.int64)
+    points = np.concatenate(curves)
+    starts = np.r_[0, np.cumsum(lengths)[:-1]]
+    segments = np.linalg.norm(np.diff(points, axis=0), axis=1)
+    # the arc length at every point, each curve starting after the end of the one before
+    arc = np.r_[0.0, np.cumsum(segments)]
+    arc_start, arc_end = arc[starts], arc[starts + lengths - 1]
+    # the samples of every curve as fractions of its length
+    curve = np.repeat(np.arange(len(curves)), counts)
+    step = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    fraction = step / np.maximum(np.where(closed, counts, counts - 1), 1)[curve]
+    target = arc_start[curve] + fraction * (arc_end - arc_start)[curve]
+    # the segment of its own curve every sample falls on
+    segment = np.searchsorted(arc, target, side='right') - 1
+    segment = np.clip(segment, starts[curve], starts[curve] + lengths[curve] - 2)
+    span = arc[segment + 1] - arc[segment]
+    blend = np.where(span > 0, (target - arc[segment]) / np.where(span > 0, span, 1.0), 0.0)
+    placed = points[segment] + blend[:, None] * (points[segment + 1] - points[segment])
+    return np.split(placed, np.cumsum(counts)[:-1])
+
+
+def place_loops(mesh, through, counts, closed=None, iterations=SMOOTHING):
+    '''positions of count joints spread evenly along each loop running over the mesh through the
+    positions of through. Returns a (count, 3) array per loop
+    '''
+    closed = [False] * len(through) if closed is None else list(closed)
+    paths = [thin_path(*loop_path(mesh, positions, is_closed), closed=is_closed)
+             for positions, is_closed in zip(through, closed)]
+    polylines = [mesh.points[path] for path, marks in paths]
+    # the curve passes through the joints the loop was made from, not just the vertices nearest them
+    for polyline, (path, marks), positions in zip(polylines, paths, through):
+        polyline[marks] = np.asarray(positions, dtype=np.float64)
+    curves = fit_curves(polylines, [marks for path, marks in paths], closed, iterations)
+    return sample_curves(curves, counts, closed)
+
+
+def create_loop_joints(loops, mesh, radius=1.0):
+    '''create the joints and the pivot joints of the EdgeLoops of a template (see face_rig.template) on
+    a Mesh, all loops placed together and made with one call to the scene backend. The joints are
+    left unparented. Returns the names of the new joints
+    '''
+    if not loops:
+        return []
+    named = [joint for loop in loops for joint in loop.through + ([loop.pivot] if loop.pivot else [])]
+    positions = dict(zip(named, np.reshape(cmds.xform(named, query=True, worldSpace=True, matrix=True),
+                                           (-1, 4, 4))[:, 3, :3]))
+    placed = place_loops(mesh, [[positions[joint] for joint in loop.through] for loop in loops],
+                         [loop.count for loop in loops], [loop.closed for loop in loops])
+    names, points = [], []
+    for loop, loop_points in zip(loops, placed):
+        names.extend(loop.pivots + loop.joints)
+        points.extend([positions[loop.pivot]] * len(loop.pivots) + list(loop_points))
+    matrices = np.tile(np.identity(4), (len(names), 1, 1))
+    matrices[:, 3, :3] = points
+    return get_scene().create_joints(names, matrices, [None] * len(names), radius)
@@ -0,0 +1,267 @@
+'''Expression shapes made by posing the joint rig.
+
+An expression preset (blink, smile, brow raise, jaw open, ...) is a pose of
+some of the rig's controls, translations in control diameters (a twelfth of
+the ear to ear distance, see face_rig.build_graph) and rotations in degrees
+about the control's pivot, so one preset table fits every head. The presets
+are read from face_rig/templates/expressions.json.
+
+generate() poses the controls of every preset, moves the skinned joints with
+them and deforms the head with its skin weights, all presets in one batch
+(see face_rig.skinning.deform). Only the vertices a preset moves are kept,
+as float32 deltas in a ShapeLibrary, a CSR of shape -> (vertex, delta). The
+right side shapes are not posed: the deltas of every '_L' preset are carried
+to the mirror vertices with the symmetry map of face_rig.spatial and
+reflected:
+
+    rig = expressions.PoseRig.from_scene(weights.joint_names, '_anim', unit)
+    library = expressions.generate(mesh.points, weights, rig, presets, symmetry)
+    points = library.evaluate(mesh.points, {'smile_L': 1.0, 'blink_R': 0.5})
+'''
+import collections
+import json
+import os
+
+import numpy as np
+
+from face_rig import skinning
+from face_rig.scene import cmds
+from face_rig.shapes import rotation_matrices
+from face_rig.spatial import REFLECTION
+
+DEFAULT_PRESETS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'expressions.json')
+SHAPES_EXTENSION = '.frshapes'
+# presets deformed together, bounds the (presets, points, 3) array of a batch
+PRESET_CHUNK = 8
+# deltas shorter than this share of the mesh size are left out
+DELTA_TOLERANCE = 1e-5
+_CHANNELS = ('translate', 'rotate')
+
+
+def load_presets(path=DEFAULT_PRESETS):
+    '''the presets of an expression table, {name: {control: {'translate': xyz, 'rotate': xyz}}} in file
+    order, and its mirror entry with the search and replace of the left and right names
+    '''
+    with open(path) as presets_file:
+        table = json.load(presets_file, object_pairs_hook=collections.OrderedDict)
+    presets = table.get('presets')
+    if not presets:
+        raise ValueError('%s has no presets' % path)
+    for name, pose in presets.items():
+        for control, channels in pose.items():
+            unknown = [channel for channel in channels if channel not in _CHANNELS]
+            if unknown:
+                raise ValueError('preset %s of %s moves %s by %s, only translate and rotate can be set'
+                                 % (name, path, control, ', '.join(unknown)))
+    mirror = dict(table.get('mirror', {}))
+    return presets, {'search': mirror.get('search', '_L'), 'replace': mirror.get('replace', '_R')}
+
+
+def mirror_pose(pose, search='_L', replace='_R'):
+    '''the pose of the other side: the controls named the other way, translations and rotations
+    reflected across the YZ plane
+    '''
+    mirrored = collections.OrderedDict()
+    for control, channels in pose.items():
+        if search in control:
+            control = control.replace(search, replace)
+        elif replace in control:
+            control = control.replace(replace, search)
+        values = {}
+        if 'translate' in channels:
+            values['translate'] = (np.asarray(channels['translate'], dtype=float) * REFLECTION).tolist()
+        if 'rotate' in channels:
+            values['rotate'] = (np.asarray(channels['rotate'], dtype=float) * -REFLECTION).tolist()
+        mirrored[control] = values
+    return mirrored
+
+
+def expand_presets(presets, search='_L', replace='_R'):
+    '''the presets with the mirrored pose of every preset named with search added after it
+    '''
+    expanded = collections.OrderedDict()
+    for name, pose in presets.items():
+        expanded[name] = pose
+        if name.endswith(search):
+            expanded[name[:-len(search)] + replace] = mirror_pose(pose, search, replace)
+    return expanded
+
+
+class PoseRig(object):
+    '''how the skinned joints follow the controls. drivers holds the control of every joint, None when
+    no control moves it, chains the control and the nodes above it of every driver and pivots the world
+    pivot of every node of the chains. The controls are frozen, so a pose is their own translate and
+    rotate, translations are in unit
+    '''
+    def __init__(self, joint_names, drivers, chains, pivots, unit=1.0):
+        self.joint_names = list(joint_names)
+        self.drivers = list(drivers)
+        self.chains = chains
+        self.pivots = dict((name, np.asarray(pivot, dtype=float)) for name, pivot in pivots.items())
+        self.unit = unit
+
+    @classmethod
+    def from_scene(cls, joint_names, suffix='_anim', unit=1.0):
+        '''read the rig the stages built: a joint is driven by its control, a joint without one by the
+        control of the nearest joint above it
+        '''
+        parent_of = {}
+
+        def parent(node):
+            if node not in parent_of:
+                parents = cmds.listRelatives(node, parent=True)
+                parent_of[node] = parents[0] if parents else None
+            return parent_of[node]
+
+        drivers = []
+        for joint in joint_names:
+            node = joint
+            while node is not None and not cmds.objExists(node + suffix):
+                node = parent(node)
+            drivers.append(None if node is None else node + suffix)
+        chains = {}
+        for control in set(driver for driver in drivers if driver):
+            chain = [control]
+            while parent(chain[-1]) is not None:
+                chain.append(parent(chain[-1]))
+            chains[control] = chain
+        nodes = sorted(set(node for chain in chains.values() for node in chain))
+        pivots = np.reshape(cmds.xform(nodes, query=True, worldSpace=True, rotatePivot=True), (-1, 3)) \
+            if nodes else np.zeros((0, 3))
+        return cls(joint_names, drivers, chains, dict(zip(nodes, pivots)), unit)
+
+    def controls(self):
+        '''every node a pose can move
+        '''
+        return set(self.pivots)
+
+    def pose_matrix(self, control, channels):
+        '''row vector matrix of a control's pose, rotated about its pivot and then translated
+        '''
+        pivot = self.pivots[control]
+        matrix = np.identity(4)
+        rotation = rotation_matrices(channels.get('rotate', (0, 0, 0)))[0]
+        matrix[:3, :3] = rotation
+        matrix[3, :3] = pivot - pivot.dot(rotation) + np.asarray(channels.get('translate', (0, 0, 0))) * self.unit
+        return matrix
+
+    def skin_matrices(self, poses):
+        '''(poses, joints, 4, 4) skinning matrices of the joints for a list of poses. A joint moves with
+        its control, which moves with the nodes above it
+        '''
+        result = np.tile(np.identity(4), (len(poses), len(self.joint_names), 1, 1))
+        for index, pose in enumerate(poses):
+            local = dict((control, self.pose_matrix(control, channels))
+                         for control, channels in pose.items() if control in self.pivots)
+            world = {}
+            for control, chain in self.chains.items():
+                matrix = np.identity(4)
+                for node in chain:
+                    if node in local:
+                        matrix = matrix.dot(local[node])
+                world[control] = matrix
+            for joint, driver in enumerate(self.drivers):
+                if driver is not None:
+                    result[index, joint] = world[driver]
+        return result
+
+
+class ShapeLibrary(object):
+    '''sparse expression shapes: the vertices shape i moves are indices[offsets[i]:offsets[i + 1]],
+    sorted, with their float32 deltas
+    '''
+    def __init__(self, names, offsets, indices, deltas, num_points):
+        self.names = list(names)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.deltas = np.asarray(deltas, dtype=np.float32).reshape(-1, 3)
+        self.num_points = int(num_points)
+        self._index = dict((name, index) for index, name in enumerate(self.names))
+
+    def __repr__(self):
+        return 'ShapeLibrary(%d shapes, %d points, %d deltas)' % (len(self.names), self.num_points, len(self.indices))
+
+    def __contains__(self, name):
+        return name in self._index
+
+    @property
+    def nbytes(self):
+        return self.offsets.nbytes + self.indices.nbytes + self.deltas.nbytes
+
+    def shape(self, name):
+        '''the vertex indices and the (n, 3) deltas of a shape
+        '''
+        index = self._index[name]
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.indices[start:end], self.deltas[start:end]
+
+    def dense(self, name):
+        '''(points, 3) deltas of a shape, zero where it does not move the mesh
+        '''
+        result = np.zeros((self.num_points, 3), dtype=np.float32)
+        indices, deltas = self.shape(name)
+        result[indices] = deltas
+        return result
+
+    def evaluate(self, points, shape_weights):
+        '''the points with the shapes of {name: weight} added
+        '''
+        result = np.array(points, dtype=np.float64).reshape(-1, 3)
+        for name, weight in shape_weights.items():
+            indices, deltas = self.shape(name)
+            result[indices] += weight * deltas
+        return result
+
+
+def _sparse(deltas, tolerance):
+    moved = np.flatnonzero(np.einsum('ij,ij->i', deltas, deltas) > tolerance * tolerance)
+    return moved.astype(np.int32), deltas[moved].astype(np.float32)
+
+
+def _mirror_shape(indices, deltas, symmetry):
+    targets = symmetry[indices]
+    kept = targets >= 0
+    order = np.argsort(targets[kept], kind='stable')
+    return targets[kept][order].astype(np.int32), (deltas[kept] * REFLECTION)[order].astype(np.float32)
+
+
+def generate(points, weights, rig, presets, symmetry=None, search='_L', replace='_R', tolerance=None):
+    '''a ShapeLibrary of the presets posed on the rig and deformed with the skin weights, all of them in
+    batches of PRESET_CHUNK. With a symmetry map every preset named with search also gets its mirror
+    shape, named with replace, made from its deltas instead of posed
+    '''
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    if tolerance is None:
+        size = np.linalg.norm(points.max(axis=0) - points.min(axis=0)) if len(points) else 0.0
+        tolerance = DELTA_TOLERANCE * size
+    names = list(presets)
+    shapes = collections.OrderedDict()
+    for start in range(0, len(names), PRESET_CHUNK):
+        batch = names[start:start + PRESET_CHUNK]
+        deformed = skinning.deform(points, weights, rig.skin_matrices([presets[name] for name in batch]))
+        for name, moved in zip(batch, deformed):
+            shapes[name] = _sparse(moved - points, tolerance)
+            if symmetry is not None and name.endswith(search):
+                shapes[name[:-len(search)] + replace] = _mirror_shape(shapes[name][0], shapes[name][1],
+                                                                      np.asarray(symmetry))
+    offsets = np.zeros(len(shapes) + 1, dtype=np.int64)
+    np.cumsum([len(indices) for indices, deltas in shapes.values()], out=offsets[1:])
+    indices = np.concatenate([indices for indices, deltas in shapes.values()]) if shapes else []
+    deltas = np.concatenate([deltas for indices, deltas in shapes.values()]) if shapes else []
+    return ShapeLibrary(list(shapes), offsets, indices, deltas, len(points))
+
+
+def save_shapes(path, library):
+    '''write a ShapeLibrary to an uncompressed NumPy .npz file
+    '''
+    with open(path, 'wb') as shapes_file:
+        np.savez(shapes_file, names=np.array(library.names), offsets=library.offsets, indices=library.indices,
+                 deltas=library.deltas, num_points=np.array(library.num_points))
+
+
+def load_shapes(path):
+    '''the ShapeLibrary saved in a shapes file
+    '''
+    with np.load(path) as data:
+        return ShapeLibrary([str(name) for name in data['names']], data['offsets'], data['indices'],
+                            data['deltas'], int(data['num_points']))
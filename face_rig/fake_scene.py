@@ -0,0 +1,1098 @@
+'''An in-memory stand-in for the Maya scene.
+
+FakeScene implements the subset of maya.cmds the rig stages use, with enough
+of Maya's behaviour (default node names, world space moves, reparenting that
+keeps the world position, freezing transforms into curve CVs) that the whole
+pipeline can run headless:
+
+    from face_rig import scene, stages
+    from face_rig.fake_scene import FakeScene
+
+    with scene.use_scene(FakeScene()) as fake:
+        fake.file('head.obj', i=True)
+        ...
+
+Transforms use Maya's row vector convention, a node's local matrix is
+scale * rotate(xyz) * translate and its world matrix is local * parent world.
+Rotate pivots are stored but do not take part in the matrix. Undo works on
+undo chunks only, undo restores the scene as it was when the chunk opened.
+
+Connections are evaluated when a matrix is read: a connected
+offsetParentMatrix comes after the local matrix, inheritsTransform off cuts
+the parent world out, connected translate, rotate and scale channels read
+their source, and aimMatrix nodes aim. Constraints are kept as nodes under
+the node they drive but are not evaluated.
+
+Namespaces work as in Maya: new nodes go into the current namespace and
+with relativeNames on, names given to commands and returned by them are
+relative to it, so face_rig.session can build several characters with the
+same node names in one scene. A '*' in a name listed with ls matches within
+one namespace only.
+'''
+import collections
+import json
+import math
+import re
+
+import numpy as np
+
+from face_rig.mesh import Mesh
+from face_rig.mesh_io import load_meshes
+from face_rig.mirror import reflect_matrices
+from face_rig.skinning import SkinWeights
+
+# Maya's default 8 section circle has its CVs this far out for a radius of 1
+_CIRCLE_CV_RADIUS = 1.108194
+
+# matrix attributes getAttr evaluates
+_MATRIX_PLUGS = ('worldMatrix', 'worldMatrix[0]', 'matrix', 'offsetParentMatrix', 'outputMatrix')
+
+_COMPONENT = re.compile(r'^(?P<node>[^.]+)\.(?P<kind>cv|vtx|f)\[(?P<index>[^\]]+)\]$')
+
+
+def rotation_matrix(rotation):
+    '''3x3 row vector rotation matrix of xyz euler angles in degrees
+    '''
+    x, y, z = [math.radians(a) for a in rotation]
+    cx, sx, cy, sy, cz, sz = math.cos(x), math.sin(x), math.cos(y), math.sin(y), math.cos(z), math.sin(z)
+    rx = np.array([[1, 0, 0], [0, cx, sx], [0, -sx, cx]])
+    ry = np.array([[cy, 0, -sy], [0, 1, 0], [sy, 0, cy]])
+    rz = np.array([[cz, sz, 0], [-sz, cz, 0], [0, 0, 1]])
+    return rx.dot(ry).dot(rz)
+
+
+def compose_matrix(translate, rotate, scale):
+    '''4x4 row vector matrix of scale * rotate * translate
+    '''
+    matrix = np.identity(4)
+    matrix[:3, :3] = np.asarray(scale, dtype=float)[:, None] * rotation_matrix(rotate)
+    matrix[3, :3] = translate
+    return matrix
+
+
+def decompose_matrix(matrix):
+    '''split a 4x4 matrix back into translate, xyz rotate in degrees and scale
+    '''
+    scale = np.linalg.norm(matrix[:3, :3], axis=1)
+    rot = matrix[:3, :3] / np.where(scale == 0, 1.0, scale)[:, None]
+    y = math.asin(max(-1.0, min(1.0, -rot[0, 2])))
+    z = math.atan2(rot[0, 1], rot[0, 0])
+    x = math.atan2(rot[1, 2], rot[2, 2])
+    rotate = np.degrees([x, y, z])
+    return matrix[3, :3].copy(), rotate, scale
+
+
+def _component_indices(match, count):
+    '''the indices a component match such as pCube1.vtx[2:5] names, out of count
+    '''
+    index = match.group('index')
+    if index == '*':
+        return np.arange(count)
+    start, _, end = index.partition(':')
+    return np.arange(int(start), int(end or start) + 1)
+
+
+def _ranges(indices):
+    '''sorted unique indices as Maya's compressed 'a' and 'a:b' ranges
+    '''
+    indices = np.unique(indices)
+    if not len(indices):
+        return []
+    breaks = np.flatnonzero(np.diff(indices) != 1)
+    starts = indices[np.r_[0, breaks + 1]]
+    ends = indices[np.r_[breaks, len(indices) - 1]]
+    return [str(a) if a == b else '%d:%d' % (a, b) for a, b in zip(starts, ends)]
+
+
+def _flatten(args):
+    '''flatten nested lists and tuples of node names
+    '''
+    names = []
+    for arg in args:
+        if isinstance(arg, (list, tuple)):
+            names.extend(_flatten(arg))
+        elif arg is not None:
+            names.append(arg)
+    return names
+
+
+def _flag(kwargs, *names, **default):
+    '''value of the first of a long/short flag pair that was passed
+    '''
+    for name in names:
+        if name in kwargs:
+            return kwargs[name]
+    return default.get('default')
+
+
+def _frame(primary, secondary):
+    '''orthonormal rows, the primary direction, the one of the secondary at right angles to it and
+    the normal of both
+    '''
+    first = primary / np.linalg.norm(primary)
+    third = np.cross(first, secondary)
+    third /= np.linalg.norm(third)
+    return np.array([first, np.cross(third, first), third])
+
+
+class FakeNode(object):
+    '''a node of the fake scene, transforms carry their shape data with them
+    '''
+    def __init__(self, name, node_type, parent=None):
+        self.name = name
+        self.type = node_type
+        self.parent = parent
+        self.children = []
+        self.translate = np.zeros(3)
+        self.rotate = np.zeros(3)
+        self.scale = np.ones(3)
+        self.rotate_pivot = np.zeros(3)
+        self.attrs = {}
+        self.cvs = None
+        self.mesh = None
+        self.history = []
+
+    def local_matrix(self):
+        return compose_matrix(self.translate, self.rotate, self.scale)
+
+    def set_local_matrix(self, matrix):
+        self.translate, self.rotate, self.scale = decompose_matrix(matrix)
+
+
+class _CountedCommands(object):
+    '''the cmds of a FakeScene, counting every command sent through it
+    '''
+    def __init__(self, fake_scene):
+        self._scene = fake_scene
+
+    def __getattr__(self, name):
+        self._scene.calls[name] += 1
+        return getattr(self._scene, name)
+
+
+class FakeScene(object):
+    '''in-memory scene with a cmds-like interface, use it through face_rig.scene.
+    calls counts the commands sent through its cmds, by command name
+    '''
+    def __init__(self):
+        self.calls = collections.Counter()
+        self._commands = _CountedCommands(self)
+        self.nodes = {}
+        self.selection = []
+        self.namespaces = set([''])
+        self.current_namespace = ''
+        self.relative_names = False
+        self.warnings = []
+        self.file_name = None
+        self.refresh_suspended = False
+        self._undo_stack = []
+        self._chunk_depth = 0
+        self._chunk_start = None
+
+    @property
+    def cmds(self):
+        return self._commands
+
+    # ----------------------------------------------------------------- helpers
+
+    def _full(self, name):
+        '''the absolute name, without the leading colon, of a name given to a command
+        '''
+        name = name.strip()
+        if name.startswith(':'):
+            return name[1:]
+        if self.relative_names and self.current_namespace:
+            return '%s:%s' % (self.current_namespace, name)
+        return name
+
+    def _short(self, name):
+        '''an absolute name the way a command returns it, relative to the current namespace
+        when relative names are on
+        '''
+        if not (self.relative_names and self.current_namespace):
+            return name
+        prefix = self.current_namespace + ':'
+        return name[len(prefix):] if name.startswith(prefix) else ':' + name
+
+    def _new_name(self, name):
+        # like Maya new nodes go into the current namespace, relative names or not
+        name = name.strip()
+        if name.startswith(':') or not self.current_namespace:
+            return name.lstrip(':')
+        return '%s:%s' % (self.current_namespace, name)
+
+    def _namespace_path(self, name):
+        if name.startswith(':'):
+            return name.strip(':')
+        return ':'.join(part for part in (self.current_namespace, name.strip(':')) if part)
+
+    def _node(self, name):
+        node = self.nodes.get(self._full(name))
+        if node is None:
+            raise ValueError('No object matches name: %s' % name)
+        return node
+
+    def _unique_name(self, name):
+        if name not in self.nodes:
+            return name
+        base = name.rstrip('0123456789')
+        index = 1
+        while '%s%d' % (base, index) in self.nodes:
+            index += 1
+        return '%s%d' % (base, index)
+
+    def _create(self, name, node_type, default_name, parent=None):
+        name = self._unique_name(self._new_name(name or default_name + '1'))
+        node = FakeNode(name, node_type)
+        self.nodes[name] = node
+        if parent is not None:
+            self._set_parent(node, parent)
+        return node
+
+    def _world_matrix(self, node):
+        matrix = self._local_matrix(node)
+        while node.parent is not None and node.attrs.get('inheritsTransform', True):
+            node = node.parent
+            matrix = matrix.dot(self._local_matrix(node))
+        return matrix
+
+    def _local_matrix(self, node):
+        '''the local matrix times the offset parent matrix, connected channels read from their source
+        '''
+        if 'inputs' not in node.attrs and 'offsetParentMatrix' not in node.attrs:
+            return node.local_matrix()
+        matrix = compose_matrix(*[self._plug_value(node, attr) for attr in ('translate', 'rotate', 'scale')])
+        return matrix.dot(self._plug_matrix(node, 'offsetParentMatrix'))
+
+    def _parent_space(self, node):
+        '''the matrix that takes a node's local matrix to world space
+        '''
+        space = self._plug_matrix(node, 'offsetParentMatrix')
+        if node.parent is not None and node.attrs.get('inheritsTransform', True):
+            space = space.dot(self._world_matrix(node.parent))
+        return space
+
+    def _set_parent(self, node, parent):
+        '''reparent keeping the world transform, like cmds.parent does
+        '''
+        world = self._world_matrix(node)
+        if node.parent is not None:
+            node.parent.children.remove(node)
+        node.parent = parent
+        if parent is not None:
+            parent.children.append(node)
+        node.set_local_matrix(world.dot(np.linalg.inv(self._parent_space(node))))
+
+    def _set_world_translation(self, node, position):
+        local = np.append(np.asarray(position, dtype=float), 1.0).dot(np.linalg.inv(self._parent_space(node)))
+        node.translate = local[:3]
+
+    def _descendants(self, node):
+        result = []
+        for child in node.children:
+            result.append(child)
+            result.extend(self._descendants(child))
+        return result
+
+    def _targets(self, args):
+        names = _flatten(args)
+        return names if names else [self._short(name) for name in self.selection]
+
+    def add_mesh(self, name, mesh):
+        '''add a polygon mesh to the scene as a transform named name
+        '''
+        node = self._create(name, 'mesh', 'polySurface')
+        node.mesh = mesh
+        return self._short(node.name)
+
+    def read_mesh(self, mesh_name):
+        '''the world space Mesh of a scene mesh, the bulk query used by face_rig.geometry
+        '''
+        node = self._node(mesh_name)
+        return Mesh(self._mesh_points(node), node.mesh.face_counts, node.mesh.face_connects,
+                    name=self._short(node.name))
+
+    def _mesh_points(self, node):
+        return np.c_[node.mesh.points, np.ones(node.mesh.num_points)].dot(self._world_matrix(node))[:, :3]
+
+    # ------------------------------------------------------------- scene files
+
+    def file(self, path=None, i=False, new=False, force=False, rename=None, save=False, **kwargs):
+        if new or _flag(kwargs, 'newFile'):
+            calls = self.calls
+            self.__init__()
+            self.calls = calls
+            return None
+        if rename:
+            self.file_name = rename
+            return rename
+        if save:
+            with open(self.file_name, 'w') as scene_file:
+                json.dump(self.describe(), scene_file, indent=1)
+            return self.file_name
+        if i or _flag(kwargs, 'import', 'importFile'):
+            # the meshes go into the current namespace
+            imported = []
+            for name, mesh in load_meshes(path).items():
+                imported.append(self.add_mesh(name, mesh))
+            return imported
+        raise ValueError('FakeScene.file only supports new, import, rename and save')
+
+    def describe(self):
+        '''plain data summary of the scene: every node with its type, parent and world position
+        '''
+        description = {}
+        for name, node in self.nodes.items():
+            description[name] = {
+                'type': node.type,
+                'parent': node.parent.name if node.parent else None,
+                'position': self._world_matrix(node)[3, :3].tolist(),
+            }
+        return description
+
+    # -------------------------------------------------------------------- undo
+
+    def _state(self):
+        # what every node holds, the nodes themselves are kept. Transforms, pivots and meshes are
+        # replaced and never changed in place so they are shared, the CVs and lists are copied
+        nodes = []
+        for node in self.nodes.values():
+            attrs = dict((key, list(value) if isinstance(value, list) else value) for key, value in node.attrs.items())
+            nodes.append((node, node.name, node.parent, list(node.children), node.translate, node.rotate,
+                          node.scale, node.rotate_pivot, attrs, None if node.cvs is None else node.cvs.copy(),
+                          node.mesh, list(node.history)))
+        return nodes, list(self.selection)
+
+    def _restore(self, state):
+        nodes, self.selection = state
+        self.nodes = {}
+        for node, name, parent, children, translate, rotate, scale, pivot, attrs, cvs, mesh, history in nodes:
+            node.name, node.parent, node.children = name, parent, children
+            node.translate, node.rotate, node.scale, node.rotate_pivot = translate, rotate, scale, pivot
+            node.attrs, node.cvs, node.mesh, node.history = attrs, cvs, mesh, history
+            self.nodes[name] = node
+
+    def undoInfo(self, openChunk=False, closeChunk=False, **kwargs):
+        '''only chunks are undoable here, the state of every node is recorded when the outermost chunk opens
+        '''
+        if _flag(kwargs, 'query', 'q'):
+            return True
+        if openChunk:
+            if not self._chunk_depth:
+                self._chunk_start = self._state()
+            self._chunk_depth += 1
+        elif closeChunk and self._chunk_depth:
+            self._chunk_depth -= 1
+            if not self._chunk_depth:
+                self._undo_stack.append(self._chunk_start)
+                self._chunk_start = None
+        return None
+
+    def undo(self, *args, **kwargs):
+        if not self._undo_stack:
+            raise RuntimeError('There are no more commands to undo.')
+        self._restore(self._undo_stack.pop())
+
+    def flushUndo(self):
+        self._undo_stack = []
+
+    def refresh(self, *args, **kwargs):
+        suspend = _flag(kwargs, 'suspend', 'su')
+        if suspend is not None:
+            self.refresh_suspended = bool(suspend)
+
+    # -------------------------------------------------------------- namespaces
+
+    def namespace(self, add=None, setNamespace=None, exists=None, relativeNames=None, parent=None, **kwargs):
+        if _flag(kwargs, 'query', 'q'):
+            if relativeNames is not None:
+                return self.relative_names
+            raise ValueError('FakeScene.namespace only queries relativeNames')
+        if exists is not None:
+            return self._namespace_path(exists) in self.namespaces
+        if add is not None:
+            name = self._namespace_path(add if parent is None else '%s:%s' % (parent.rstrip(':'), add))
+            parts = name.split(':')
+            self.namespaces.update(':'.join(parts[:count]) for count in range(1, len(parts) + 1))
+            return ':' + name
+        if setNamespace is not None:
+            name = self._namespace_path(setNamespace)
+            if name not in self.namespaces:
+                raise RuntimeError('Namespace does not exist: %s' % setNamespace)
+            self.current_namespace = name
+        if relativeNames is not None:
+            self.relative_names = bool(relativeNames)
+        return None
+
+    def namespaceInfo(self, currentNamespace=False, absoluteName=False, **kwargs):
+        if not currentNamespace:
+            raise ValueError('FakeScene.namespaceInfo only returns the current namespace')
+        if absoluteName:
+            return ':' + self.current_namespace
+        return self.current_namespace or ':'
+
+    # ------------------------------------------------------- listing and naming
+
+    def warning(self, message):
+        self.warnings.append(message)
+
+    def objExists(self, name):
+        return self._full(name) in self.nodes
+
+    def ls(self, *args, **kwargs):
+        node_type = _flag(kwargs, 'type', 'typ')
+        if _flag(kwargs, 'selection', 'sl'):
+            names = [self._short(name) for name in self.selection]
+        elif args:
+            names = []
+            for name in _flatten(args):
+                match = _COMPONENT.match(name)
+                if match and _flag(kwargs, 'flatten', 'fl'):
+                    node = self._node(match.group('node'))
+                    kind = match.group('kind')
+                    if kind == 'cv':
+                        count = len(node.cvs)
+                    else:
+                        count = node.mesh.num_faces if kind == 'f' else node.mesh.num_points
+                    names.extend('%s.%s[%d]' % (self._short(node.name), kind, index)
+                                 for index in _component_indices(match, count))
+                elif match is None and '*' in name:
+                    pattern = re.compile(re.escape(self._full(name)).replace(r'\*', '[^:]*') + '$')
+                    names.extend(self._short(full) for full in self.nodes if pattern.match(full))
+                elif match or self._full(name) in self.nodes:
+                    names.append(name)
+        else:
+            names = [self._short(name) for name in self.nodes]
+        if node_type:
+            types = node_type if isinstance(node_type, (list, tuple)) else [node_type]
+            names = [n for n in names if self._full(n) in self.nodes and self.nodes[self._full(n)].type in types]
+        return names
+
+    def _selected_name(self, name):
+        '''the full name of a node, or of the node of a component such as Head.f[2:5]
+        '''
+        node_name, dot, component = name.partition('.')
+        return self._node(node_name).name + dot + component
+
+    def select(self, *args, **kwargs):
+        names = [self._selected_name(n) for n in _flatten(args)]
+        if _flag(kwargs, 'clear', 'cl'):
+            self.selection = []
+        elif _flag(kwargs, 'add', 'af'):
+            self.selection.extend(n for n in names if n not in self.selection)
+        else:
+            self.selection = names
+
+    def rename(self, old_name, new_name):
+        node = self._node(old_name)
+        old_full = node.name
+        del self.nodes[node.name]
+        node.name = self._unique_name(self._new_name(new_name))
+        self.nodes[node.name] = node
+        self.selection = [node.name if n == old_full else n for n in self.selection]
+        return self._short(node.name)
+
+    def delete(self, *args, **kwargs):
+        if _flag(kwargs, 'constructionHistory', 'ch'):
+            # only the history of the nodes goes, like the DeleteHistory menu command
+            return self.DeleteHistory(*args)
+        # like Maya nothing is deleted when one of the names does not exist
+        for node in [self._node(name) for name in self._targets(args)]:
+            if node.name not in self.nodes:
+                # went with a node deleted before it
+                continue
+            for doomed in [node] + self._descendants(node):
+                for history in doomed.history:
+                    self.nodes.pop(history, None)
+                self.nodes.pop(doomed.name, None)
+                if doomed.name in self.selection:
+                    self.selection.remove(doomed.name)
+            if node.parent is not None:
+                node.parent.children.remove(node)
+        # like Maya the connections of the deleted nodes go with them
+        for node in self.nodes.values():
+            if 'inputs' in node.attrs:
+                node.attrs['inputs'] = [entry for entry in node.attrs['inputs'] if entry[1] in self.nodes]
+
+    def listHistory(self, name, **kwargs):
+        '''the construction history of a node and the skin clusters deforming it
+        '''
+        node = self._node(name)
+        skin_clusters = [other.name for other in self.nodes.values()
+                         if other.type == 'skinCluster' and node.name in other.attrs.get('geometry', [])]
+        return [self._short(name) for name in node.history + skin_clusters]
+
+    def listRelatives(self, name, **kwargs):
+        node = self._node(name)
+        if _flag(kwargs, 'shapes', 's'):
+            return [self._short(node.name) + 'Shape'] if node.type in ('nurbsCurve', 'mesh') else None
+        if _flag(kwargs, 'parent', 'p'):
+            return [self._short(node.parent.name)] if node.parent else None
+        if _flag(kwargs, 'allDescendents', 'ad'):
+            # Maya lists the deepest descendants first
+            relatives = self._descendants(node)[::-1]
+        else:
+            relatives = list(node.children)
+        node_type = _flag(kwargs, 'type', 'typ')
+        if node_type:
+            relatives = [r for r in relatives if r.type == node_type]
+        return [self._short(r.name) for r in relatives] or None
+
+    def parent(self, *args, **kwargs):
+        names = _flatten(args)
+        if _flag(kwargs, 'world', 'w'):
+            children, parent = names, None
+        else:
+            children, parent = names[:-1], self._node(names[-1])
+        for name in children:
+            node = self._node(name)
+            if node.parent is not parent:
+                self._set_parent(node, parent)
+        return children
+
+    # ---------------------------------------------------------------- creation
+
+    def joint(self, name=None, position=(0, 0, 0), radius=1.0, **kwargs):
+        name = _flag(kwargs, 'n', default=name)
+        position = _flag(kwargs, 'p', default=position)
+        radius = _flag(kwargs, 'rad', default=radius)
+        # like Maya a new joint is parented under the selected joint
+        parent = None
+        if self.selection and self.nodes[self.selection[-1]].type == 'joint':
+            parent = self.nodes[self.selection[-1]]
+        node = self._create(name, 'joint', 'joint', parent)
+        self._set_world_translation(node, position)
+        node.attrs['radius'] = radius
+        self.selection = [node.name]
+        return self._short(node.name)
+
+    def mirrorJoint(self, name, mirrorYZ=False, mirrorBehavior=False, searchReplace=None, **kwargs):
+        source = self._node(name)
+        created = []
+
+        def mirror(node, parent):
+            new_name = ':' + node.name.replace(*searchReplace) if searchReplace else None
+            copy = self._create(new_name, 'joint', 'joint', parent)
+            world = reflect_matrices(self._world_matrix(node), behavior=mirrorBehavior)
+            if parent is not None:
+                world = world.dot(np.linalg.inv(self._world_matrix(parent)))
+            copy.set_local_matrix(world)
+            copy.attrs = dict(node.attrs)
+            created.append(self._short(copy.name))
+            for child in node.children:
+                if child.type == 'joint':
+                    mirror(child, copy)
+
+        mirror(source, source.parent)
+        return created
+
+    def create_joints(self, names, matrices, parents, radius=1.0):
+        '''the bulk joint creation face_rig.mirror uses, every joint gets its world matrix and parent
+        '''
+        self.calls['create_joints'] += 1
+        created = []
+        for name, matrix, parent in zip(names, matrices, parents):
+            parent_node = self._node(parent) if parent else None
+            node = self._create(name, 'joint', 'joint', parent_node)
+            local = np.asarray(matrix, dtype=float)
+            if parent_node is not None:
+                local = local.dot(np.linalg.inv(self._world_matrix(parent_node)))
+            node.set_local_matrix(local)
+            node.attrs['radius'] = radius
+            created.append(self._short(node.name))
+        self.selection = []
+        return created
+
+    def create_curves(self, names, points, degree=3, periodic=False, parents=None, pivots=None):
+        '''the bulk curve creation the control shapes use, every curve gets its world CVs
+        '''
+        self.calls['create_curves'] += 1
+        created = []
+        for index, name in enumerate(names):
+            node = self._make_curve(name, 'curve', points[index], history=False)
+            node.attrs['degree'] = degree
+            if pivots is not None:
+                node.rotate_pivot = np.asarray(pivots[index], dtype=float)
+            if parents is not None and parents[index]:
+                self._set_parent(node, self._node(parents[index]))
+            created.append(self._short(node.name))
+        self.selection = []
+        return created
+
+    def set_curve_points(self, names, points, pivots=None):
+        '''new world CVs and pivots for existing curves. Joints parent constrained to a curve without an
+        offset follow its new pivot, the way Maya evaluates the constraint
+        '''
+        self.calls['set_curve_points'] += 1
+        for index, name in enumerate(names):
+            node = self._node(name)
+            inverse = np.linalg.inv(self._world_matrix(node))
+            points_index = np.asarray(points[index], dtype=float)
+            node.cvs = np.c_[points_index, np.ones(len(points_index))].dot(inverse)[:, :3]
+            if pivots is not None and pivots[index] is not None:
+                node.rotate_pivot = np.append(np.asarray(pivots[index], dtype=float), 1.0).dot(inverse)[:3]
+                for constraint in self.nodes.values():
+                    if constraint.type == 'parentConstraint' and constraint.attrs['targets'] == [node.name] \
+                            and not constraint.attrs['maintainOffset']:
+                        self._follow_constraint(constraint.parent, pivots[index])
+
+    def _follow_constraint(self, driven, position, rotation=None):
+        '''move a node driven by a parentConstraint to position, and turn it to the world rotation
+        matrix given
+        '''
+        # descendants driven by constraints of their own stay where they are, and so do the constraint nodes
+        held = [node for node in self._descendants(driven) if node.type.endswith('Constraint')
+                or any(child.type == 'parentConstraint' for child in node.children)]
+        held_matrices = [self._world_matrix(node) for node in held]
+        if rotation is None:
+            self._set_world_translation(driven, position)
+        else:
+            world = self._world_matrix(driven)
+            # the scale of the driven node is kept, a parentConstraint leaves it alone
+            world[:3, :3] = rotation * np.linalg.norm(world[:3, :3], axis=1)[:, None]
+            world[3, :3] = position
+            driven.set_local_matrix(world.dot(np.linalg.inv(self._parent_space(driven))))
+        for node, matrix in zip(held, held_matrices):
+            if rotation is None:
+                self._set_world_translation(node, matrix[3, :3])
+            else:
+                node.set_local_matrix(matrix.dot(np.linalg.inv(self._parent_space(node))))
+
+    def _make_curve(self, name, default_name, cvs, history=True):
+        node = self._create(name, 'nurbsCurve', default_name)
+        node.cvs = np.asarray(cvs, dtype=float)
+        if history:
+            node.history.append(self._create(None, 'makeNurbCircle', 'makeNurbCircle').name)
+        self.selection = [node.name]
+        return node
+
+    def circle(self, name=None, radius=1.0, normal=(0, 0, 1), center=(0, 0, 0), ch=True, **kwargs):
+        name = _flag(kwargs, 'n', default=name)
+        radius = _flag(kwargs, 'r', default=radius)
+        normal = np.asarray(_flag(kwargs, 'nr', default=normal), dtype=float)
+        center = _flag(kwargs, 'c', default=center)
+        ch = _flag(kwargs, 'constructionHistory', default=ch)
+        angles = np.radians(np.arange(8) * -45.0 + 45.0)
+        cvs = np.c_[np.cos(angles), np.sin(angles), np.zeros(8)] * _CIRCLE_CV_RADIUS * radius
+        if not normal.any():
+            normal = np.array([0.0, 0.0, 1.0])
+        if abs(normal[2]) < 0.999:
+            # turn the circle from facing +Z to face the requested normal
+            normal = normal / np.linalg.norm(normal)
+            side = np.cross([0.0, 0.0, 1.0], normal)
+            side /= np.linalg.norm(side)
+            cvs = cvs.dot(np.array([side, np.cross(normal, side), normal]))
+        node = self._make_curve(name, 'nurbsCircle', cvs + center, history=ch)
+        return [self._short(name) for name in [node.name] + node.history]
+
+    def curve(self, name=None, d=3, p=(), **kwargs):
+        name = _flag(kwargs, 'n', default=name)
+        points = _flag(kwargs, 'point', default=p)
+        node = self._make_curve(name, 'curve', points, history=False)
+        node.attrs['degree'] = _flag(kwargs, 'degree', default=d)
+        return self._short(node.name)
+
+    def duplicate(self, original, **kwargs):
+        new_name = _flag(kwargs, 'name', 'n')
+        source = self._node(original)
+
+        def copy(node, copy_name, parent):
+            new = self._create(copy_name or ':' + node.name, node.type, node.type)
+            new.translate, new.rotate, new.scale = node.translate.copy(), node.rotate.copy(), node.scale.copy()
+            new.rotate_pivot = node.rotate_pivot.copy()
+            new.attrs = dict(node.attrs)
+            new.cvs = None if node.cvs is None else node.cvs.copy()
+            new.mesh = node.mesh
+            if parent is not None:
+                new.parent = parent
+                parent.children.append(new)
+            for child in list(node.children):
+                copy(child, None, new)
+            return new
+
+        new = copy(source, new_name, None)
+        if source.parent is not None:
+            new.parent = source.parent
+            source.parent.children.append(new)
+        self.selection = [new.name]
+        return [self._short(new.name)]
+
+    def group(self, *args, **kwargs):
+        node = self._create(_flag(kwargs, 'name', 'n'), 'transform', 'null')
+        for name in _flatten(args):
+            self._set_parent(self._node(name), node)
+        self.selection = [node.name]
+        return self._short(node.name)
+
+    # -------------------------------------------------------------- transforms
+
+    def xform(self, *args, **kwargs):
+        names = self._targets(args)
+        if _flag(kwargs, 'centerPivots', 'cp'):
+            for name in names:
+                node = self._node(name)
+                if node.cvs is not None:
+                    node.rotate_pivot = (node.cvs.min(axis=0) + node.cvs.max(axis=0)) / 2.0
+            return None
+        if _flag(kwargs, 'query', 'q'):
+            match = _COMPONENT.match(names[0])
+            if match:
+                return self._query_components(match)
+            # like Maya, querying several nodes returns their values one after the other
+            values = []
+            for name in names:
+                values.extend(self._query_transform(self._node(name), kwargs))
+            return values
+        translation = _flag(kwargs, 'translation', 't')
+        if translation is not None:
+            for name in names:
+                node = self._node(name)
+                if _flag(kwargs, 'worldSpace', 'ws'):
+                    self._set_world_translation(node, translation)
+                else:
+                    node.translate = np.asarray(translation, dtype=float)
+        rotation = _flag(kwargs, 'rotation', 'ro')
+        if rotation is not None:
+            for name in names:
+                self._node(name).rotate = np.asarray(rotation, dtype=float)
+        return None
+
+    def _query_transform(self, node, kwargs):
+        world = self._world_matrix(node)
+        if _flag(kwargs, 'matrix', 'm'):
+            matrix = world if _flag(kwargs, 'worldSpace', 'ws') else node.local_matrix()
+            return matrix.ravel().tolist()
+        if _flag(kwargs, 'rotatePivot', 'rp'):
+            return np.append(node.rotate_pivot, 1.0).dot(world)[:3].tolist()
+        if _flag(kwargs, 'rotation', 'ro'):
+            return node.rotate.tolist()
+        if _flag(kwargs, 'worldSpace', 'ws'):
+            return world[3, :3].tolist()
+        return node.translate.tolist()
+
+    def _query_components(self, match):
+        node = self._node(match.group('node'))
+        if match.group('kind') == 'vtx':
+            points = self._mesh_points(node)
+        else:
+            points = np.c_[node.cvs, np.ones(len(node.cvs))].dot(self._world_matrix(node))[:, :3]
+        return points[_component_indices(match, len(points))].ravel().tolist()
+
+    def pointPosition(self, component, **kwargs):
+        match = _COMPONENT.match(component)
+        if not match or match.group('kind') == 'f':
+            raise ValueError('pointPosition takes a vertex or a CV, not %s' % component)
+        points = self._query_components(match)
+        return points[:3]
+
+    def polyListComponentConversion(self, *args, **kwargs):
+        '''faces to vertices and vertices to faces, the result in Maya's compressed range form
+        '''
+        to_vertex = _flag(kwargs, 'toVertex', 'tv')
+        to_face = _flag(kwargs, 'toFace', 'tf')
+        if not to_vertex and not to_face:
+            raise ValueError('FakeScene.polyListComponentConversion converts to vertices or faces only')
+        per_mesh = collections.OrderedDict()
+        for name in _flatten(args):
+            match = _COMPONENT.match(name)
+            node = self._node(match.group('node') if match else name)
+            mesh = node.mesh
+            if match is None:
+                kind, indices = 'all', None
+            else:
+                kind = match.group('kind')
+                count = mesh.num_faces if kind == 'f' else mesh.num_points
+                indices = _component_indices(match, count)
+            if to_vertex:
+                if kind == 'f':
+                    vertices = mesh.face_vertex_indices(indices)[0]
+                elif kind == 'vtx':
+                    vertices = indices
+                else:
+                    vertices = np.arange(mesh.num_points)
+                per_mesh.setdefault((self._short(node.name), 'vtx'), []).append(np.asarray(vertices))
+            else:
+                if kind == 'vtx':
+                    corner_faces = np.repeat(np.arange(mesh.num_faces), mesh.face_counts)
+                    faces = corner_faces[np.isin(mesh.face_connects, indices)]
+                elif kind == 'f':
+                    faces = indices
+                else:
+                    faces = np.arange(mesh.num_faces)
+                per_mesh.setdefault((self._short(node.name), 'f'), []).append(np.asarray(faces))
+        result = []
+        for (name, kind), indices in per_mesh.items():
+            result.extend('%s.%s[%s]' % (name, kind, index_range) for index_range in _ranges(np.concatenate(indices)))
+        return result
+
+    def move(self, x, y, z, *args, **kwargs):
+        relative = _flag(kwargs, 'relative', 'r')
+        delta = np.array([x, y, z], dtype=float)
+        for name in self._targets(args):
+            if name.endswith('.rotatePivot'):
+                node = self._node(name[:-len('.rotatePivot')])
+                inverse = np.linalg.inv(self._world_matrix(node))
+                pivot = np.append(node.rotate_pivot, 1.0).dot(self._world_matrix(node))[:3]
+                target = pivot + delta if relative else delta
+                node.rotate_pivot = np.append(target, 1.0).dot(inverse)[:3]
+                continue
+            match = _COMPONENT.match(name)
+            if match:
+                node = self._node(match.group('node'))
+                inverse = np.linalg.inv(self._world_matrix(node))[:3, :3]
+                start, _, end = match.group('index').partition(':')
+                index = slice(None) if start == '*' else slice(int(start), int(end or start) + 1)
+                node.cvs[index] += delta.dot(inverse)
+                continue
+            node = self._node(name)
+            if relative:
+                node.translate = node.translate + delta
+            else:
+                self._set_world_translation(node, delta)
+
+    def rotate(self, x, y, z, *args, **kwargs):
+        angles = np.array([x, y, z], dtype=float)
+        for name in self._targets(args):
+            node = self._node(name)
+            node.rotate = node.rotate + angles if _flag(kwargs, 'relative', 'r') else angles
+
+    def scale(self, x, y, z, *args, **kwargs):
+        factors = np.array([x, y, z], dtype=float)
+        for name in self._targets(args):
+            node = self._node(name)
+            node.scale = node.scale * factors if _flag(kwargs, 'relative', 'r') else factors
+
+    def makeIdentity(self, *args, **kwargs):
+        '''freeze transformations, the transform is baked into the CVs and the children
+        '''
+        for name in self._targets(args):
+            node = self._node(name)
+            matrix = node.local_matrix()
+            if node.cvs is not None:
+                node.cvs = np.c_[node.cvs, np.ones(len(node.cvs))].dot(matrix)[:, :3]
+            if node.mesh is not None:
+                points = np.c_[node.mesh.points, np.ones(node.mesh.num_points)].dot(matrix)[:, :3]
+                node.mesh = Mesh(points, node.mesh.face_counts, node.mesh.face_connects, node.mesh.name)
+            node.rotate_pivot = np.append(node.rotate_pivot, 1.0).dot(matrix)[:3]
+            for child in node.children:
+                child.set_local_matrix(child.local_matrix().dot(matrix))
+            node.translate, node.rotate, node.scale = np.zeros(3), np.zeros(3), np.ones(3)
+
+    def DeleteHistory(self, *args):
+        for name in self._targets(args):
+            node = self._node(name)
+            for history in node.history:
+                self.nodes.pop(history, None)
+            node.history = []
+
+    def exactWorldBoundingBox(self, *args, **kwargs):
+        points = []
+        for name in self._targets(args):
+            node = self._node(name)
+            if node.mesh is not None:
+                points.append(self._mesh_points(node))
+            elif node.cvs is not None:
+                points.append(np.c_[node.cvs, np.ones(len(node.cvs))].dot(self._world_matrix(node))[:, :3])
+            else:
+                points.append(self._world_matrix(node)[3:, :3])
+        points = np.concatenate(points)
+        return points.min(axis=0).tolist() + points.max(axis=0).tolist()
+
+    # -------------------------------------------------------------- attributes
+
+    def getAttr(self, attribute, **kwargs):
+        name, _, attr = attribute.partition('.')
+        node = self._node(name)
+        if attr == 'cv[*]':
+            return [tuple(cv) for cv in node.cvs.tolist()]
+        if attr in ('translate', 'rotate', 'scale'):
+            return [tuple(self._plug_value(node, attr).tolist())]
+        if attr in _MATRIX_PLUGS:
+            return self._plug_matrix(node, attr).ravel().tolist()
+        if attr == 'inheritsTransform':
+            return bool(node.attrs.get(attr, True))
+        return node.attrs[attr]
+
+    def setAttr(self, attribute, *values, **kwargs):
+        name, _, attr = attribute.partition('.')
+        node = self._node(name)
+        if attr == 'cv[*]':
+            node.cvs = np.asarray(values, dtype=float).reshape(-1, 3)
+        elif attr in ('translate', 'rotate', 'scale'):
+            setattr(node, attr, np.asarray(values, dtype=float))
+        elif kwargs.get('type') == 'matrix':
+            node.attrs[attr] = np.asarray(_flatten(values), dtype=float).reshape(4, 4)
+        else:
+            node.attrs[attr] = values[0] if len(values) == 1 else tuple(values)
+
+    # ------------------------------------------------------------- connections
+
+    def _plug(self, plug):
+        name, _, attr = plug.partition('.')
+        return self._node(name), attr
+
+    def _input(self, node, attr):
+        '''the (source node, source attribute) connected to an attribute, None when nothing is
+        '''
+        for destination, source, source_attr in node.attrs.get('inputs', ()):
+            if destination == attr:
+                return self.nodes[source], source_attr
+        return None
+
+    def _plug_value(self, node, attr):
+        connected = self._input(node, attr)
+        if connected is not None:
+            return self._plug_value(*connected)
+        return getattr(node, attr)
+
+    def _plug_matrix(self, node, attr):
+        '''the value of a matrix attribute, the ones a node computes are evaluated
+        '''
+        connected = self._input(node, attr)
+        if connected is not None:
+            return self._plug_matrix(*connected)
+        if attr in ('worldMatrix', 'worldMatrix[0]'):
+            return self._world_matrix(node)
+        if attr == 'matrix':
+            return self._local_matrix(node)
+        if attr == 'outputMatrix':
+            return self._aim_matrix(node)
+        return node.attrs.get(attr, np.identity(4))
+
+    def _aim_matrix(self, node):
+        '''an aimMatrix aiming its primary axis at the target and aligning its secondary axis with a
+        vector, the primary mode is aim and the secondary mode align
+        '''
+        matrix = self._plug_matrix(node, 'preSpaceMatrix').dot(self._plug_matrix(node, 'inputMatrix'))
+        axes = matrix[:3, :3]
+        target = self._plug_matrix(node, 'primaryTargetMatrix')[3, :3]
+        primary = np.asarray(node.attrs.get('primaryInputAxis', (1, 0, 0)), dtype=float).dot(axes)
+        secondary = np.asarray(node.attrs.get('secondaryInputAxis', (0, 1, 0)), dtype=float).dot(axes)
+        up = np.asarray(node.attrs.get('secondaryTargetVector', (0, 1, 0)), dtype=float)
+        # the rotation taking the frame of the input axes to the frame of the aim and up vectors
+        rotation = _frame(primary, secondary).T.dot(_frame(target - matrix[3, :3], up))
+        result = matrix.copy()
+        result[:3, :3] = axes.dot(rotation)
+        return result.dot(self._plug_matrix(node, 'postSpaceMatrix'))
+
+    def connectAttr(self, source, destination, force=False, **kwargs):
+        source_node, source_attr = self._plug(source)
+        node, attr = self._plug(destination)
+        inputs = [entry for entry in node.attrs.get('inputs', []) if entry[0] != attr]
+        if len(inputs) < len(node.attrs.get('inputs', [])) and not _flag(kwargs, 'f', default=force):
+            raise RuntimeError('%s already has an incoming connection' % destination)
+        node.attrs['inputs'] = inputs + [(attr, source_node.name, source_attr)]
+
+    def disconnectAttr(self, source, destination, **kwargs):
+        source_node, source_attr = self._plug(source)
+        node, attr = self._plug(destination)
+        node.attrs['inputs'] = [entry for entry in node.attrs.get('inputs', [])
+                                if entry != (attr, source_node.name, source_attr)]
+
+    def _sources(self, node):
+        '''the nodes a node reads from: its connections, the targets of a constraint, the constraints
+        under the node they drive and the influences of a skin cluster
+        '''
+        sources = [source for destination, source, source_attr in node.attrs.get('inputs', ())]
+        sources.extend(node.attrs.get('targets', []) + node.attrs.get('influences', []))
+        sources.extend(child.name for child in node.children if child.type.endswith('Constraint'))
+        sources.extend(other.name for other in self.nodes.values()
+                       if other.type == 'skinCluster' and node.name in other.attrs.get('geometry', []))
+        return [source for source in sources if source in self.nodes]
+
+    def listConnections(self, name, source=True, destination=True, **kwargs):
+        '''the nodes connected to a node or to one of its attributes, without the plugs
+        '''
+        name, _, attr = name.partition('.')
+        node = self._node(name)
+        source = _flag(kwargs, 's', default=source)
+        destination = _flag(kwargs, 'd', default=destination)
+        if attr:
+            connected = [entry[1] for entry in node.attrs.get('inputs', ()) if entry[0] == attr] if source else []
+            if destination:
+                connected.extend(other.name for other in self.nodes.values()
+                                 if any(entry[1:] == (node.name, attr) for entry in other.attrs.get('inputs', ())))
+        else:
+            connected = list(self._sources(node)) if source else []
+            if destination:
+                connected.extend(other.name for other in self.nodes.values() if node.name in self._sources(other))
+        connected = list(collections.OrderedDict.fromkeys(connected))
+        return [self._short(other) for other in connected] or None
+
+    def createNode(self, node_type, name=None, **kwargs):
+        parent = _flag(kwargs, 'parent', 'p')
+        node = self._create(_flag(kwargs, 'n', default=name), node_type, node_type,
+                            self._node(parent) if parent else None)
+        return self._short(node.name)
+
+    def nodeType(self, name):
+        return self._node(name).type
+
+    # ------------------------------------------------------ deformers and rigs
+
+    def _constraint(self, kind, args, kwargs):
+        names = self._targets(args)
+        drivers, driven = names[:-1], self._node(names[-1])
+        node = self._create(':%s_%s1' % (driven.name, kind), kind, kind, driven)
+        node.attrs['targets'] = [self._node(driver).name for driver in drivers]
+        node.attrs['maintainOffset'] = bool(_flag(kwargs, 'maintainOffset', 'mo'))
+        if kind == 'parentConstraint' and not node.attrs['maintainOffset'] and len(drivers) == 1:
+            # like Maya the driven node snaps to the pivot and the world rotation of its target
+            target = self._node(drivers[0])
+            world = self._world_matrix(target)
+            pivot = np.append(target.rotate_pivot, 1.0).dot(world)[:3]
+            self._follow_constraint(driven, pivot, world[:3, :3] / np.linalg.norm(world[:3, :3], axis=1)[:, None])
+        return [self._short(node.name)]
+
+    def parentConstraint(self, *args, **kwargs):
+        return self._constraint('parentConstraint', args, kwargs)
+
+    def aimConstraint(self, *args, **kwargs):
+        return self._constraint('aimConstraint', args, kwargs)
+
+    def scaleConstraint(self, *args, **kwargs):
+        return self._constraint('scaleConstraint', args, kwargs)
+
+    def skinCluster(self, *args, **kwargs):
+        names = _flatten(args)
+        if _flag(kwargs, 'query', 'q'):
+            if _flag(kwargs, 'influence', 'inf'):
+                return [self._short(name) for name in self._node(names[0]).attrs['influences']]
+            if _flag(kwargs, 'geometry', 'g'):
+                return [self._short(name) for name in self._node(names[0]).attrs['geometry']]
+            raise ValueError('FakeScene.skinCluster queries the influences and the geometry only')
+        influences = [self._node(n).name for n in names if self._node(n).type == 'joint']
+        geometry = [self._node(n).name for n in names if self._node(n).mesh is not None]
+        node = self._create(_flag(kwargs, 'name', 'n'), 'skinCluster', 'skinCluster')
+        node.attrs['influences'] = influences
+        node.attrs['geometry'] = geometry
+        return [self._short(node.name)]
+
+    def get_skin_weights(self, skin_cluster):
+        self.calls['get_skin_weights'] += 1
+        weights = self._node(skin_cluster).attrs.get('weights')
+        if weights is None:
+            raise ValueError('%s has no weights set' % skin_cluster)
+        return SkinWeights([self._short(name) for name in weights.joint_names], weights.offsets,
+                           weights.joint_indices, weights.weights)
+
+    def set_skin_weights(self, skin_cluster, weights):
+        '''the bulk weight write of face_rig.skinning, the weights are kept on the skin cluster
+        '''
+        self.calls['set_skin_weights'] += 1
+        node = self._node(skin_cluster)
+        joint_names = [self._full(name) for name in weights.joint_names]
+        missing = [name for name, full in zip(weights.joint_names, joint_names) if full not in node.attrs['influences']]
+        if missing:
+            raise ValueError('%s has no influences %s' % (skin_cluster, ', '.join(missing)))
+        # kept with absolute joint names, like the influences
+        node.attrs['weights'] = SkinWeights(joint_names, weights.offsets, weights.joint_indices, weights.weights)
+
+    def createDisplayLayer(self, name=None, **kwargs):
+        node = self._create(name, 'displayLayer', 'layer')
+        node.attrs['members'] = [] if kwargs.get('empty') else list(self.selection)
+        node.attrs['visibility'] = True
+        return self._short(node.name)
+
+    def editDisplayLayerMembers(self, layer, *members, **kwargs):
+        self._node(layer).attrs['members'].extend(self._node(name).name for name in _flatten(members))
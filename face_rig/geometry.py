@@ -0,0 +1,174 @@
+'''Bulk scene queries for mesh geometry.
+
+Reading a mesh one vertex at a time with cmds.pointPosition costs a round trip
+per vertex. Here all the points and the face-vertex connectivity of a mesh are
+read in one go and cached as a Mesh, so placing joints costs the same however
+dense the head is.
+
+The same cache keeps the bounding box of every mesh and a snapshot of all the
+joint world matrices, so a whole build queries each mesh once instead of on
+every stage. cache.hits and cache.misses count how often a query was saved.
+'''
+import numpy as np
+
+from face_rig.mesh import Mesh
+from face_rig.scene import cmds, get_scene
+
+
+class QueryCache(object):
+    '''per build cache of the scene queries the stages repeat.
+    Holds the Mesh and the world bounding box of every mesh read, and a snapshot of the
+    world matrices of all the joints taken with a single query. Nothing is refreshed on its
+    own, a stage that creates or moves joints calls invalidate_joints, a new build calls invalidate
+    '''
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._meshes = {}
+        self._bounding_boxes = {}
+        self._joint_names = None
+        self._joint_index = None
+        self._joint_matrices = None
+
+    def mesh(self, mesh_name):
+        mesh = self._meshes.get(mesh_name)
+        if mesh is None:
+            self.misses += 1
+            mesh = self._meshes[mesh_name] = get_scene().read_mesh(mesh_name)
+        else:
+            self.hits += 1
+        return mesh
+
+    def bounding_box(self, mesh_name):
+        bbox = self._bounding_boxes.get(mesh_name)
+        if bbox is None:
+            self.misses += 1
+            bbox = self._bounding_boxes[mesh_name] = list(cmds.exactWorldBoundingBox(mesh_name))
+        else:
+            self.hits += 1
+        return bbox
+
+    def _snapshot_joints(self):
+        '''read the world matrix of every joint of the current namespace in one xform query
+        '''
+        names = cmds.ls('*', type='joint') or []
+        matrices = np.zeros((0, 4, 4))
+        if names:
+            matrices = np.reshape(cmds.xform(names, query=True, worldSpace=True, matrix=True), (-1, 4, 4))
+        self._joint_names = list(names)
+        self._joint_index = dict((name, index) for index, name in enumerate(names))
+        self._joint_matrices = matrices
+
+    def joint_names(self):
+        '''names of all the joints of the snapshot, in scene order
+        '''
+        if self._joint_names is None:
+            self.misses += 1
+            self._snapshot_joints()
+        else:
+            self.hits += 1
+        return list(self._joint_names)
+
+    def joint_matrices(self):
+        '''(n, 4, 4) world matrices of the joints, in the order of joint_names
+        '''
+        if self._joint_matrices is None:
+            self.misses += 1
+            self._snapshot_joints()
+        else:
+            self.hits += 1
+        return self._joint_matrices
+
+    def joint_position(self, joint):
+        '''world position of a joint from the snapshot, None if it is not a joint of the snapshot
+        '''
+        fresh = self._joint_index is None
+        if fresh:
+            self._snapshot_joints()
+        index = self._joint_index.get(joint.strip())
+        if index is None:
+            return None
+        if fresh:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return self._joint_matrices[index, 3, :3].tolist()
+
+    def invalidate_joints(self):
+        '''forget the joint snapshot, call it after creating, deleting or moving joints
+        '''
+        self._joint_names = self._joint_index = self._joint_matrices = None
+
+    def invalidate(self, mesh_name=None):
+        '''forget the cached geometry of one mesh, or everything when no mesh is given
+        '''
+        if mesh_name is None:
+            self._meshes.clear()
+            self._bounding_boxes.clear()
+            self.invalidate_joints()
+        else:
+            self._meshes.pop(mesh_name, None)
+            self._bounding_boxes.pop(mesh_name, None)
+
+    def reset_counters(self):
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+# the cache the stages share, a build starts with cache.invalidate()
+cache = QueryCache()
+
+
+def get_mesh(mesh_name):
+    '''returns the cached Mesh of a scene mesh, reading it from the scene the first time.
+    A Mesh, for example one loaded with face_rig.mesh_io, is returned as it is
+    '''
+    if isinstance(mesh_name, Mesh):
+        return mesh_name
+    return cache.mesh(mesh_name)
+
+
+def bounding_box(mesh_name):
+    '''cached world bounding box of a scene mesh, or the bounding box of a Mesh
+    '''
+    if isinstance(mesh_name, Mesh):
+        return mesh_name.bounding_box()
+    return cache.bounding_box(mesh_name)
+
+
+def position(node):
+    '''world position of a scene node, a position that is not a node name is returned as it is.
+    Joints are read from the cached joint snapshot, other nodes are queried
+    '''
+    if isinstance(node, str):
+        joint_position = cache.joint_position(node)
+        if joint_position is not None:
+            return joint_position
+        cache.misses += 1
+        return cmds.xform(node, query=True, worldSpace=True, translation=True)
+    return node
+
+
+def selection_centroids(selections):
+    '''takes a list of (mesh, face_indices) selections and returns the face centres of each
+    selection in order. The faces of every mesh are computed together in a single pass
+    '''
+    faces_per_mesh = {}
+    for mesh_name, face_indices in selections:
+        # face lists and face_rig.selection FaceSets alike, a FaceSet is expanded in one go
+        faces_per_mesh.setdefault(mesh_name, []).append(np.asarray(face_indices, dtype=np.int64).ravel())
+    centroids_per_mesh = {}
+    for mesh_name, face_indices in faces_per_mesh.items():
+        centroids_per_mesh[mesh_name] = get_mesh(mesh_name).face_centroids(np.concatenate(face_indices))
+
+    # hand the centres back out in the order the faces were stored
+    used = dict.fromkeys(centroids_per_mesh, 0)
+    result = []
+    for mesh_name, face_indices in selections:
+        start = used[mesh_name]
+        used[mesh_name] = start + len(face_indices)
+        result.append(centroids_per_mesh[mesh_name][start:start + len(face_indices)])
+    return result
@@ -0,0 +1,205 @@
+'''Automatic placement of the 24 face picks.
+
+Instead of an artist clicking the 24 faces one by one, the picks are found on
+the head mesh itself:
+
+1. the symmetry plane is the plane half way between the eye meshes, normal to
+   the line joining them. Together with the up axis it gives a face frame,
+   X towards the left eye, Y up and Z out of the face.
+2. the nose tip, the lip line, the mouth corners, the chin and the ears are
+   found from the signed surface curvature and the extent of the head in that
+   frame.
+3. every other landmark is placed relative to the eyes and those features,
+   then projected onto the front of the head.
+
+Each landmark is finally snapped to the face whose centre is nearest, giving
+the same list of picks, in the same order, the UI collects by hand. All steps
+are vectorized over the whole mesh, a 500k face head takes a few seconds.
+
+    python -m face_rig.landmarks --faces 500000    # benchmark on a synthetic head
+'''
+import argparse
+import time
+
+import numpy as np
+
+from face_rig.mesh import vertex_curvature, vertex_normals
+from face_rig.spatial import mesh_index
+
+# the 24 joints the face picks create, in the order they are picked
+FACE_JOINT_NAMES = [
+    'eyebrow_01_joint_L', 'eyebrow_02_joint_L', 'eyebrow_03_joint_L',
+    'eyelid_top_01_joint_L', 'eyelid_top_02_joint_L', 'eyelid_top_03_joint_L',
+    'eyelid_bottom_01_joint_L', 'eyelid_bottom_02_joint_L', 'eyelid_bottom_03_joint_L',
+    'nose_side_joint_L', 'nose_fold_joint_L', 'squint_01_joint_L', 'squint_02_joint_L', 'ear_joint_L',
+    'mouth_top_middle_joint', 'mouth_top_side_joint_L', 'mouth_top_tip_joint_L',
+    'mouth_bottom_middle_joint', 'mouth_bottom_side_joint_L', 'mouth_bottom_tip_joint_L',
+    'chin_joint', 'brow_middle_joint', 'nose_tip_joint', 'cheek_joint_L',
+]
+
+
+class FaceFrame(object):
+    '''the symmetry plane of a head and the frame built on it
+    '''
+    def __init__(self, left_eye, right_eye, up=(0.0, 1.0, 0.0)):
+        left_box = np.reshape(left_eye.bounding_box(), (2, 3))
+        right_box = np.reshape(right_eye.bounding_box(), (2, 3))
+        left_centre, right_centre = left_box.mean(axis=0), right_box.mean(axis=0)
+        self.origin = (left_centre + right_centre) / 2.0
+        x_axis = left_centre - right_centre
+        self.eye_distance = float(np.linalg.norm(x_axis))
+        if self.eye_distance == 0:
+            raise ValueError('the eye meshes must not share a centre')
+        x_axis /= self.eye_distance
+        y_axis = np.asarray(up, dtype=np.float64) - np.dot(up, x_axis) * x_axis
+        y_axis /= np.linalg.norm(y_axis)
+        # rows are the frame axes, so local = (world - origin) . axes.T
+        self.axes = np.array([x_axis, y_axis, np.cross(x_axis, y_axis)])
+        self.eye_radius = float((left_box[1] - left_box[0]).mean() / 2.0)
+        self.eye = self.to_local(left_centre)
+
+    @property
+    def plane(self):
+        '''the symmetry plane as (point, normal)
+        '''
+        return self.origin, self.axes[0]
+
+    def to_local(self, points):
+        return (np.asarray(points, dtype=np.float64) - self.origin).dot(self.axes.T)
+
+    def to_world(self, points):
+        return np.asarray(points, dtype=np.float64).dot(self.axes) + self.origin
+
+
+def _arg_best(score, mask):
+    '''index of the highest score where mask is set, None if the mask is empty
+    '''
+    if not mask.any():
+        return None
+    return int(np.flatnonzero(mask)[np.argmax(score[mask])])
+
+
+def project_to_front(local_points, front, targets, radius):
+    '''for every (x, y) target, the front-most head point within radius of it in the XY plane.
+    All targets are solved in one pass, a target with no point nearby widens its search
+    '''
+    candidates = local_points[front]
+    targets = np.asarray(targets, dtype=np.float64)
+    result = np.zeros((len(targets), 3))
+    pending = np.arange(len(targets))
+    while len(pending):
+        distance = ((candidates[None, :, :2] - targets[pending, None, :]) ** 2).sum(axis=2)
+        z = np.where(distance <= radius ** 2, candidates[None, :, 2], -np.inf)
+        best = np.argmax(z, axis=1)
+        found = np.isfinite(z[np.arange(len(pending)), best])
+        result[pending[found]] = candidates[best[found]]
+        pending = pending[~found]
+        radius *= 2.0
+    return result
+
+
+def detect_landmarks(head, left_eye, right_eye, up=(0.0, 1.0, 0.0)):
+    '''find the world position of the 24 face landmarks, returns (frame, {joint name: position})
+    '''
+    frame = FaceFrame(left_eye, right_eye, up)
+    d, r = frame.eye_distance, frame.eye_radius
+    eye_x, eye_y = frame.eye[0], frame.eye[1]
+    local = frame.to_local(head.points)
+    normals = vertex_normals(head)
+    local_normals = normals.dot(frame.axes.T)
+    curvature = vertex_curvature(head, normals)
+    x, y, z = local[:, 0], local[:, 1], local[:, 2]
+    # the front half of the head, measured from the middle of its bounding box in the face frame
+    low, high = local.min(axis=0), local.max(axis=0)
+    front = (local_normals[:, 2] > 0.3) & (z > (low[2] + high[2]) / 2.0)
+    bottom = low[1]
+
+    # nose tip: the front-most point on the middle of the face below the eyes
+    middle = front & (np.abs(x) < 0.25 * d)
+    nose = _arg_best(z, middle & (y < 0) & (y > -1.5 * d))
+    nose_y = y[nose] if nose is not None else -0.6 * d
+    # chin: the lowest front facing point of the middle band
+    chin = _arg_best(-y, middle & (local_normals[:, 2] > 0.5) & (y < nose_y))
+    chin_y = y[chin] if chin is not None else bottom
+    # lip line: the deepest crease on the middle line, a third to two thirds of the way from nose to chin
+    span = nose_y - chin_y
+    lips_band = front & (np.abs(x) < 0.1 * d) & (y < nose_y - 0.3 * span) & (y > nose_y - 0.65 * span)
+    lips = _arg_best(-curvature, lips_band)
+    mouth_y = y[lips] if lips is not None else nose_y - 0.45 * span
+    # mouth corner: the outermost concave point along the lip line
+    corner_band = front & (np.abs(y - mouth_y) < 0.06 * d) & (x > 0.15 * d) & (x < 0.55 * d)
+    concave = corner_band & (curvature < np.percentile(curvature[front], 25))
+    corner_x = x[concave].max() if concave.any() else 0.35 * d
+    # ear: the point furthest out to the left between mouth and eye height
+    ear = _arg_best(x, (y > mouth_y) & (y < eye_y + r))
+
+    targets = {
+        'eyebrow_01_joint_L': (eye_x - 0.9 * r, eye_y + 1.7 * r),
+        'eyebrow_02_joint_L': (eye_x, eye_y + 1.9 * r),
+        'eyebrow_03_joint_L': (eye_x + 0.9 * r, eye_y + 1.6 * r),
+        'eyelid_top_01_joint_L': (eye_x - 0.6 * r, eye_y + 0.85 * r),
+        'eyelid_top_02_joint_L': (eye_x, eye_y + 1.0 * r),
+        'eyelid_top_03_joint_L': (eye_x + 0.6 * r, eye_y + 0.85 * r),
+        'eyelid_bottom_01_joint_L': (eye_x - 0.6 * r, eye_y - 0.85 * r),
+        'eyelid_bottom_02_joint_L': (eye_x, eye_y - 1.0 * r),
+        'eyelid_bottom_03_joint_L': (eye_x + 0.6 * r, eye_y - 0.85 * r),
+        'nose_side_joint_L': (0.22 * d, nose_y + 0.05 * d),
+        'nose_fold_joint_L': (0.38 * d, (nose_y + mouth_y) / 2.0),
+        'squint_01_joint_L': (eye_x, eye_y - 1.9 * r),
+        'squint_02_joint_L': (eye_x + 1.7 * r, eye_y - 0.6 * r),
+        'mouth_top_middle_joint': (0.0, mouth_y + 0.08 * d),
+        'mouth_top_side_joint_L': (0.5 * corner_x, mouth_y + 0.07 * d),
+        'mouth_top_tip_joint_L': (0.95 * corner_x, mouth_y + 0.01 * d),
+        'mouth_bottom_middle_joint': (0.0, mouth_y - 0.1 * d),
+        'mouth_bottom_side_joint_L': (0.5 * corner_x, mouth_y - 0.09 * d),
+        'mouth_bottom_tip_joint_L': (0.9 * corner_x, mouth_y - 0.02 * d),
+        'chin_joint': (0.0, chin_y + 0.35 * (mouth_y - chin_y)),
+        'brow_middle_joint': (0.0, eye_y + 1.6 * r),
+        'cheek_joint_L': (eye_x + 0.5 * r, nose_y),
+    }
+    names = list(targets)
+    projected = project_to_front(local, front, [targets[name] for name in names], 0.04 * d)
+    positions = dict(zip(names, projected))
+    positions['nose_tip_joint'] = local[nose] if nose is not None else \
+        project_to_front(local, front, [(0.0, nose_y)], 0.04 * d)[0]
+    positions['ear_joint_L'] = local[ear] if ear is not None else \
+        np.array([x.max(), (mouth_y + eye_y) / 2.0, 0.0])
+
+    world = frame.to_world([positions[name] for name in FACE_JOINT_NAMES])
+    return frame, dict(zip(FACE_JOINT_NAMES, world))
+
+
+def nearest_faces(mesh, positions):
+    '''index of the face whose centre is nearest to each position, from the face tree of the mesh
+    '''
+    return mesh_index(mesh).nearest_faces(positions)
+
+
+def detect_face_picks(head, left_eye, right_eye, up=(0.0, 1.0, 0.0), names=FACE_JOINT_NAMES, search_mesh=None):
+    '''the face indices, in pick order, that the UI would otherwise collect by hand.
+    names are the joints of the picks, all of them have to be FACE_JOINT_NAMES. The landmarks are
+    found on search_mesh when it is given, a decimated copy of the head (see face_rig.proxy), and
+    snapped to the faces of the head
+    '''
+    unknown = [name for name in names if name not in FACE_JOINT_NAMES]
+    if unknown:
+        raise ValueError('no landmark is detected for %s' % ', '.join(unknown))
+    frame, positions = detect_landmarks(head if search_mesh is None else search_mesh, left_eye, right_eye, up)
+    return [int(face) for face in nearest_faces(head, [positions[name] for name in names])]
+
+
+def main(argv=None):
+    from face_rig.synthetic import make_head
+    parser = argparse.ArgumentParser(description='Time the landmark detection on synthetic heads.')
+    parser.add_argument('--faces', type=int, nargs='+', default=[10000, 100000, 500000])
+    args = parser.parse_args(argv)
+    for face_count in args.faces:
+        meshes = make_head(face_count)
+        start = time.perf_counter()
+        picks = detect_face_picks(meshes['Head'], meshes['Left_eye'], meshes['Right_eye'])
+        elapsed = time.perf_counter() - start
+        print('%8d faces  %.3f s  %d picks' % (meshes['Head'].num_faces, elapsed, len(picks)))
+
+
+if __name__ == '__main__':
+    main()
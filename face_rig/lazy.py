@@ -0,0 +1,45 @@
+'''Modules imported the first time they are used.
+
+Importing face_rig.stages, which the Maya UI and the batch driver start
+from, should not import NumPy and every module of the package before a
+button is pressed. A module that only some stages need is named with
+lazy_import instead:
+
+    skinning = lazy_import('face_rig.skinning')
+
+and is imported when one of its attributes is read, skinning.heat_weights
+here, from then on it is the module itself that answers.
+'''
+import importlib
+import sys
+
+
+class LazyModule(object):
+    '''stands in for a module until one of its attributes is read
+    '''
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        if self._module is None:
+            self.__dict__['_module'] = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __setattr__(self, attribute, value):
+        setattr(self._load(), attribute, value)
+
+    def __repr__(self):
+        state = 'imported' if self._module is not None else 'not imported yet'
+        return '<lazy module %r, %s>' % (self._name, state)
+
+
+def lazy_import(name):
+    '''the module called name when it is already imported, a LazyModule for it otherwise
+    '''
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
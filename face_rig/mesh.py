@@ -0,0 +1,152 @@
+'''Maya independent mesh data.
+
+A mesh is kept as flat NumPy arrays in the same layout Maya uses internally:
+the vertex positions, the number of vertices of every face and the flattened
+vertex indices of all the faces.
+'''
+import numpy as np
+
+
+class Mesh(object):
+    '''Vertex positions and face-vertex connectivity of a polygon mesh
+    '''
+    def __init__(self, points, face_counts, face_connects, name=None):
+        self.name = name
+        # float32 points and int32 indices are kept as they are, so memory-mapped arrays stay mapped
+        points = np.asarray(points)
+        if points.dtype not in (np.float32, np.float64):
+            points = points.astype(np.float64)
+        self.points = points.reshape(-1, 3)
+        self.face_counts = np.asarray(face_counts, dtype=np.int32).ravel()
+        self.face_connects = np.asarray(face_connects, dtype=np.int32).ravel()
+        # start of every face in face_connects, with the total as the last entry
+        self.face_offsets = np.zeros(len(self.face_counts) + 1, dtype=np.int64)
+        np.cumsum(self.face_counts, out=self.face_offsets[1:])
+
+    def __repr__(self):
+        return 'Mesh(%r, %d points, %d faces)' % (self.name, self.num_points, self.num_faces)
+
+    @property
+    def num_points(self):
+        return len(self.points)
+
+    @property
+    def num_faces(self):
+        return len(self.face_counts)
+
+    def face_vertex_indices(self, face_indices):
+        '''returns the flattened vertex indices of the given faces and the vertex count of each face
+        '''
+        face_indices = np.asarray(face_indices, dtype=np.int64).ravel()
+        counts = self.face_counts[face_indices].astype(np.int64)
+        starts = self.face_offsets[face_indices]
+        # offset of every face inside the gathered array, repeated once per face vertex
+        local_starts = np.cumsum(counts) - counts
+        flat = np.arange(counts.sum()) + np.repeat(starts - local_starts, counts)
+        return self.face_connects[flat], counts
+
+    def face_centroids(self, face_indices=None):
+        '''average position of the vertices of each face, all faces computed in one vectorized pass
+        '''
+        if face_indices is None:
+            face_indices = np.arange(self.num_faces)
+        face_indices = np.asarray(face_indices, dtype=np.int64).ravel()
+        if not len(face_indices):
+            return np.zeros((0, 3))
+        vertex_indices, counts = self.face_vertex_indices(face_indices)
+        group_starts = np.cumsum(counts) - counts
+        sums = np.add.reduceat(self.points[vertex_indices], group_starts, axis=0)
+        return sums / counts[:, None]
+
+    def bounding_box(self):
+        '''[xmin, ymin, zmin, xmax, ymax, zmax] of the points, laid out like cmds.exactWorldBoundingBox
+        '''
+        return bounding_box(self.points)
+
+    def width(self):
+        '''size of the mesh along X
+        '''
+        bbox = self.bounding_box()
+        return bbox[3] - bbox[0]
+
+
+def bounding_box(points):
+    '''[xmin, ymin, zmin, xmax, ymax, zmax] of an array of points
+    '''
+    points = np.asarray(points).reshape(-1, 3)
+    return points.min(axis=0).tolist() + points.max(axis=0).tolist()
+
+
+def bounding_box_center(bbox):
+    '''centre of a [xmin, ymin, zmin, xmax, ymax, zmax] bounding box
+    '''
+    return [(bbox[0] + bbox[3]) / 2.0, (bbox[1] + bbox[4]) / 2.0, (bbox[2] + bbox[5]) / 2.0]
+
+
+def distance(point_a, point_b):
+    '''distance between two points, or between matching rows of two arrays of points
+    '''
+    return np.linalg.norm(np.asarray(point_b, dtype=np.float64) - np.asarray(point_a, dtype=np.float64), axis=-1)
+
+
+def _next_corners(mesh):
+    '''index of the next corner of the same face for every entry of face_connects
+    '''
+    following = np.arange(1, len(mesh.face_connects) + 1)
+    following[mesh.face_offsets[1:] - 1] = mesh.face_offsets[:-1]
+    return following
+
+
+def face_edges(mesh):
+    '''(start, end) vertex arrays of the edge leaving every corner of every face, an edge between two
+    faces once from each
+    '''
+    start = mesh.face_connects.astype(np.int64)
+    return start, start[_next_corners(mesh)]
+
+
+def edges(mesh):
+    '''unique undirected edges of a mesh as an (n, 2) array, the lower vertex index first
+    '''
+    start, end = face_edges(mesh)
+    low, high = np.minimum(start, end), np.maximum(start, end)
+    keys = np.unique(low * mesh.num_points + high)
+    return np.c_[keys // mesh.num_points, keys % mesh.num_points]
+
+
+def face_normals(mesh):
+    '''area weighted normal of every face (Newell's method, so n-gons work too)
+    '''
+    corners = mesh.points[mesh.face_connects].astype(np.float64)
+    crosses = np.cross(corners, corners[_next_corners(mesh)])
+    return 0.5 * np.add.reduceat(crosses, mesh.face_offsets[:-1], axis=0)
+
+
+def vertex_normals(mesh):
+    '''unit normal of every vertex, the area weighted average of the normals of its faces
+    '''
+    corner_normals = np.repeat(face_normals(mesh), mesh.face_counts, axis=0)
+    normals = np.stack([np.bincount(mesh.face_connects, weights=corner_normals[:, axis], minlength=mesh.num_points)
+                        for axis in range(3)], axis=1)
+    lengths = np.linalg.norm(normals, axis=1)
+    return normals / np.where(lengths == 0, 1.0, lengths)[:, None]
+
+
+def vertex_curvature(mesh, normals=None):
+    '''signed mean curvature estimate of every vertex from the uniform Laplacian:
+    positive on bumps such as the nose tip, negative in creases such as the lip line
+    '''
+    if normals is None:
+        normals = vertex_normals(mesh)
+    edge_list = edges(mesh)
+    ends = np.r_[edge_list[:, 0], edge_list[:, 1]]
+    others = np.r_[edge_list[:, 1], edge_list[:, 0]]
+    points = mesh.points.astype(np.float64)
+    degree = np.maximum(np.bincount(ends, minlength=mesh.num_points), 1)
+    neighbour_mean = np.stack([np.bincount(ends, weights=points[others, axis], minlength=mesh.num_points)
+                               for axis in range(3)], axis=1) / degree[:, None]
+    lengths_squared = ((points[edge_list[:, 0]] - points[edge_list[:, 1]]) ** 2).sum(axis=1)
+    mean_length_squared = np.bincount(ends, weights=np.r_[lengths_squared, lengths_squared],
+                                      minlength=mesh.num_points) / degree
+    offset = ((neighbour_mean - points) * normals).sum(axis=1)
+    return -2.0 * offset / np.where(mean_length_squared == 0, 1.0, mean_length_squared)
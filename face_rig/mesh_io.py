@@ -0,0 +1,237 @@
+'''Reading meshes from disk without Maya.
+
+OBJ files are parsed with NumPy over the whole file at once instead of line by
+line, and can be stored in a compact binary cache that is memory-mapped when
+it is read back, so a scan is only parsed the first time it is used:
+
+    meshes = load_meshes('heads/hero.obj')    # writes heads/hero.frmesh
+    head = meshes['Head']
+
+Cache layout: the 8 byte magic, a little endian uint32 header length, a JSON
+header listing every object with the byte offset and length of its arrays,
+then the arrays themselves (float32 points, int32 face counts and connects),
+each starting on a 16 byte boundary.
+'''
+import json
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+from face_rig.mesh import Mesh
+
+CACHE_MAGIC = b'FRMESH01'
+CACHE_EXTENSION = '.frmesh'
+_ALIGN = 16
+
+_SPACE, _TAB, _NEWLINE, _RETURN, _SLASH = 32, 9, 10, 13, 47
+
+
+def _line_bytes(buf, starts, ends, lines):
+    '''the bytes of the given lines joined together, with the one letter keyword of each line blanked
+    '''
+    if not len(lines):
+        return np.zeros(0, dtype=np.uint8)
+    if lines[-1] - lines[0] + 1 == len(lines):
+        # the usual layout, all the lines of a kind are written in one block
+        selected = np.r_[buf[starts[lines[0]]:ends[lines[-1]]], _NEWLINE].astype(np.uint8)
+        selected[starts[lines] - starts[lines[0]]] = _SPACE
+        return selected
+    lengths = ends[lines] - starts[lines] + 1
+    line_starts = np.cumsum(lengths) - lengths
+    # index of every byte of every selected line, the trailing newline included
+    index = np.arange(lengths.sum()) + np.repeat(starts[lines] - line_starts, lengths)
+    selected = np.r_[buf, _NEWLINE][index]
+    selected[line_starts] = _SPACE
+    return selected
+
+
+def _whitespace(chars):
+    return (chars == _SPACE) | (chars == _TAB) | (chars == _NEWLINE) | (chars == _RETURN)
+
+
+def _tokens_per_line(chars, line_count):
+    '''number of whitespace separated values on each line of chars
+    '''
+    space = _whitespace(chars)
+    token_starts = ~space & np.r_[True, space[:-1]]
+    line_of_char = np.cumsum(chars == _NEWLINE) - (chars == _NEWLINE)
+    return np.bincount(line_of_char[token_starts], minlength=line_count)
+
+
+def parse_obj(data):
+    '''parse the bytes of an OBJ file into a list of (name, Mesh), one per object or group
+    '''
+    buf = np.frombuffer(data, dtype=np.uint8)
+    if not len(buf):
+        return []
+    ends = np.flatnonzero(buf == _NEWLINE)
+    if not len(ends) or ends[-1] != len(buf) - 1:
+        ends = np.append(ends, len(buf))
+    starts = np.r_[0, ends[:-1] + 1]
+    padded = np.r_[buf, 0, 0]
+    first, second = padded[starts], padded[starts + 1]
+    keyword_end = (second == _SPACE) | (second == _TAB)
+    vertex_lines = np.flatnonzero((first == ord('v')) & keyword_end)
+    face_lines = np.flatnonzero((first == ord('f')) & keyword_end)
+    object_lines = np.flatnonzero(((first == ord('o')) | (first == ord('g'))) & keyword_end)
+
+    # vertices: a single text to float conversion over all 'v' lines
+    chars = _line_bytes(buf, starts, ends, vertex_lines)
+    values = np.fromstring(chars.tobytes(), sep=' ')
+    if not len(vertex_lines):
+        points = np.zeros((0, 3))
+    elif len(values) == 3 * len(vertex_lines):
+        points = values.reshape(-1, 3)
+    else:
+        # some lines carry a w or a vertex colour, keep the first three values of every line
+        counts = _tokens_per_line(chars, len(vertex_lines))
+        points = values[(np.cumsum(counts) - counts)[:, None] + np.arange(3)]
+
+    # faces: drop the /texture/normal part of every corner, then count the corners of each line
+    chars = _line_bytes(buf, starts, ends, face_lines)
+    space = _whitespace(chars)
+    slashes = np.cumsum(chars == _SLASH)
+    slashes_before_token = np.maximum.accumulate(np.where(space, slashes, 0))
+    chars = np.where(space | (slashes == slashes_before_token), chars, _SPACE).astype(np.uint8)
+    face_counts = _tokens_per_line(chars, len(face_lines)).astype(np.int32)
+    connects = np.fromstring(chars.tobytes(), sep=' ', dtype=np.int64)
+    # negative indices count back from the vertices read so far, positive ones start at 1
+    vertices_before = np.searchsorted(vertex_lines, face_lines)
+    corner_vertices_before = np.repeat(vertices_before, face_counts)
+    connects = np.where(connects < 0, corner_vertices_before + connects, connects - 1)
+
+    # objects: every o or g line starts a new one, faces before the first go to a default object
+    names = [bytes(buf[starts[line] + 2:ends[line]]).strip().decode('utf8', 'replace') for line in object_lines]
+    face_object = np.searchsorted(object_lines, face_lines)
+    names = ['polySurface1'] + names
+    if len(face_lines) and (face_object == face_object[0]).all():
+        # a single object keeps the file's vertex list as it is
+        name = names[face_object[0]]
+        return [(name, Mesh(points, face_counts, connects, name=name))]
+    meshes = []
+    face_offsets = np.r_[0, np.cumsum(face_counts)]
+    merged = {}
+    for index, name in enumerate(names):
+        faces = np.flatnonzero(face_object == index)
+        if len(faces):
+            merged.setdefault(name, []).append(faces)
+    for name, faces in merged.items():
+        faces = np.concatenate(faces)
+        counts = face_counts[faces]
+        corners = np.arange(counts.sum()) + np.repeat(face_offsets[faces] - (np.cumsum(counts) - counts), counts)
+        # every object gets its own vertex list, holding only the vertices its faces use
+        used, local = np.unique(connects[corners], return_inverse=True)
+        meshes.append((name, Mesh(points[used], counts, local, name=name)))
+    return meshes
+
+
+def load_obj(path):
+    '''read an OBJ file, returns a dict of object name to Mesh in file order
+    '''
+    with open(path, 'rb') as obj_file:
+        return dict(parse_obj(obj_file.read()))
+
+
+def save_obj(meshes, path):
+    '''write a dict of name to Mesh as an OBJ file, one object per mesh
+    '''
+    with open(path, 'w') as obj_file:
+        first_vertex = 1
+        for name, mesh in meshes.items():
+            obj_file.write('o %s\n' % name)
+            obj_file.write(''.join('v %.6f %.6f %.6f\n' % tuple(point) for point in mesh.points.tolist()))
+            connects = (mesh.face_connects.astype(np.int64) + first_vertex).tolist()
+            offsets = mesh.face_offsets.tolist()
+            obj_file.write(''.join('f %s\n' % ' '.join(map(str, connects[offsets[face]:offsets[face + 1]]))
+                                   for face in range(mesh.num_faces)))
+            first_vertex += mesh.num_points
+
+
+def save_cache(meshes, path):
+    '''write a dict of name to Mesh to a binary mesh cache
+    '''
+    objects = []
+    arrays = []
+    offset = 0
+    for name, mesh in meshes.items():
+        entry = {'name': name}
+        for key, array in (('points', mesh.points.astype(np.float32)),
+                           ('face_counts', mesh.face_counts.astype(np.int32)),
+                           ('face_connects', mesh.face_connects.astype(np.int32))):
+            array = np.ascontiguousarray(array)
+            entry[key] = [offset, array.shape[0]]
+            arrays.append((offset, array))
+            offset += -(-array.nbytes // _ALIGN) * _ALIGN
+        objects.append(entry)
+    header = json.dumps({'version': 1, 'objects': objects}).encode('utf8')
+    data_start = -(-(len(CACHE_MAGIC) + 4 + len(header)) // _ALIGN) * _ALIGN
+    # written next to the target and swapped in, so parallel workers never read half a cache
+    temp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(temp_path, 'wb') as cache_file:
+        cache_file.write(CACHE_MAGIC + struct.pack('<I', len(header)) + header)
+        for array_offset, array in arrays:
+            cache_file.seek(data_start + array_offset)
+            cache_file.write(array.tobytes())
+        cache_file.truncate(data_start + offset)
+    os.replace(temp_path, path)
+
+
+def load_cache(path):
+    '''memory-map a binary mesh cache, returns a dict of name to Mesh whose arrays live in the file
+    '''
+    with open(path, 'rb') as cache_file:
+        magic = cache_file.read(len(CACHE_MAGIC))
+        if magic != CACHE_MAGIC:
+            raise ValueError('%s is not a mesh cache' % path)
+        header_length = struct.unpack('<I', cache_file.read(4))[0]
+        header = json.loads(cache_file.read(header_length).decode('utf8'))
+    data_start = -(-(len(CACHE_MAGIC) + 4 + header_length) // _ALIGN) * _ALIGN
+    data = np.memmap(path, dtype=np.uint8, mode='r')
+    meshes = {}
+    for entry in header['objects']:
+        def view(key, dtype, columns=1):
+            offset, rows = entry[key]
+            start = data_start + offset
+            array = data[start:start + rows * columns * np.dtype(dtype).itemsize].view(dtype)
+            return array.reshape(rows, columns) if columns > 1 else array
+        meshes[entry['name']] = Mesh(view('points', np.float32, 3), view('face_counts', np.int32),
+                                     view('face_connects', np.int32), name=entry['name'])
+    return meshes
+
+
+def cache_path(path):
+    return os.path.splitext(path)[0] + CACHE_EXTENSION
+
+
+def load_meshes(path, use_cache=True):
+    '''read the meshes of an OBJ file or a mesh cache. An OBJ is read through the cache next
+    to it, which is written the first time and again whenever the OBJ is newer
+    '''
+    if path.endswith(CACHE_EXTENSION):
+        return load_cache(path)
+    if not use_cache:
+        return load_obj(path)
+    cached = cache_path(path)
+    if os.path.exists(cached) and os.path.getmtime(cached) >= os.path.getmtime(path):
+        return load_cache(cached)
+    meshes = load_obj(path)
+    save_cache(meshes, cached)
+    return meshes
+
+
+if __name__ == '__main__':
+    # python -m face_rig.mesh_io scan.obj, builds the cache and reports the load times
+    for obj_path in sys.argv[1:]:
+        start = time.perf_counter()
+        obj_meshes = load_obj(obj_path)
+        parsed = time.perf_counter()
+        save_cache(obj_meshes, cache_path(obj_path))
+        saved = time.perf_counter()
+        load_cache(cache_path(obj_path))
+        loaded = time.perf_counter()
+        for mesh in obj_meshes.values():
+            print(mesh)
+        print('parse %.3fs, write cache %.3fs, map cache %.4fs' % (parsed - start, saved - parsed, loaded - saved))
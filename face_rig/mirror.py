@@ -0,0 +1,78 @@
+'''Mirroring the left side joints of the rig to the right side.
+
+The left joints come from the rig template instead of a scan of the scene,
+their world matrices are read with one query, reflected across the YZ plane
+in one NumPy operation and the right side joints are made with one call to
+the scene backend, so mirroring costs the same however many other nodes the
+scene holds.
+
+The reflection is Maya's mirror behaviour: the position and the joint axes
+are reflected, then the three axes are turned around so the mirrored frame is
+right handed again and the same rotation on both sides moves them as mirror
+images of each other.
+
+Given the head mesh, a mirrored joint follows the surface instead: it keeps
+its offset from the mirror vertex of the vertex nearest to the left joint,
+found in the symmetry map of face_rig.spatial, so the right joints of a head
+that is not quite symmetric still sit where the left ones sit on their side.
+'''
+import numpy as np
+
+from face_rig.scene import cmds, get_scene
+from face_rig.spatial import REFLECTION, mesh_index
+
+# elementwise signs turning a row vector world matrix into its reflection across the YZ plane,
+# the rows are the axes and the translation, the columns x, y and z
+BEHAVIOR_SIGNS = np.outer([-1.0, -1.0, -1.0, 1.0], [-1.0, 1.0, 1.0, 1.0])
+ORIENTATION_SIGNS = np.outer([-1.0, 1.0, 1.0, 1.0], [-1.0, 1.0, 1.0, 1.0])
+
+
+def reflect_matrices(matrices, behavior=True):
+    '''reflect (n, 4, 4) world matrices across the YZ plane, with mirror behaviour or with the
+    axes only reflected, Maya's orientation mode
+    '''
+    return np.asarray(matrices, dtype=np.float64) * (BEHAVIOR_SIGNS if behavior else ORIENTATION_SIGNS)
+
+
+def _depth(joint, parents):
+    depth = 0
+    while joint in parents:
+        joint = parents[joint]
+        depth += 1
+    return depth
+
+
+def follow_surface(mesh, positions, mirrored_positions):
+    '''move mirrored positions onto the mirror side of a mesh: every position keeps its offset from
+    the mirror vertex of the vertex nearest to the original. Positions whose vertex has no mirror vertex stay
+    '''
+    index = mesh_index(mesh)
+    positions = np.asarray(positions, dtype=np.float64)
+    result = np.array(mirrored_positions, dtype=np.float64)
+    vertices = index.nearest_vertices(positions)
+    counterparts = index.mirror_vertices(vertices)
+    found = counterparts >= 0
+    points = mesh.points
+    offsets = (positions[found] - points[vertices[found]]) * REFLECTION
+    result[found] = points[counterparts[found]] + offsets
+    return result
+
+
+def mirror_joints(joints, parents, search='_L', replace='_R', radius=1.0, mesh=None):
+    '''create the mirror of every given joint that exists, named with search replaced by replace.
+    parents maps a joint to its parent, a mirrored joint goes under the mirror of its parent when
+    that is mirrored too, under the same parent otherwise. With a mesh the mirrored joints follow
+    its surface, see follow_surface. Returns the names of the new joints
+    '''
+    existing = cmds.ls(joints, type='joint') or []
+    if not existing:
+        return []
+    # parents before their children, so a mirrored parent exists when its children are made
+    existing.sort(key=lambda joint: _depth(joint, parents))
+    matrices = np.reshape(cmds.xform(existing, query=True, worldSpace=True, matrix=True), (-1, 4, 4))
+    mirrored = reflect_matrices(matrices)
+    if mesh is not None:
+        mirrored[:, 3, :3] = follow_surface(mesh, matrices[:, 3, :3], mirrored[:, 3, :3])
+    names = dict((joint, joint.replace(search, replace)) for joint in existing)
+    mirrored_parents = [names.get(parents.get(joint), parents.get(joint)) for joint in existing]
+    return get_scene().create_joints([names[joint] for joint in existing], mirrored, mirrored_parents, radius)
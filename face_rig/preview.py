@@ -0,0 +1,347 @@
+'''Posing and baking a skinned head without Maya.
+
+A preview rig is everything linear blend skinning needs, taken from the
+scene once: the joint hierarchy with the bind pose local matrix of every
+joint, the sparse skin weights (face_rig.skinning.SkinWeights) and the bind
+points of the mesh. It is saved to a small .frrig file, so the head can be
+posed on a farm machine that has only NumPy:
+
+    rig = preview.PreviewRig.from_scene('Head')
+    rig.save('hero.frrig')
+
+    rig = preview.PreviewRig.load('hero.frrig')
+    translate, rotate = preview.turntable(rig.skeleton, 240)
+    points, stats = preview.bake(rig, translate, rotate, 'hero_turntable.npy', workers=4)
+
+A pose is a translate and a rotate offset of every joint from its bind pose,
+(frames, joints, 3) arrays in the order of skeleton.joint_names. The rotate
+is in degrees about the joint's own axes, the translate is in the space of
+its parent. The world matrices of all the frames are worked out a hierarchy
+level at a time and the mesh is deformed by face_rig.skinning.deform, many
+frames per call. Long sequences are cut into frame ranges spread over a pool
+of worker processes, which write straight into the memory-mapped cache file,
+a (frames, points, 3) float32 .npy file:
+
+    python -m face_rig.preview hero.frrig --turntable 240 --workers 4 --cache hero_turntable.npy
+    python -m face_rig.preview hero.frrig --animation blink.json
+
+An animation file lists the offsets of the joints it moves frame by frame,
+joints and channels it leaves out stay at the bind pose:
+
+    {"joints": {"jaw_joint": {"rotate": [[0, 0, 0], [5, 0, 0], [10, 0, 0]]}}}
+'''
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from face_rig import skinning
+from face_rig.scene import cmds, get_scene
+from face_rig.shapes import rotation_matrices
+
+RIG_EXTENSION = '.frrig'
+# frames times points deformed in one call, bounds the (frames, points, 3) array of a batch
+BATCH_POINTS = 1 << 22
+# shorter sequences are not worth starting worker processes for
+POOL_FRAMES = 64
+
+_worker_rig = None
+
+
+class Skeleton(object):
+    '''a joint hierarchy: parents holds the index of the parent of every joint, -1 for a root, and
+    every parent comes before its children. bind_local is the (joints, 4, 4) row vector local matrix
+    of every joint in the bind pose
+    '''
+    def __init__(self, joint_names, parents, bind_local):
+        self.joint_names = list(joint_names)
+        self.parents = np.asarray(parents, dtype=np.int64)
+        self.bind_local = np.asarray(bind_local, dtype=np.float64).reshape(-1, 4, 4)
+        self._index = dict((name, index) for index, name in enumerate(self.joint_names))
+        depth = np.zeros(len(self.parents), dtype=np.int64)
+        for joint, parent in enumerate(self.parents):
+            if parent >= joint:
+                raise ValueError('joint %s comes before its parent' % self.joint_names[joint])
+            if parent >= 0:
+                depth[joint] = depth[parent] + 1
+        # the joints of every depth, a level's world matrices only need the level above it
+        self.levels = [np.flatnonzero(depth == level) for level in range(depth.max() + 1 if len(depth) else 0)]
+        self.bind_world = self.world_matrices(self.bind_local[None])[0]
+        self.bind_inverse = np.linalg.inv(self.bind_world)
+
+    def __len__(self):
+        return len(self.joint_names)
+
+    def index(self, name):
+        return self._index[name]
+
+    @classmethod
+    def from_scene(cls, joint_names):
+        '''the hierarchy of the joints and every joint above them as it is in the scene, which should
+        be in the bind pose
+        '''
+        parent_of = {}
+        pending = list(joint_names)
+        while pending:
+            name = pending.pop()
+            if name in parent_of:
+                continue
+            parents = cmds.listRelatives(name, parent=True, type='joint')
+            parent_of[name] = parents[0] if parents else None
+            if parents:
+                pending.append(parents[0])
+        ordered = []
+        placed = set()
+
+        def place(name):
+            if name not in placed:
+                if parent_of[name] is not None:
+                    place(parent_of[name])
+                placed.add(name)
+                ordered.append(name)
+
+        for name in sorted(parent_of):
+            place(name)
+        world = np.reshape(cmds.xform(ordered, query=True, worldSpace=True, matrix=True), (-1, 4, 4))
+        index = dict((name, position) for position, name in enumerate(ordered))
+        parents = [index[parent_of[name]] if parent_of[name] is not None else -1 for name in ordered]
+        local = world.copy()
+        for joint, parent in enumerate(parents):
+            if parent >= 0:
+                local[joint] = world[joint].dot(np.linalg.inv(world[parent]))
+        return cls(ordered, parents, local)
+
+    def channels(self, frames):
+        '''zero translate and rotate offsets for a number of frames, the bind pose
+        '''
+        return np.zeros((frames, len(self), 3)), np.zeros((frames, len(self), 3))
+
+    def local_matrices(self, translate, rotate):
+        '''(frames, joints, 4, 4) local matrices of the joints posed by (frames, joints, 3) offsets
+        '''
+        translate = np.asarray(translate, dtype=np.float64).reshape(-1, len(self), 3)
+        rotate = np.asarray(rotate, dtype=np.float64).reshape(-1, len(self), 3)
+        # the rotation comes before the bind matrix, so the joint turns about its own axes and pivot
+        result = np.empty((len(rotate), len(self), 4, 4))
+        result[:, :, :3] = np.matmul(rotation_matrices(rotate).reshape(rotate.shape + (3,)),
+                                     self.bind_local[None, :, :3, :])
+        result[:, :, 3] = self.bind_local[None, :, 3]
+        result[:, :, 3, :3] += translate
+        return result
+
+    def world_matrices(self, local):
+        '''(frames, joints, 4, 4) world matrices of local matrices, a level of the hierarchy at a time
+        '''
+        world = np.array(local, dtype=np.float64)
+        for level in self.levels[1:]:
+            world[:, level] = np.matmul(world[:, level], world[:, self.parents[level]])
+        return world
+
+    def skin_matrices(self, translate, rotate, joint_names=None):
+        '''(frames, joints, 4, 4) skinning matrices, bind inverse times posed world, of joint_names,
+        every joint of the skeleton when it is None
+        '''
+        world = self.world_matrices(self.local_matrices(translate, rotate))
+        skinned = np.arange(len(self)) if joint_names is None else [self._index[name] for name in joint_names]
+        return np.matmul(self.bind_inverse[skinned][None], world[:, skinned])
+
+
+class PreviewRig(object):
+    '''a skeleton, the skin weights of its joints and the bind points of the mesh
+    '''
+    def __init__(self, skeleton, weights, points):
+        self.skeleton = skeleton
+        self.weights = weights
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        missing = [name for name in weights.joint_names if name not in skeleton._index]
+        if missing:
+            raise ValueError('the skeleton has no %s' % ', '.join(missing))
+
+    def __repr__(self):
+        return 'PreviewRig(%d joints, %d points)' % (len(self.skeleton), len(self.points))
+
+    @classmethod
+    def from_scene(cls, mesh_name, skin_cluster=None):
+        '''the preview rig of a skinned mesh, the scene should be in the bind pose
+        '''
+        if skin_cluster is None:
+            skin_clusters = cmds.ls(cmds.listHistory(mesh_name), type='skinCluster')
+            if not skin_clusters:
+                raise ValueError('%s is not skinned' % mesh_name)
+            skin_cluster = skin_clusters[0]
+        weights = get_scene().get_skin_weights(skin_cluster)
+        return cls(Skeleton.from_scene(weights.joint_names), weights, get_scene().read_mesh(mesh_name).points)
+
+    def evaluate(self, translate, rotate):
+        '''(frames, points, 3) points of the mesh posed by (frames, joints, 3) offsets
+        '''
+        matrices = self.skeleton.skin_matrices(translate, rotate, self.weights.joint_names)
+        return skinning.deform(self.points, self.weights, matrices)
+
+    def batch_frames(self):
+        '''how many frames to deform per call
+        '''
+        return max(1, BATCH_POINTS // max(1, len(self.points)))
+
+    def save(self, path):
+        '''write the rig to an uncompressed NumPy .npz file
+        '''
+        with open(path, 'wb') as rig_file:
+            np.savez(rig_file, joint_names=np.array(self.skeleton.joint_names), parents=self.skeleton.parents,
+                     bind_local=self.skeleton.bind_local, skinned=np.array(self.weights.joint_names),
+                     offsets=self.weights.offsets, joint_indices=self.weights.joint_indices,
+                     weights=self.weights.weights, points=self.points)
+
+    @classmethod
+    def load(cls, path):
+        '''the rig saved in a rig file
+        '''
+        with np.load(path) as data:
+            skeleton = Skeleton([str(name) for name in data['joint_names']], data['parents'], data['bind_local'])
+            weights = skinning.SkinWeights([str(name) for name in data['skinned']], data['offsets'],
+                                           data['joint_indices'], data['weights'])
+            return cls(skeleton, weights, data['points'])
+
+
+def turntable(skeleton, frames, joint=None, axis=1):
+    '''offsets turning a joint, the first root when none is given, once around an axis of its own
+    over the frames
+    '''
+    translate, rotate = skeleton.channels(frames)
+    index = np.flatnonzero(skeleton.parents < 0)[0] if joint is None else skeleton.index(joint)
+    rotate[:, index, axis] = np.arange(frames) * 360.0 / frames
+    return translate, rotate
+
+
+def load_animation(path, skeleton):
+    '''the (frames, joints, 3) translate and rotate offsets of an animation file, a channel shorter
+    than the animation holds its last value
+    '''
+    with open(path) as animation_file:
+        animation = json.load(animation_file)
+    channels = animation.get('joints', {})
+    frames = max([len(values) for joint in channels.values() for values in joint.values()] or [0])
+    if not frames:
+        raise ValueError('%s has no frames' % path)
+    translate, rotate = skeleton.channels(frames)
+    for name, joint in channels.items():
+        if name not in skeleton._index:
+            raise ValueError('%s animates %s, the rig has no joint of that name' % (path, name))
+        for channel, values in joint.items():
+            if channel not in ('translate', 'rotate'):
+                raise ValueError('%s animates %s.%s, only translate and rotate can be set' % (path, name, channel))
+            target = translate if channel == 'translate' else rotate
+            values = np.asarray(values, dtype=np.float64).reshape(-1, 3)
+            target[:len(values), skeleton.index(name)] = values
+            target[len(values):, skeleton.index(name)] = values[-1]
+    return translate, rotate
+
+
+def _start_worker(rig):
+    '''process pool initializer, keeps the rig so it is sent to every worker once
+    '''
+    global _worker_rig
+    _worker_rig = rig
+
+
+def _deform_range(start, translate, rotate, cache_path):
+    '''deform the frames from start in the worker, into the cache when there is one
+    '''
+    rig = _worker_rig
+    begin = time.perf_counter()
+    result = np.empty((len(translate), len(rig.points), 3), dtype=np.float32)
+    step = rig.batch_frames()
+    for first in range(0, len(translate), step):
+        result[first:first + step] = rig.evaluate(translate[first:first + step], rotate[first:first + step])
+    if cache_path is not None:
+        cache = np.load(cache_path, mmap_mode='r+')
+        cache[start:start + len(result)] = result
+        cache.flush()
+        del cache
+        result = None
+    return start, result, time.perf_counter() - begin
+
+
+def bake(rig, translate, rotate, cache_path=None, workers=None, chunk=None):
+    '''deform the mesh for every frame of the offsets. With cache_path the points are written to a
+    (frames, points, 3) float32 .npy file and None is returned in place of them. Sequences of
+    POOL_FRAMES or more are spread over workers processes, the CPU count when it is None, in ranges
+    of chunk frames. Returns the points and the stats of the bake, its frames per second among them
+    '''
+    global _worker_rig
+    translate = np.asarray(translate, dtype=np.float64).reshape(-1, len(rig.skeleton), 3)
+    rotate = np.asarray(rotate, dtype=np.float64).reshape(-1, len(rig.skeleton), 3)
+    frames = len(translate)
+    workers = workers or os.cpu_count() or 1
+    if frames < POOL_FRAMES:
+        workers = 1
+    chunk = chunk or max(1, min(rig.batch_frames(), -(-frames // (workers * 4))))
+    start = time.perf_counter()
+    points = None
+    if cache_path is not None:
+        np.lib.format.open_memmap(cache_path, mode='w+', dtype=np.float32, shape=(frames, len(rig.points), 3)).flush()
+    else:
+        points = np.empty((frames, len(rig.points), 3), dtype=np.float32)
+    ranges = [(first, translate[first:first + chunk], rotate[first:first + chunk], cache_path)
+              for first in range(0, frames, chunk)]
+    if workers == 1:
+        previous, _worker_rig = _worker_rig, rig
+        try:
+            results = [_deform_range(*arguments) for arguments in ranges]
+        finally:
+            _worker_rig = previous
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_start_worker,
+                                                    initargs=(rig,)) as pool:
+            results = list(pool.map(_deform_range, *zip(*ranges)))
+    for first, result, seconds in results:
+        if result is not None:
+            points[first:first + len(result)] = result
+    seconds = time.perf_counter() - start
+    stats = {
+        'frames': frames,
+        'points': len(rig.points),
+        'workers': workers,
+        'chunk': chunk,
+        'seconds': round(seconds, 6),
+        'fps': round(frames / seconds, 3) if seconds > 0 else None,
+        'worker_seconds': round(sum(seconds for first, result, seconds in results), 6),
+    }
+    return points, stats
+
+
+def format_stats(stats):
+    return '%d frames of %d points in %.3f seconds on %d workers, %.1f fps' % (
+        stats['frames'], stats['points'], stats['seconds'], stats['workers'], stats['fps'] or 0.0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Pose a saved preview rig without Maya and bake its frames.')
+    parser.add_argument('rig', help='preview rig file saved from the Skinning tab or PreviewRig.save')
+    poses = parser.add_mutually_exclusive_group(required=True)
+    poses.add_argument('--turntable', type=int, metavar='FRAMES', help='turn the root joint once around Y')
+    poses.add_argument('--animation', help='JSON file with the translate and rotate offsets of the joints')
+    parser.add_argument('--cache', help='write the posed points to this .npy file')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, defaults to the CPU count')
+    parser.add_argument('--report', help='write the bake stats to this JSON file')
+    args = parser.parse_args(argv)
+
+    rig = PreviewRig.load(args.rig)
+    if args.turntable:
+        translate, rotate = turntable(rig.skeleton, args.turntable)
+    else:
+        translate, rotate = load_animation(args.animation, rig.skeleton)
+    points, stats = bake(rig, translate, rotate, args.cache, args.workers)
+    print(format_stats(stats))
+    if args.report:
+        with open(args.report, 'w') as report_file:
+            json.dump(stats, report_file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
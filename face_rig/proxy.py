@@ -0,0 +1,271 @@
+'''Decimated proxies of dense heads.
+
+Scanned heads can have millions of faces, far more than the joint placement
+and the skin weights need. A proxy is a decimated triangle copy of the head,
+made by vertex clustering: the points are grouped on a grid over the surface
+and every group becomes one proxy point, placed where the planes of the
+faces around it meet best (the quadric error of Lindstrom's out of core
+simplification), so the proxy keeps the lips and the creases instead of
+rounding them off. Triangles whose corners fall in fewer than three groups
+disappear.
+
+The landmarks and the skin weights are worked out on the proxy and carried
+back to the head. Every head point is projected onto the proxy triangles
+around its own group, and takes the weights of the nearest one, blended
+with its barycentric coordinates, all points in one vectorized pass:
+
+    head_proxy = proxy.mesh_proxy(mesh)
+    weights = skinning.heat_weights(head_proxy.mesh, joint_names, joint_positions)
+    weights = proxy.transfer_weights(head_proxy, weights, mesh.points)
+
+mesh_proxy() keeps the proxy of every Mesh, like face_rig.spatial.mesh_index,
+so the stages of one build decimate the head once. last_transfer holds the
+distance of the head points to the proxy surface of the last transfer, the
+bound on how far the weights were carried.
+'''
+import time
+import weakref
+
+import numpy as np
+
+from face_rig.mesh import Mesh
+from face_rig.skinning import MAX_INFLUENCES, SkinWeights
+
+# meshes with more points than this are placed and skinned on a proxy
+PROXY_POINTS = 200000
+# points of a proxy
+PROXY_TARGET = 50000
+# head points transferred at a time
+TRANSFER_CHUNK = 65536
+# pulls a proxy point towards the middle of its group where the face planes do not pin it down
+QUADRIC_REGULARIZATION = 1e-3
+
+# head points, max and mean distance to the proxy surface and seconds of the last transfer
+last_transfer = {}
+
+_proxies = weakref.WeakKeyDictionary()
+
+
+def triangles(mesh):
+    '''(n, 3) corner indices of the mesh's faces split into fans of triangles
+    '''
+    counts = mesh.face_counts.astype(np.int64)
+    fans = np.maximum(counts - 2, 0)
+    first = np.repeat(mesh.face_offsets[:-1], fans)
+    # the position of every triangle inside its fan
+    step = np.arange(fans.sum()) - np.repeat(np.cumsum(fans) - fans, fans) + 1
+    connects = mesh.face_connects
+    return np.c_[connects[first], connects[first + step], connects[first + step + 1]].astype(np.int64)
+
+
+def _grid_clusters(points, cell):
+    cells = np.floor((points - points.min(axis=0)) / cell).astype(np.int64)
+    size = cells.max(axis=0) + 1
+    keys = (cells[:, 0] * size[1] + cells[:, 1]) * size[2] + cells[:, 2]
+    return np.unique(keys, return_inverse=True)[1].ravel()
+
+
+class Proxy(object):
+    '''a decimated triangle mesh and the proxy point of every point of the mesh it was made from
+    '''
+    def __init__(self, mesh, clusters):
+        self.mesh = mesh
+        self.clusters = np.asarray(clusters, dtype=np.int64)
+        self.triangles = triangles(mesh)
+        # the triangles around every proxy point, a CSR
+        corners = self.triangles.ravel()
+        order = np.argsort(corners, kind='stable')
+        self.ring_triangles = order // 3
+        self.ring_offsets = np.zeros(mesh.num_points + 1, dtype=np.int64)
+        np.cumsum(np.bincount(corners, minlength=mesh.num_points), out=self.ring_offsets[1:])
+
+    def __repr__(self):
+        return 'Proxy(%d points, %d triangles, for %d points)' % (
+            self.mesh.num_points, len(self.triangles), len(self.clusters))
+
+    def closest(self, points, clusters=None):
+        '''the nearest point on the proxy triangles around the proxy point of every point, as the
+        (n, 3) corners of its triangle, its (n, 3) barycentric coordinates and its distance. clusters
+        are the proxy points of the points, those of the source mesh when it is None
+        '''
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        clusters = self.clusters if clusters is None else np.asarray(clusters, dtype=np.int64)
+        counts = np.diff(self.ring_offsets)[clusters]
+        rows = np.repeat(np.arange(len(points)), counts)
+        candidates = self.ring_triangles[np.arange(counts.sum()) +
+                                         np.repeat(self.ring_offsets[clusters] - (np.cumsum(counts) - counts), counts)]
+        corners = self.triangles[candidates]
+        proxy_points = self.mesh.points.astype(np.float64)
+        barycentric = closest_on_triangles(points[rows], proxy_points[corners[:, 0]],
+                                           proxy_points[corners[:, 1]], proxy_points[corners[:, 2]])
+        nearest = np.einsum('ek,eka->ea', barycentric, proxy_points[corners])
+        squared = ((nearest - points[rows]) ** 2).sum(axis=1)
+        # a point whose proxy point has no triangles left sits on that point
+        result_corners = np.repeat(clusters[:, None], 3, axis=1)
+        result_barycentric = np.zeros((len(points), 3))
+        result_barycentric[:, 0] = 1.0
+        distances = np.linalg.norm(proxy_points[clusters] - points, axis=1)
+        if len(rows):
+            # the nearest candidate of every point is the first one of its rows sorted by distance
+            order = np.lexsort((squared, rows))
+            starts = np.flatnonzero(np.r_[True, rows[order][1:] != rows[order][:-1]])
+            best = order[starts]
+            found = rows[best]
+            result_corners[found] = corners[best]
+            result_barycentric[found] = barycentric[best]
+            distances[found] = np.sqrt(squared[best])
+        return result_corners, result_barycentric, distances
+
+
+def closest_on_triangles(points, a, b, c):
+    '''(n, 3) barycentric coordinates of the point of every triangle (a, b, c) nearest to its point,
+    the regions of Ericson's Real-Time Collision Detection worked out for all of them together
+    '''
+    ab, ac = b - a, c - a
+    ap, bp, cp = points - a, points - b, points - c
+    d1, d2 = (ab * ap).sum(axis=1), (ac * ap).sum(axis=1)
+    d3, d4 = (ab * bp).sum(axis=1), (ac * bp).sum(axis=1)
+    d5, d6 = (ab * cp).sum(axis=1), (ac * cp).sum(axis=1)
+    va, vb, vc = d3 * d6 - d5 * d4, d5 * d2 - d1 * d6, d1 * d4 - d3 * d2
+
+    def ratio(numerator, denominator):
+        return numerator / np.where(denominator == 0, 1.0, denominator)
+
+    result = np.empty((len(points), 3))
+    total = va + vb + vc
+    v, w = ratio(vb, total), ratio(vc, total)
+    result[:] = np.c_[1.0 - v - w, v, w]
+    # later regions win, in the reverse of the order Ericson tests them in
+    edge_bc = (va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0)
+    w = ratio(d4 - d3, (d4 - d3) + (d5 - d6))
+    result[edge_bc] = np.c_[np.zeros(len(w)), 1.0 - w, w][edge_bc]
+    edge_ac = (vb <= 0) & (d2 >= 0) & (d6 <= 0)
+    w = ratio(d2, d2 - d6)
+    result[edge_ac] = np.c_[1.0 - w, np.zeros(len(w)), w][edge_ac]
+    result[(d6 >= 0) & (d5 <= d6)] = (0.0, 0.0, 1.0)
+    edge_ab = (vc <= 0) & (d1 >= 0) & (d3 <= 0)
+    v = ratio(d1, d1 - d3)
+    result[edge_ab] = np.c_[1.0 - v, v, np.zeros(len(v))][edge_ab]
+    result[(d3 >= 0) & (d4 <= d3)] = (0.0, 1.0, 0.0)
+    result[(d1 <= 0) & (d2 <= 0)] = (1.0, 0.0, 0.0)
+    return result
+
+
+def decimate(mesh, target=PROXY_TARGET):
+    '''a Proxy of about target points of a mesh, by vertex clustering with quadric placement
+    '''
+    points = mesh.points.astype(np.float64)
+    corners = triangles(mesh)
+    normals = np.cross(points[corners[:, 1]] - points[corners[:, 0]], points[corners[:, 2]] - points[corners[:, 0]])
+    double_areas = np.linalg.norm(normals, axis=1)
+    area = double_areas.sum() / 2.0
+    # about one cell per target point over the surface, corrected once by the count it gave
+    cell = max(np.sqrt(area / max(target, 1)), 1e-12)
+    clusters = _grid_clusters(points, cell)
+    count = clusters.max() + 1
+    if count > 1.5 * target or count < target / 1.5:
+        cell *= np.sqrt(count / float(target))
+        clusters = _grid_clusters(points, cell)
+        count = clusters.max() + 1
+
+    # the area weighted plane quadric of every triangle, summed on the groups of its corners
+    unit = normals / np.where(double_areas == 0, 1.0, double_areas)[:, None]
+    offsets = -(unit * points[corners[:, 0]]).sum(axis=1)
+    weights = double_areas / 2.0
+    groups = clusters[corners].ravel()
+    quadric = np.empty((count, 3, 3))
+    linear = np.empty((count, 3))
+    for row in range(3):
+        linear[:, row] = np.bincount(groups, weights=np.repeat(weights * unit[:, row] * offsets, 3), minlength=count)
+        for column in range(3):
+            quadric[:, row, column] = np.bincount(
+                groups, weights=np.repeat(weights * unit[:, row] * unit[:, column], 3), minlength=count)
+    sizes = np.bincount(clusters, minlength=count)[:, None]
+    middles = np.stack([np.bincount(clusters, weights=points[:, axis], minlength=count) for axis in range(3)],
+                       axis=1) / sizes
+    regularization = QUADRIC_REGULARIZATION * np.trace(quadric, axis1=1, axis2=2) / 3.0 + 1e-12
+    system = quadric + regularization[:, None, None] * np.identity(3)
+    placed = np.linalg.solve(system, (regularization[:, None] * middles - linear)[:, :, None])[:, :, 0]
+    # a point the planes push out of its cell is left in the middle of its group
+    placed = np.where((np.abs(placed - middles) > cell).any(axis=1)[:, None], middles, placed)
+
+    # keep the triangles with three groups, each once
+    proxy_corners = clusters[corners]
+    kept = ((proxy_corners[:, 0] != proxy_corners[:, 1]) & (proxy_corners[:, 1] != proxy_corners[:, 2]) &
+            (proxy_corners[:, 0] != proxy_corners[:, 2]))
+    proxy_corners = proxy_corners[kept]
+    ordered = np.sort(proxy_corners, axis=1)
+    keys = (ordered[:, 0] * count + ordered[:, 1]) * count + ordered[:, 2]
+    proxy_corners = proxy_corners[np.sort(np.unique(keys, return_index=True)[1])]
+
+    proxy_mesh = Mesh(placed, np.full(len(proxy_corners), 3), proxy_corners.ravel(),
+                      name='%s_proxy' % mesh.name if mesh.name else None)
+    return Proxy(proxy_mesh, clusters)
+
+
+def mesh_proxy(mesh, target=PROXY_TARGET):
+    '''the Proxy of a Mesh, made once for every target and kept for as long as the Mesh is
+    '''
+    proxies = _proxies.get(mesh)
+    if proxies is None:
+        proxies = _proxies[mesh] = {}
+    if target not in proxies:
+        proxies[target] = decimate(mesh, target)
+    return proxies[target]
+
+
+def _blend(weights, corners, barycentric, max_influences):
+    '''SkinWeights of points taking the weights of their corners blended by barycentric, keeping the
+    max_influences largest weights of every point
+    '''
+    count = len(corners)
+    rows, joints, values = [], [], []
+    for corner in range(3):
+        vertices = corners[:, corner]
+        counts = np.diff(weights.offsets)[vertices]
+        entries = np.arange(counts.sum()) + np.repeat(weights.offsets[vertices] - (np.cumsum(counts) - counts), counts)
+        rows.append(np.repeat(np.arange(count), counts))
+        joints.append(weights.joint_indices[entries].astype(np.int64))
+        values.append(weights.weights[entries] * np.repeat(barycentric[:, corner], counts))
+    rows, joints, values = np.concatenate(rows), np.concatenate(joints), np.concatenate(values)
+    # a joint several corners share is summed
+    keys, inverse = np.unique(rows * len(weights.joint_names) + joints, return_inverse=True)
+    values = np.bincount(inverse.ravel(), weights=values, minlength=len(keys))
+    rows, joints = keys // len(weights.joint_names), keys % len(weights.joint_names)
+    # the largest weights of every point, then normalized again
+    order = np.lexsort((-values, rows))
+    rows, joints, values = rows[order], joints[order], values[order]
+    starts = np.searchsorted(rows, rows)
+    kept = (np.arange(len(rows)) - starts < max_influences) & (values > 1e-6)
+    rows, joints, values = rows[kept], joints[kept], values[kept]
+    totals = np.bincount(rows, weights=values, minlength=count)
+    values = values / totals[rows]
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=count), out=offsets[1:])
+    return offsets, joints, values
+
+
+def transfer_weights(proxy, weights, points, max_influences=MAX_INFLUENCES):
+    '''the SkinWeights of the points of the mesh the proxy was made from, interpolated from the
+    weights of the proxy at the nearest point of its surface
+    '''
+    start = time.perf_counter()
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    if len(points) != len(proxy.clusters):
+        raise ValueError('the proxy was made from a mesh of %d points, not %d' % (len(proxy.clusters), len(points)))
+    offsets, joints, values, distances = [np.zeros(1, dtype=np.int64)], [], [], []
+    for first in range(0, len(points), TRANSFER_CHUNK):
+        chunk = slice(first, first + TRANSFER_CHUNK)
+        corners, barycentric, chunk_distances = proxy.closest(points[chunk], proxy.clusters[chunk])
+        chunk_offsets, chunk_joints, chunk_values = _blend(weights, corners, barycentric, max_influences)
+        offsets.append(chunk_offsets[1:] + offsets[-1][-1])
+        joints.append(chunk_joints)
+        values.append(chunk_values)
+        distances.append(chunk_distances)
+    distances = np.concatenate(distances) if distances else np.zeros(0)
+    last_transfer.clear()
+    last_transfer.update(points=len(points), max_distance=float(distances.max()) if len(distances) else 0.0,
+                         mean_distance=float(distances.mean()) if len(distances) else 0.0,
+                         seconds=time.perf_counter() - start)
+    return SkinWeights(weights.joint_names, np.concatenate(offsets),
+                       np.concatenate(joints) if joints else [], np.concatenate(values) if values else [])
@@ -0,0 +1,24 @@
+'''Files the tool ships with, found inside the package wherever it is installed.
+
+The UI images live in face_rig/images. Their paths are worked out from this
+file instead of a directory set by hand, and each one is checked once:
+
+    cmds.image(image=resources.image_path('joint_placement_guide.png'))
+'''
+import os
+
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'images')
+
+_image_paths = {}
+
+
+def image_path(name):
+    '''the full path of an image in face_rig/images, raises IOError when it is missing
+    '''
+    path = _image_paths.get(name)
+    if path is None:
+        path = os.path.join(IMAGE_DIR, name)
+        if not os.path.isfile(path):
+            raise IOError('%s is missing from %s' % (name, IMAGE_DIR))
+        _image_paths[name] = path
+    return path
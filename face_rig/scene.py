@@ -0,0 +1,220 @@
+'''Access to the scene the rig is built in.
+
+The stages never import maya.cmds themselves, they use the cmds object of
+this module, which forwards every command to the active scene. By default
+that is the running Maya session. A stand-in such as face_rig.fake_scene's
+FakeScene can be made active to build rigs without Maya.
+'''
+import contextlib
+import math
+
+
+class MayaScene(object):
+    '''the live Maya session, maya.cmds is imported the first time it is needed
+    '''
+    def __init__(self):
+        self._cmds = None
+
+    @property
+    def cmds(self):
+        if self._cmds is None:
+            import maya.cmds
+            self._cmds = maya.cmds
+        return self._cmds
+
+    def read_mesh(self, mesh_name):
+        '''read the world space points and the face connectivity of a mesh with one query each
+        '''
+        import maya.api.OpenMaya as om
+        from face_rig.mesh import Mesh
+        points = self.cmds.xform(mesh_name + '.vtx[*]', query=True, worldSpace=True, translation=True)
+        selection = om.MSelectionList()
+        selection.add(mesh_name)
+        face_counts, face_connects = om.MFnMesh(selection.getDagPath(0)).getVertices()
+        return Mesh(points, face_counts, face_connects, name=mesh_name)
+
+    def create_joints(self, names, matrices, parents, radius=1.0):
+        '''create joints from their world matrices under the given parents, returns their names.
+        Maya has no command making many joints at once, they are made one after the other here
+        with the joint orient taken from the matrix, which keeps them undoable
+        '''
+        import maya.api.OpenMaya as om
+        cmds = self.cmds
+        created = []
+        for name, matrix, parent in zip(names, matrices, parents):
+            values = [float(value) for row in matrix for value in row]
+            rotation = om.MTransformationMatrix(om.MMatrix(values)).rotation()
+            cmds.select(clear=True)
+            joint = cmds.joint(name=name, position=values[12:15], radius=radius,
+                               orientation=[math.degrees(angle) for angle in (rotation.x, rotation.y, rotation.z)])
+            if parent:
+                joint = cmds.parent(joint, parent)[0]
+            created.append(joint)
+        cmds.select(clear=True)
+        return created
+
+    def create_curves(self, names, points, degree=3, periodic=False, parents=None, pivots=None):
+        '''create NURBS curves with their final world CVs, one curve per name with points an (n, cvs, 3)
+        array, returns their names. A periodic curve repeats its first degree CVs at the end as
+        cmds.curve wants, parents and pivots are optional and per curve
+        '''
+        cmds = self.cmds
+        created = []
+        for index, name in enumerate(names):
+            cvs = [tuple(float(value) for value in point) for point in points[index]]
+            if periodic:
+                knots = list(range(-degree + 1, len(cvs) + degree))
+                curve = cmds.curve(name=name, degree=degree, periodic=True, point=cvs + cvs[:degree], knot=knots)
+            else:
+                curve = cmds.curve(name=name, degree=degree, point=cvs)
+            if pivots is not None:
+                cmds.xform(curve, worldSpace=True, pivots=[float(value) for value in pivots[index]])
+            if parents is not None and parents[index]:
+                curve = cmds.parent(curve, parents[index])[0]
+            created.append(curve)
+        cmds.select(clear=True)
+        return created
+
+    def set_curve_points(self, names, points, pivots=None):
+        '''move the CVs of existing curves to new world positions, points holding the (cvs, 3) of every curve
+        without the repeated CVs of a periodic curve. pivots are optional and per curve, None leaves one as it is
+        '''
+        import maya.api.OpenMaya as om
+        cmds = self.cmds
+        selection = om.MSelectionList()
+        for name in names:
+            selection.add(name)
+        for index, name in enumerate(names):
+            curve = om.MFnNurbsCurve(selection.getDagPath(index).extendToShape())
+            cvs = [om.MPoint(*[float(value) for value in point]) for point in points[index]]
+            if curve.form == om.MFnNurbsCurve.kPeriodic:
+                cvs += cvs[:curve.degree]
+            curve.setCVPositions(cvs, om.MSpace.kWorld)
+            curve.updateCurve()
+            if pivots is not None and pivots[index] is not None:
+                cmds.xform(name, worldSpace=True, pivots=[float(value) for value in pivots[index]])
+
+    def _skin_cluster(self, skin_cluster):
+        import maya.api.OpenMaya as om
+        import maya.api.OpenMayaAnim as oma
+        selection = om.MSelectionList()
+        selection.add(skin_cluster)
+        skin = oma.MFnSkinCluster(selection.getDependNode(0))
+        path = skin.getPathAtIndex(0)
+        components = om.MFnSingleIndexedComponent()
+        vertices = components.create(om.MFn.kMeshVertComponent)
+        components.setCompleteData(om.MFnMesh(path).numVertices)
+        influences = [influence.partialPathName() for influence in skin.influenceObjects()]
+        return skin, path, vertices, influences
+
+    def get_skin_weights(self, skin_cluster):
+        '''read all the weights of a skin cluster with one getWeights call, as a face_rig.skinning.SkinWeights
+        '''
+        import numpy as np
+        from face_rig.skinning import from_dense
+        skin, path, vertices, influences = self._skin_cluster(skin_cluster)
+        values, influence_count = skin.getWeights(path, vertices)
+        return from_dense(influences, np.reshape(values, (-1, influence_count)))
+
+    def set_skin_weights(self, skin_cluster, weights):
+        '''write a face_rig.skinning.SkinWeights to a skin cluster, the joints matched to the influences
+        by name and every other influence set to zero. Only the stored weights are sent: all the weights
+        are cleared in one setWeights call and then every joint writes its own vertices in one more
+        '''
+        import numpy as np
+        import maya.api.OpenMaya as om
+        skin, path, vertices, influences = self._skin_cluster(skin_cluster)
+        missing = [name for name in weights.joint_names if name not in influences]
+        if missing:
+            raise ValueError('%s has no influences %s' % (skin_cluster, ', '.join(missing)))
+        skin.setWeights(path, vertices, om.MIntArray(list(range(len(influences)))),
+                        om.MDoubleArray(om.MFnMesh(path).numVertices * len(influences), 0.0), False)
+        rows = weights.rows()
+        for joint in np.unique(weights.joint_indices):
+            entries = np.flatnonzero(weights.joint_indices == joint)
+            components = om.MFnSingleIndexedComponent()
+            joint_vertices = components.create(om.MFn.kMeshVertComponent)
+            components.addElements(om.MIntArray(rows[entries].tolist()))
+            skin.setWeights(path, joint_vertices, om.MIntArray([influences.index(weights.joint_names[joint])]),
+                            om.MDoubleArray(weights.weights[entries].tolist()), False)
+
+
+_active_scene = None
+
+
+def get_scene():
+    '''returns the scene the stages currently work on
+    '''
+    global _active_scene
+    if _active_scene is None:
+        _active_scene = MayaScene()
+    return _active_scene
+
+
+def set_scene(scene):
+    '''make scene the active scene and return the one it replaces
+    '''
+    global _active_scene
+    previous = _active_scene
+    _active_scene = scene
+    return previous
+
+
+@contextlib.contextmanager
+def use_scene(scene):
+    '''make scene active for the duration of a with block
+    '''
+    previous = set_scene(scene)
+    try:
+        yield scene
+    finally:
+        set_scene(previous)
+
+
+# called before any command goes out, face_rig.transaction uses it to send the commands it holds back
+_before_command = None
+
+
+def set_before_command(callback):
+    '''run callback before every command sent through cmds, None to stop. Returns the previous one
+    '''
+    global _before_command
+    previous = _before_command
+    _before_command = callback
+    return previous
+
+
+# wraps every command handed out by cmds while set, face_rig.tracing uses it to time them
+_command_wrapper = None
+
+
+def set_command_wrapper(wrapper):
+    '''wrap every command cmds hands out with wrapper(name, command), None to stop. Returns the previous one
+    '''
+    global _command_wrapper
+    previous = _command_wrapper
+    _command_wrapper = wrapper
+    return previous
+
+
+def wrap_command(name, command):
+    '''a command of the scene's own cmds as cmds would hand it out, for the callers going around cmds
+    '''
+    if _command_wrapper is None:
+        return command
+    return _command_wrapper(name, command)
+
+
+class _Commands(object):
+    '''forwards attribute access to the cmds of the active scene
+    '''
+    def __getattr__(self, name):
+        if _before_command is not None:
+            _before_command()
+        command = getattr(get_scene().cmds, name)
+        if _command_wrapper is None:
+            return command
+        return _command_wrapper(name, command)
+
+
+cmds = _Commands()
@@ -0,0 +1,203 @@
+'''Running long stages a slice at a time.
+
+A long stage such as 'Create Controls' can be given as a list of work units,
+(label, function) pairs run in order. A Job runs them a few at a time when
+the application is idle, so Maya keeps drawing its UI between slices and a
+progress bar can follow the build. All the units run in one transaction
+(see face_rig.transaction): the stage is still a single undo step, and when
+a unit fails or the job is cancelled everything the job did is rolled back.
+
+    job = scheduler.Job('create_controls', stages.control_units(), on_progress=show)
+    scheduler.start(job)
+    ...
+    job.cancel()
+
+In Maya the slices are posted with maya.utils.executeDeferred. IdleQueue is
+a local stand-in for Maya's idle queue that runs the posted slices when it
+is told to, so jobs run the same way without Maya:
+
+    queue = scheduler.IdleQueue()
+    scheduler.start(job, queue)
+    queue.run()
+
+The viewport refresh is suspended only while a slice runs, Maya draws what
+the job built so far between slices. The undo chunk of a job stays open
+while it waits for the next slice, so the stages refuse to run until the job
+finished or was cancelled (see transaction.stage); otherwise they would join
+the job's transaction and be rolled back with it. Edits made by hand between
+slices land in the same chunk and are undone with the job when it is
+cancelled or fails. This is kept on purpose: closing the chunk between slices
+would split the stage over many undo steps, and rolling back only the job's
+chunks is not possible once other edits sit on top of them in the undo
+queue. A job only runs for a few seconds, and the status text of the UI says
+to wait for it.
+'''
+import collections
+import time
+
+from face_rig import transaction
+
+# how long a slice runs units for before Maya gets to draw again
+SLICE_SECONDS = 0.05
+
+_current = None
+
+
+class Cancelled(Exception):
+    '''raised into a job's transaction when it is cancelled, to roll it back
+    '''
+
+
+class IdleQueue(object):
+    '''a stand-in for Maya's idle queue, posted callbacks run when run or run_once is called
+    '''
+    def __init__(self):
+        self._callbacks = collections.deque()
+
+    def __len__(self):
+        return len(self._callbacks)
+
+    def post(self, callback):
+        self._callbacks.append(callback)
+
+    def run_once(self):
+        '''run the callbacks posted so far, the ones they post wait for the next call
+        '''
+        for _ in range(len(self._callbacks)):
+            self._callbacks.popleft()()
+
+    def run(self):
+        '''run callbacks until none are left
+        '''
+        while self._callbacks:
+            self.run_once()
+
+
+class MayaIdleQueue(object):
+    '''Maya's idle queue, maya.utils is imported the first time a callback is posted
+    '''
+    def post(self, callback):
+        import maya.utils
+        maya.utils.executeDeferred(callback)
+
+
+class Job(object):
+    '''work units run in one transaction. on_progress(job, label, seconds) is called after every unit,
+    on_finish(job) once the job finished, failed or was cancelled. status is 'waiting', 'running',
+    'finished', 'failed' or 'cancelled', timings holds the (label, seconds) of every unit run and
+    in_slice is True while a slice runs its units
+    '''
+    def __init__(self, name, units, on_progress=None, on_finish=None, slice_seconds=SLICE_SECONDS):
+        self.name = name
+        self.units = list(units)
+        self.on_progress = on_progress
+        self.on_finish = on_finish
+        self.slice_seconds = slice_seconds
+        self.done = 0
+        self.timings = []
+        self.status = 'waiting'
+        self.error = None
+        self.in_slice = False
+        self._transaction = None
+        self._cancelled = False
+
+    def progress(self):
+        '''the share of the units done, from 0 to 1
+        '''
+        return float(self.done) / len(self.units) if self.units else 1.0
+
+    def finished(self):
+        return self.status in ('finished', 'failed', 'cancelled')
+
+    def cancel(self):
+        '''stop the job before its next slice and roll back what it did
+        '''
+        if not self.finished():
+            self._cancelled = True
+
+    def run_slice(self):
+        '''run units until the slice time is up, returns whether there are units left
+        '''
+        if self.finished():
+            return False
+        if self._transaction is None:
+            self._transaction = transaction.run(self.name)
+            self._transaction.__enter__()
+            self.status = 'running'
+        else:
+            transaction.suspend_refresh(True)
+        if self._cancelled:
+            self._finish(Cancelled('%s was cancelled' % self.name))
+            return False
+        start = time.perf_counter()
+        self.in_slice = True
+        try:
+            while self.done < len(self.units):
+                label, unit = self.units[self.done]
+                unit_start = time.perf_counter()
+                unit()
+                seconds = time.perf_counter() - unit_start
+                self.timings.append((label, seconds))
+                self.done += 1
+                if self.on_progress is not None:
+                    self.on_progress(self, label, seconds)
+                if time.perf_counter() - start >= self.slice_seconds:
+                    break
+        except Exception as error:
+            self.in_slice = False
+            self._finish(error)
+            return False
+        self.in_slice = False
+        if self.done == len(self.units):
+            self._finish(None)
+            return False
+        # Maya draws while the job waits for its next slice
+        transaction.suspend_refresh(False)
+        return True
+
+    def run(self):
+        '''run the whole job now, raises the error of a failed unit
+        '''
+        while self.run_slice():
+            pass
+        if self.status == 'failed':
+            raise self.error
+
+    def _finish(self, error):
+        global _current
+        if error is None:
+            self._transaction.__exit__(None, None, None)
+            self.status = 'finished'
+        else:
+            # the transaction rolls back and hands the error back, it is kept on the job instead
+            self._transaction.__exit__(type(error), error, error.__traceback__)
+            self.status = 'cancelled' if isinstance(error, Cancelled) else 'failed'
+            self.error = error
+        if _current is self:
+            _current = None
+        if self.on_finish is not None:
+            self.on_finish(self)
+
+
+def current():
+    '''the job started with start that has not finished yet, None when there is none
+    '''
+    return _current
+
+
+def start(job, queue=None):
+    '''run a job a slice at a time from an idle queue, Maya's when none is given. Only one job
+    runs at a time
+    '''
+    global _current
+    if _current is not None:
+        raise RuntimeError('%s is still running' % _current.name)
+    queue = MayaIdleQueue() if queue is None else queue
+    _current = job
+
+    def run_slice():
+        if job.run_slice():
+            queue.post(run_slice)
+
+    queue.post(run_slice)
+    return job
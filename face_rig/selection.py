@@ -0,0 +1,212 @@
+'''Face selections kept as runs of face indices.
+
+Maya lists a selection as compressed components, 'Head.f[10:250]' for 241
+faces. A FaceSet keeps them that way: the sorted, non-overlapping half open
+runs [start, stop) of one mesh, stored as one flat int64 array of bounds
+(start, stop, start, stop, ...). A region pick of a million faces in a few
+runs costs a few bytes, and union, intersection, difference and membership
+are worked out on the bounds with NumPy, never on the faces themselves:
+
+    faces = selection.FaceSet.from_ranges([(10, 250), (300, 300)])
+    faces |= selection.FaceSet.from_indices([251, 252])
+    faces.contains([12, 260])         # array([ True, False])
+    faces.indices()                   # every face as an int64 array
+    faces.components('Head')          # ['Head.f[10:252]', 'Head.f[300]']
+
+A FaceSet also behaves as the sorted sequence of its faces, so it can stand
+wherever the stages take a list of face indices.
+
+parse_components() reads every item of a Maya selection, single faces,
+ranges, lists and 'f[*]' on any number of meshes, into one FaceSet per mesh, and
+returns the items that are not faces so they can be reported.
+'''
+import collections
+import re
+
+import numpy as np
+
+_FACES = re.compile(r'^(?P<node>.+)\.f\[(?P<index>[^\]]+)\]$')
+
+
+class FaceSet(object):
+    '''the faces of one mesh as sorted runs, bounds holds the start and the stop of every run
+    '''
+    def __init__(self, bounds=()):
+        self.bounds = np.asarray(bounds, dtype=np.int64).ravel()
+        if len(self.bounds) % 2:
+            raise ValueError('a FaceSet needs a start and a stop for every run')
+
+    @classmethod
+    def from_ranges(cls, ranges):
+        '''the faces of inclusive (first, last) ranges, in any order and overlapping or not
+        '''
+        ranges = np.asarray(list(ranges), dtype=np.int64).reshape(-1, 2)
+        return cls._merged(ranges[:, 0], ranges[:, 1] + 1)
+
+    @classmethod
+    def from_indices(cls, indices):
+        '''the faces of an array of face indices
+        '''
+        indices = np.unique(np.asarray(indices, dtype=np.int64).ravel())
+        if not len(indices):
+            return cls()
+        breaks = np.flatnonzero(np.diff(indices) != 1)
+        starts = indices[np.r_[0, breaks + 1]]
+        stops = indices[np.r_[breaks, len(indices) - 1]] + 1
+        return cls(np.c_[starts, stops])
+
+    @classmethod
+    def _merged(cls, starts, stops):
+        '''the runs covering [start, stop) runs, touching and overlapping runs joined
+        '''
+        kept = stops > starts
+        starts, stops = starts[kept], stops[kept]
+        if not len(starts):
+            return cls()
+        order = np.argsort(starts, kind='stable')
+        starts, stops = starts[order], np.maximum.accumulate(stops[order])
+        # a run starts after every stop so far
+        first = np.r_[True, starts[1:] > stops[:-1]]
+        last = np.r_[first[1:], True]
+        return cls(np.c_[starts[first], stops[last]])
+
+    def __repr__(self):
+        return 'FaceSet(%d faces in %d runs)' % (len(self), self.run_count)
+
+    @property
+    def runs(self):
+        '''(runs, 2) array of the [start, stop) of every run
+        '''
+        return self.bounds.reshape(-1, 2)
+
+    @property
+    def run_count(self):
+        return len(self.bounds) // 2
+
+    @property
+    def nbytes(self):
+        return self.bounds.nbytes
+
+    def __len__(self):
+        return int((self.bounds[1::2] - self.bounds[0::2]).sum())
+
+    def __bool__(self):
+        return len(self.bounds) > 0
+
+    def __eq__(self, other):
+        return isinstance(other, FaceSet) and np.array_equal(self.bounds, other.bounds)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __iter__(self):
+        return iter(self.indices().tolist())
+
+    def __getitem__(self, position):
+        '''the face at a position of the sorted faces
+        '''
+        if isinstance(position, slice):
+            return self.indices()[position]
+        count = len(self)
+        if position < 0:
+            position += count
+        if not 0 <= position < count:
+            raise IndexError('FaceSet index out of range')
+        ends = np.cumsum(self.bounds[1::2] - self.bounds[0::2])
+        run = int(np.searchsorted(ends, position, side='right'))
+        return int(self.bounds[2 * run] + position - (ends[run - 1] if run else 0))
+
+    def __array__(self, dtype=None, copy=None):
+        indices = self.indices()
+        return indices if dtype is None else indices.astype(dtype)
+
+    def __contains__(self, face):
+        return bool(self.contains([face])[0])
+
+    def contains(self, faces):
+        '''whether every face of an array is in the set
+        '''
+        # a face is inside a run when an odd number of bounds is at or below it
+        return np.searchsorted(self.bounds, np.asarray(faces, dtype=np.int64), side='right') % 2 == 1
+
+    def indices(self):
+        '''every face as a sorted int64 array
+        '''
+        starts, stops = self.bounds[0::2], self.bounds[1::2]
+        lengths = stops - starts
+        return np.arange(lengths.sum()) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+
+    def _combine(self, other, keep):
+        '''the faces keep(in self, in other) picks out, worked out on the pieces between all the bounds
+        '''
+        cuts = np.union1d(self.bounds, other.bounds)
+        if len(cuts) < 2:
+            return FaceSet()
+        starts, stops = cuts[:-1], cuts[1:]
+        kept = keep(self.contains(starts), other.contains(starts))
+        return FaceSet._merged(starts[kept], stops[kept])
+
+    def union(self, other):
+        return self._combine(other, np.logical_or)
+
+    def intersection(self, other):
+        return self._combine(other, np.logical_and)
+
+    def difference(self, other):
+        return self._combine(other, lambda mine, theirs: mine & ~theirs)
+
+    __or__ = union
+    __and__ = intersection
+    __sub__ = difference
+
+    def ranges(self):
+        '''inclusive (first, last) of every run
+        '''
+        return [(int(start), int(stop) - 1) for start, stop in self.runs]
+
+    def components(self, mesh_name):
+        '''Maya's compressed face components of the set, one per run
+        '''
+        return ['%s.f[%s]' % (mesh_name, first if first == last else '%d:%d' % (first, last))
+                for first, last in self.ranges()]
+
+
+def parse_components(items, face_count=None):
+    '''read every face component of a selection, single faces, ranges and '*', into an ordered
+    {mesh: FaceSet}. face_count(mesh) gives the faces of a mesh for a '*'. Returns the faces and the
+    items that are not faces
+    '''
+    runs = collections.OrderedDict()
+    ignored = []
+    for item in items or []:
+        match = _FACES.match(item)
+        if match is None:
+            ignored.append(item)
+            continue
+        mesh_name = match.group('node')
+        # Maya writes one range per item, 'f[1,5,7]' lists are read too
+        for index in match.group('index').split(','):
+            if index.strip() == '*':
+                if face_count is None:
+                    raise ValueError('%s needs the face count of %s' % (item, mesh_name))
+                first, last = 0, face_count(mesh_name) - 1
+            else:
+                first, _, last = index.partition(':')
+                first, last = int(first), int(last or first)
+            runs.setdefault(mesh_name, []).append((first, last))
+    return (collections.OrderedDict((mesh_name, FaceSet.from_ranges(ranges)) for mesh_name, ranges in runs.items()),
+            ignored)
+
+
+def faces_to_data(faces):
+    '''plain data of the faces of a pick: the runs of a FaceSet, a list of face indices as it is
+    '''
+    if isinstance(faces, FaceSet):
+        return {'runs': faces.runs.tolist()}
+    return [int(face) for face in faces]
+
+
+def faces_from_data(data):
+    return FaceSet(data['runs']) if isinstance(data, dict) else list(data)
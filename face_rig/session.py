@@ -0,0 +1,168 @@
+'''Rig sessions, one character each.
+
+The rig stages keep the state of a build in module globals: the picks in
+stages.selected_faces, the joints made from them, the registered controls
+and the scene query cache. A RigSession owns that state for one character
+and puts it in place while it is active, in a Maya namespace of its own with
+relative names on, so the node names the stages use ('head_joint', 'Head',
+'jaw_joint_anim', ...) are the names inside the character's namespace and
+several characters can be rigged in one scene:
+
+    hero = session.RigSession('hero')
+    with hero.activate():
+        cmds.file('heads/hero.obj', i=True)
+    hero.selected_faces = batch.face_selections(faces)
+    hero.run('create_joints', stages.create_joints)
+    hero.save('hero.frsession')
+
+While a session is active its state is the stages' globals, set
+stages.selected_faces then, and the session's own attributes when it is not.
+
+    hero = session.RigSession.load('hero.frsession')
+
+A session file is a small JSON file with the picks, region picks as their
+runs of faces (see face_rig.selection), the joints and controls
+the build made and the time of every stage, enough to carry on rigging in a
+new Maya session without picking the faces again. The scene query cache and
+the build graph are made again the first time they are needed.
+'''
+import contextlib
+import json
+import os
+import time
+
+from face_rig import controls, geometry, selection, stages, template
+from face_rig.scene import cmds
+
+SESSION_VERSION = 1
+SESSION_EXTENSION = '.frsession'
+
+# (module, global) of the build state a session swaps in, and the session attribute holding it
+_STATE = [
+    (stages, 'selected_faces', 'selected_faces'),
+    (stages, 'generated_joints', 'generated_joints'),
+    (stages, 'built_picks', 'built_picks'),
+    (stages, 'rig_graph', 'rig_graph'),
+    (controls, 'registry', 'controls'),
+    (controls, 'timings', 'control_timings'),
+    (geometry, 'cache', 'cache'),
+]
+
+
+class RigSession(object):
+    '''the build state of one character, built in the namespace of the same name unless another
+    one is given. template_path names the rig template, the default template when it is None
+    '''
+    def __init__(self, name, namespace=None, template_path=None):
+        self.name = name
+        self.namespace = (namespace or name).strip(':')
+        self.template_path = template_path
+        self.plan = None
+        self.selected_faces = []
+        self.generated_joints = []
+        self.built_picks = []
+        self.rig_graph = None
+        self.controls = []
+        self.control_timings = []
+        self.cache = geometry.QueryCache()
+        # (stage, seconds) of every stage run through run()
+        self.timings = []
+
+    def active_plan(self):
+        '''the compiled template of the session, compiled the first time it is needed
+        '''
+        if self.plan is None:
+            path = self.template_path or template.DEFAULT_TEMPLATE
+            self.plan = template.compile_template(template.load_template(path))
+        return self.plan
+
+    @contextlib.contextmanager
+    def activate(self):
+        '''make this session the one the stages build, in its namespace, until the block ends.
+        The namespace is made the first time, the previous namespace and build state come back after
+        '''
+        previous_namespace = cmds.namespaceInfo(currentNamespace=True, absoluteName=True)
+        previous_relative = cmds.namespace(query=True, relativeNames=True)
+        if not cmds.namespace(exists=':' + self.namespace):
+            cmds.namespace(add=self.namespace, parent=':')
+        cmds.namespace(setNamespace=':' + self.namespace)
+        cmds.namespace(relativeNames=True)
+        previous_state = [getattr(module, name) for module, name, attribute in _STATE]
+        for module, name, attribute in _STATE:
+            setattr(module, name, getattr(self, attribute))
+        previous_plan = template.set_active_plan(self.active_plan())
+        try:
+            yield self
+        finally:
+            # the stages rebind some globals instead of changing them, keep what they left
+            for module, name, attribute in _STATE:
+                setattr(self, attribute, getattr(module, name))
+            self.plan = template.set_active_plan(previous_plan)
+            for (module, name, attribute), value in zip(_STATE, previous_state):
+                setattr(module, name, value)
+            cmds.namespace(relativeNames=previous_relative)
+            cmds.namespace(setNamespace=previous_namespace)
+
+    def run(self, stage_name, stage, *args):
+        '''run a stage in this session and keep its time
+        '''
+        with self.activate():
+            start = time.perf_counter()
+            try:
+                return stage(*args)
+            finally:
+                self.timings.append((stage_name, time.perf_counter() - start))
+
+    def metrics(self):
+        '''plain data of what the session built and what it cost: the time of every stage, the
+        query cache hits and misses, and the joint and control counts
+        '''
+        return {
+            'name': self.name,
+            'namespace': self.namespace,
+            'stages': dict((name, round(seconds, 6)) for name, seconds in self.timings),
+            'seconds': round(sum(seconds for name, seconds in self.timings), 6),
+            'query_cache': self.cache.stats(),
+            'joints': len(self.generated_joints),
+            'controls': len(self.controls),
+        }
+
+    def to_data(self):
+        return {
+            'version': SESSION_VERSION,
+            'name': self.name,
+            'namespace': self.namespace,
+            'template': self.template_path,
+            'selected_faces': [[mesh_name, selection.faces_to_data(faces)] for mesh_name, faces in self.selected_faces],
+            'built_picks': [[mesh_name, int(face)] for mesh_name, face in self.built_picks],
+            'generated_joints': list(self.generated_joints),
+            'controls': list(self.controls),
+            'timings': [[name, round(seconds, 6)] for name, seconds in self.timings],
+        }
+
+    @classmethod
+    def from_data(cls, data):
+        if data.get('version') != SESSION_VERSION:
+            raise ValueError('unknown session version %r' % data.get('version'))
+        session = cls(data['name'], data['namespace'], data.get('template'))
+        session.selected_faces = [(mesh_name, selection.faces_from_data(faces)) for mesh_name, faces in data['selected_faces']]
+        session.built_picks = [(mesh_name, face) for mesh_name, face in data['built_picks']]
+        session.generated_joints = list(data['generated_joints'])
+        session.controls = list(data['controls'])
+        session.timings = [(name, seconds) for name, seconds in data['timings']]
+        return session
+
+    def save(self, path):
+        '''write the session file, replacing an existing one in one go
+        '''
+        temp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(temp_path, 'w') as session_file:
+            json.dump(self.to_data(), session_file, separators=(',', ':'))
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        '''the session saved in a session file
+        '''
+        with open(path) as session_file:
+            return cls.from_data(json.load(session_file))
@@ -0,0 +1,98 @@
+'''The control shapes as unit CV arrays.
+
+Every shape (circle, arrow circle, eye figure eight, jaw) is a list of
+curves, each a (suffix, cvs, degree, periodic) entry with its CVs for a size
+of 1 at the origin. The arrays are made once and cached. place() turns a unit
+shape into the world CVs of many controls at once, scale, offset, rotation
+and position in one NumPy transform, so the controls are created with their
+final CVs instead of being drawn and then edited a CV at a time:
+
+    cvs = shapes.place('circle', positions, scales, rotations, offsets)
+
+The circle has the CVs of Maya's default 8 section circle facing +Z.
+'''
+import numpy as np
+
+# Maya's default 8 section circle has its CVs this far out for a radius of 1
+CIRCLE_CV_RADIUS = 1.108194
+
+# the arrow of the arrow circle, and the (rotation, translation) of its four copies
+ARROW = [(-0.5, 0, -1), (0, 0, 0), (-0.5, 0, 1)]
+ARROWS = [
+    ('_arrow_left', (90, 0, 0), (1.384, 0, 0)),
+    ('_arrow_right', (90, 180, 0), (-1.385, 0, 0)),
+    ('_arrow_up', (90, 0, 90), (0, 1.226, 0)),
+    ('_arrow_down', (90, 0, -90), (0, -1.225, 0)),
+]
+
+_unit_shapes = {}
+
+
+def rotation_matrices(rotations):
+    '''(n, 3, 3) row vector rotation matrices of (n, 3) xyz euler angles in degrees, Maya's xyz order
+    '''
+    x, y, z = np.radians(np.asarray(rotations, dtype=np.float64).reshape(-1, 3)).T
+    ones, zeros = np.ones_like(x), np.zeros_like(x)
+    rx = np.stack([ones, zeros, zeros, zeros, np.cos(x), np.sin(x), zeros, -np.sin(x), np.cos(x)], -1)
+    ry = np.stack([np.cos(y), zeros, -np.sin(y), zeros, ones, zeros, np.sin(y), zeros, np.cos(y)], -1)
+    rz = np.stack([np.cos(z), np.sin(z), zeros, -np.sin(z), np.cos(z), zeros, zeros, zeros, ones], -1)
+    return np.matmul(np.matmul(rx.reshape(-1, 3, 3), ry.reshape(-1, 3, 3)), rz.reshape(-1, 3, 3))
+
+
+def _circle():
+    angles = np.radians(np.arange(8) * -45.0 + 45.0)
+    return np.c_[np.cos(angles), np.sin(angles), np.zeros(8)] * CIRCLE_CV_RADIUS
+
+
+def _make_shape(name):
+    circle = _circle()
+    if name == 'circle':
+        return [('', circle, 3, True)]
+    if name == 'arrow_circle':
+        curves = [('', circle, 3, True)]
+        arrow = np.array(ARROW, dtype=np.float64)
+        for suffix, rotation, translation in ARROWS:
+            curves.append((suffix, arrow.dot(rotation_matrices(rotation)[0]) + translation, 1, False))
+        return curves
+    if name == 'eyes':
+        # a circle pinched into a figure eight, two opposite CVs pulled past each other
+        circle[1, 1] -= 1.7 / 1.5
+        circle[5, 1] += 1.7 / 1.5
+        return [('', circle, 3, True)]
+    if name == 'jaw':
+        # a circle with its lower half pulled back under the chin
+        circle[5] += (0, 1 / 3.0, -2)
+        circle[[4, 6]] += (0, 1 / 6.0, -1)
+        return [('', circle, 3, True)]
+    raise KeyError('no control shape called %s' % name)
+
+
+def unit_shape(name):
+    '''the (suffix, cvs, degree, periodic) curves of a shape at size 1, made once and cached.
+    The first curve has no suffix and is the control itself, the others go under it
+    '''
+    curves = _unit_shapes.get(name)
+    if curves is None:
+        curves = _make_shape(name)
+        for suffix, cvs, degree, periodic in curves:
+            cvs.setflags(write=False)
+        _unit_shapes[name] = curves
+    return curves
+
+
+def place(name, positions, scales=1.0, rotations=None, offsets=None):
+    '''world CVs of a shape for n controls, a list with one (n, cvs, 3) array per curve of the shape.
+    Every control is scaled, moved by its offset, rotated by its xyz rotation and then put at its
+    position, the same as a transform with the unit shape offset in its CVs
+    '''
+    positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+    count = len(positions)
+    scales = np.broadcast_to(np.asarray(scales, dtype=np.float64), (count,))
+    offsets = np.zeros((count, 3)) if offsets is None else np.broadcast_to(np.asarray(offsets, dtype=np.float64), (count, 3))
+    matrices = rotation_matrices(np.zeros((count, 3)) if rotations is None else rotations)
+    placed = []
+    for suffix, cvs, degree, periodic in unit_shape(name):
+        local = cvs[None] * scales[:, None, None] + offsets[:, None, :]
+        placed.append(np.matmul(local, matrices) + positions[:, None, :])
+    return placed
+
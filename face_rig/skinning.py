@@ -0,0 +1,303 @@
+'''Automatic skin weights by heat diffusion over the mesh.
+
+The weight of a joint spreads over the surface like heat from the vertices
+the joint is nearest to, the heat equilibrium of Baran and Popovic's
+automatic rigging:
+
+    (L + A H) w_j = A H p_j
+
+L is the graph Laplacian of the mesh edges, A the area around every vertex,
+H the heat of a vertex, 1 / d^2 for the distance d to its nearest joint, and
+p_j is 1 on the vertices nearest to joint j. The weights follow the surface,
+so the lower lip does not pick up the upper lip joints through the mouth.
+
+Only the candidates nearest joints of a vertex are solved for, every joint
+has a weight only where it is one of them, which keeps the system sparse. All
+the joints are solved together by one Jacobi preconditioned conjugate
+gradient, in NumPy only, and the max_influences largest weights of every
+vertex are kept in a SkinWeights, a CSR of vertex -> (joint, weight):
+
+    weights = skinning.heat_weights(mesh, joint_names, joint_positions)
+    get_scene().set_skin_weights(skin_cluster, weights)
+'''
+import time
+
+import numpy as np
+
+from face_rig.mesh import edges as mesh_edges, face_normals
+
+MAX_INFLUENCES = 4
+CANDIDATES = 6
+# rows of the vertex to joint distance table worked on at a time
+DISTANCE_CHUNK = 65536
+# meshes with more points than this are solved coarse to fine, each level about this many times smaller
+COARSEST = 20000
+COARSENING = 8
+# the coarse levels are cheap, they are solved this much tighter so the fine level has less to do
+COARSE_TOLERANCE = 0.1
+# vertices deformed at a time, for every pose of a batch
+DEFORM_CHUNK = 16384
+
+# unknowns, iterations and seconds of the last solve
+last_solve = {}
+
+
+class SkinWeights(object):
+    '''sparse skin weights: the influences of vertex i are joint_indices[offsets[i]:offsets[i + 1]],
+    indices into joint_names, with their weights
+    '''
+    def __init__(self, joint_names, offsets, joint_indices, weights):
+        self.joint_names = list(joint_names)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.joint_indices = np.asarray(joint_indices, dtype=np.int32)
+        self.weights = np.asarray(weights, dtype=np.float32)
+
+    def __repr__(self):
+        return 'SkinWeights(%d points, %d joints, %d weights)' % (
+            self.num_points, len(self.joint_names), len(self.weights))
+
+    @property
+    def num_points(self):
+        return len(self.offsets) - 1
+
+    def rows(self):
+        '''the vertex of every stored weight
+        '''
+        return np.repeat(np.arange(self.num_points), np.diff(self.offsets))
+
+    def dense(self, joint_names=None):
+        '''(points, joints) array of the weights, the columns in the order of joint_names,
+        joints it does not know get zero weights
+        '''
+        joint_names = self.joint_names if joint_names is None else list(joint_names)
+        column = dict((name, index) for index, name in enumerate(joint_names))
+        columns = np.array([column.get(name, -1) for name in self.joint_names] + [-1], dtype=np.int64)
+        result = np.zeros((self.num_points, len(joint_names)))
+        kept = columns[self.joint_indices] >= 0
+        result[self.rows()[kept], columns[self.joint_indices][kept]] = self.weights[kept]
+        return result
+
+    def vertex(self, index):
+        '''{joint name: weight} of one vertex
+        '''
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return dict((self.joint_names[joint], float(weight))
+                    for joint, weight in zip(self.joint_indices[start:end], self.weights[start:end]))
+
+
+def from_dense(joint_names, dense, threshold=1e-6):
+    '''SkinWeights of a (points, joints) array, weights at or below threshold are left out
+    '''
+    dense = np.asarray(dense, dtype=np.float64)
+    kept = dense > threshold
+    offsets = np.zeros(len(dense) + 1, dtype=np.int64)
+    np.cumsum(kept.sum(axis=1), out=offsets[1:])
+    return SkinWeights(joint_names, offsets, np.nonzero(kept)[1], dense[kept])
+
+
+def mirror_weights(weights, points, symmetry, search='_L', replace='_R'):
+    '''copy the weights of the left side (+X) to the right: every right vertex with a mirror vertex in
+    symmetry takes its weights, with the joints named search swapped for the ones named replace and back.
+    Joints without a mirror joint keep their own weights, vertices on the middle line keep theirs
+    '''
+    names = weights.joint_names
+    column = dict((name, index) for index, name in enumerate(names))
+    swapped = []
+    for index, name in enumerate(names):
+        if search in name:
+            swapped.append(column.get(name.replace(search, replace), index))
+        elif replace in name:
+            swapped.append(column.get(name.replace(replace, search), index))
+        else:
+            swapped.append(index)
+    swapped = np.array(swapped, dtype=np.int64)
+
+    points = np.asarray(points)
+    symmetry = np.asarray(symmetry)
+    rows = np.arange(weights.num_points)
+    mirrored = (points[:, 0] < 0) & (symmetry >= 0) & (symmetry != rows)
+    source = np.where(mirrored, symmetry, rows)
+    # the weight entries of the source vertex of every vertex, like face_rig.weights_io.remap_weights
+    counts = np.diff(weights.offsets)[source]
+    offsets = np.zeros(len(source) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    entries = np.arange(offsets[-1]) + np.repeat(weights.offsets[source] - offsets[:-1], counts)
+    joint_indices = weights.joint_indices[entries].astype(np.int64)
+    joint_indices = np.where(np.repeat(mirrored, counts), swapped[joint_indices], joint_indices)
+    return SkinWeights(names, offsets, joint_indices, weights.weights[entries])
+
+
+def deform(points, weights, matrices):
+    '''(poses, points, 3) linear blend skinning of points for a batch of poses. matrices holds the
+    (poses, joints, 4, 4) row vector skinning matrices, bind inverse times posed world, of the joints
+    of weights in their order. Points without weights stay where they are
+    '''
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    matrices = np.asarray(matrices, dtype=np.float64)
+    matrices = matrices.reshape(-1, len(weights.joint_names), 4, 4)[:, :, :, :3]
+    counts = np.diff(weights.offsets)
+    result = np.empty((len(matrices), len(points), 3))
+    result[:] = points
+    for start in range(0, len(points), DEFORM_CHUNK):
+        end = min(start + DEFORM_CHUNK, len(points))
+        first, last = weights.offsets[start], weights.offsets[end]
+        if first == last:
+            continue
+        rows = np.repeat(np.arange(start, end), counts[start:end])
+        homogeneous = np.c_[points[rows], np.ones(len(rows))]
+        # every weight moves its point by its joint, the moved points of a vertex are summed
+        moved = np.einsum('ek,peka->pea', homogeneous, matrices[:, weights.joint_indices[first:last]])
+        moved *= weights.weights[first:last, None]
+        chunk_counts = counts[start:end]
+        weighted = chunk_counts > 0
+        starts = (weights.offsets[start:end] - first)[weighted]
+        result[:, start:end][:, weighted] = np.add.reduceat(moved, starts, axis=1)
+    return result
+
+
+def vertex_areas(mesh):
+    '''area around every vertex, every face giving an equal part of its area to each of its vertices
+    '''
+    face_areas = np.linalg.norm(face_normals(mesh), axis=1)
+    corner_areas = np.repeat(face_areas / mesh.face_counts, mesh.face_counts)
+    return np.bincount(mesh.face_connects, weights=corner_areas, minlength=mesh.num_points)
+
+
+def nearest_joints(points, joint_positions, count):
+    '''(points, count) indices of the nearest joints of every point, nearest first, and their squared distances
+    '''
+    joint_positions = np.asarray(joint_positions, dtype=np.float64).reshape(-1, 3)
+    count = min(count, len(joint_positions))
+    nearest = np.empty((len(points), count), dtype=np.int64)
+    squared = np.empty((len(points), count))
+    joint_lengths = (joint_positions ** 2).sum(axis=1)
+    for start in range(0, len(points), DISTANCE_CHUNK):
+        chunk = np.asarray(points[start:start + DISTANCE_CHUNK], dtype=np.float64)
+        table = (chunk ** 2).sum(axis=1)[:, None] - 2.0 * chunk.dot(joint_positions.T) + joint_lengths
+        if count < table.shape[1]:
+            part = np.argpartition(table, count - 1, axis=1)[:, :count]
+        else:
+            part = np.broadcast_to(np.arange(count), table.shape).copy()
+        part_squared = np.take_along_axis(table, part, axis=1)
+        order = np.argsort(part_squared, axis=1)
+        nearest[start:start + len(chunk)] = np.take_along_axis(part, order, axis=1)
+        squared[start:start + len(chunk)] = np.maximum(np.take_along_axis(part_squared, order, axis=1), 0.0)
+    return nearest, squared
+
+
+def conjugate_gradient(apply, rhs, start, inverse_diagonal, tolerance=1e-4, max_iterations=500):
+    '''solve apply(x) = rhs for a symmetric positive definite operator with a Jacobi preconditioner, until no
+    unknown would move by more than tolerance in a Jacobi step. Returns the solution and the iterations it took
+    '''
+    x = start.copy()
+    residual = rhs - apply(x)
+    z = residual * inverse_diagonal
+    direction = z.copy()
+    rz = residual.dot(z)
+    for iteration in range(max_iterations):
+        if np.abs(z).max() <= tolerance:
+            return x, iteration
+        product = apply(direction)
+        step = rz / direction.dot(product)
+        x += step * direction
+        residual -= step * product
+        z = residual * inverse_diagonal
+        rz_next = residual.dot(z)
+        direction = z + (rz_next / rz) * direction
+        rz = rz_next
+    return x, max_iterations
+
+
+def _clusters(points, areas, target):
+    '''group points into about target clusters on a voxel grid over the surface, returns the cluster of every point
+    '''
+    cell = max(np.sqrt(areas.sum() / max(target, 1)), 1e-12)
+    cells = np.floor((points - points.min(axis=0)) / cell).astype(np.int64)
+    size = cells.max(axis=0) + 1
+    keys = (cells[:, 0] * size[1] + cells[:, 1]) * size[2] + cells[:, 2]
+    return np.unique(keys, return_inverse=True)[1].ravel()
+
+
+def _solve_level(points, areas, edge_list, joint_positions, slots, heat, tolerance, max_iterations):
+    '''heat diffusion on one level of the mesh, started from the solution of a coarser level when there are
+    many points. Returns the (points, slots) solution, the nearest joints of every slot and the iterations
+    '''
+    count = len(points)
+    nearest, squared = nearest_joints(points, joint_positions, slots)
+    slots = nearest.shape[1]
+
+    # every unknown is a (vertex, candidate slot) pair, coupled to the slot of the same joint of each neighbour
+    ends = np.r_[edge_list[:, 0], edge_list[:, 1]]
+    others = np.r_[edge_list[:, 1], edge_list[:, 0]]
+    degree = np.bincount(ends, minlength=count).astype(np.float64)
+    edge_index, slot, other_slot = np.nonzero(nearest[ends][:, :, None] == nearest[others][:, None, :])
+    rows = ends[edge_index] * slots + slot
+    columns = others[edge_index] * slots + other_slot
+
+    # the heat term, for the nearest joint only, scaled so the result does not depend on the mesh resolution
+    floor = max(1e-6 * float(np.ptp(points, axis=0).max()), 1e-12)
+    pull = areas * heat / np.maximum(squared[:, 0], floor ** 2)
+    diagonal = np.repeat(degree + pull, slots)
+    rhs = np.zeros((count, slots))
+    rhs[:, 0] = pull
+    rhs = rhs.ravel()
+
+    def apply(x):
+        return diagonal * x - np.bincount(rows, weights=x[columns], minlength=len(x))
+
+    if count > COARSEST:
+        # solve a coarser copy of the surface first, most of the work of spreading the heat far is done there
+        cluster = _clusters(points, areas, count // COARSENING)
+        cluster_count = cluster.max() + 1
+        sizes = np.bincount(cluster, minlength=cluster_count)[:, None]
+        coarse_points = np.stack([np.bincount(cluster, weights=points[:, axis], minlength=cluster_count)
+                                  for axis in range(3)], axis=1) / sizes
+        pairs = np.sort(cluster[edge_list], axis=1)
+        pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+        keys = np.unique(pairs[:, 0] * cluster_count + pairs[:, 1])
+        coarse, coarse_nearest, iterations = _solve_level(
+            coarse_points, np.bincount(cluster, weights=areas, minlength=cluster_count),
+            np.c_[keys // cluster_count, keys % cluster_count], joint_positions, slots, heat, tolerance * COARSE_TOLERANCE,
+            max_iterations * 2)
+        # every vertex starts with the weights of its cluster, for the joints both have as candidates
+        matches = nearest[:, :, None] == coarse_nearest[cluster][:, None, :]
+        start = (matches * coarse[cluster][:, None, :]).sum(axis=2).ravel()
+    else:
+        # start from every vertex belonging to its nearest joint
+        start = (rhs > 0).astype(np.float64)
+        iterations = 0
+    solution, level_iterations = conjugate_gradient(apply, rhs, start, 1.0 / diagonal, tolerance, max_iterations)
+    return solution.reshape(count, slots), nearest, iterations + level_iterations
+
+
+def heat_weights(mesh, joint_names, joint_positions, max_influences=MAX_INFLUENCES, candidates=CANDIDATES,
+                 heat=1.0, tolerance=1e-4, max_iterations=500):
+    '''solve the heat diffusion skin weights of the joints over a mesh, returns a SkinWeights with at most
+    max_influences weights per vertex, normalized to sum to 1
+    '''
+    start = time.perf_counter()
+    count = mesh.num_points
+    edge_list = mesh_edges(mesh)
+    solution, nearest, iterations = _solve_level(
+        mesh.points.astype(np.float64), vertex_areas(mesh), edge_list, joint_positions,
+        max(candidates, max_influences), heat, tolerance, max_iterations)
+    solution = np.clip(solution, 0.0, None)
+    slots = nearest.shape[1]
+    # keep the largest weights, a vertex the heat did not reach goes to its nearest joint
+    if max_influences < slots:
+        dropped = np.argsort(-solution, axis=1)[:, max_influences:]
+        np.put_along_axis(solution, dropped, 0.0, axis=1)
+    totals = solution.sum(axis=1)
+    cold = totals <= 0
+    solution[cold, 0] = 1.0
+    totals[cold] = 1.0
+    solution /= totals[:, None]
+    solution[solution < 1e-4] = 0.0
+    solution /= solution.sum(axis=1)[:, None]
+
+    kept = solution > 0
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(kept.sum(axis=1), out=offsets[1:])
+    last_solve.clear()
+    last_solve.update(unknowns=solution.size, iterations=iterations, seconds=time.perf_counter() - start)
+    return SkinWeights(joint_names, offsets, nearest[kept], solution[kept])
@@ -0,0 +1,347 @@
+'''Spatial lookups on the points of a mesh, without Maya.
+
+KDTree is a balanced k-d tree built with NumPy one level at a time, every
+node split at the median of its widest axis, and queried in batches. Every
+query first walks down to its own leaf for a first nearest point, then every
+leaf whose box is closer than that is searched, one tree level at a time for
+all the queries together:
+
+    tree = spatial.KDTree(source.points)
+    distances, indices = tree.query(target.points)
+    offsets, indices = tree.query_radius(target.points, 0.5)
+
+MeshIndex holds the trees of one mesh, over its vertices and over its face
+centres, and its left/right symmetry maps, each made the first time it is
+asked for. A few nearest queries on a mesh without a tree yet are answered by
+scanning all its points, which is cheaper than building the tree for them.
+mesh_index() keeps one MeshIndex per Mesh, so the placement, the mirroring and
+the skinning of a build share them:
+
+    index = spatial.mesh_index(geometry.get_mesh('Head'))
+    faces = index.nearest_faces(positions)
+    right = index.symmetry()[left_vertices]
+'''
+import weakref
+
+import numpy as np
+
+LEAF_SIZE = 16
+# queries searched together, bounds the memory of a batch
+QUERY_CHUNK = 16384
+# a MeshIndex answers up to this many nearest queries by scanning all the points while it has no tree yet,
+# building the tree only pays for itself over more queries than that
+SCAN_QUERIES = 64
+# points scanned at a time
+SCAN_CHUNK = 65536
+# a vertex without a mirror counterpart closer than this, times the size of the mesh, has none
+SYMMETRY_TOLERANCE = 1e-3
+# elementwise signs of a reflection across the YZ plane, the mirror plane of the rig
+REFLECTION = np.array([-1.0, 1.0, 1.0])
+
+_mesh_indexes = weakref.WeakKeyDictionary()
+
+
+class KDTree(object):
+    '''a k-d tree over (n, 3) points, the nodes kept in heap order: the children of node i are 2i + 1 and 2i + 2
+    '''
+    def __init__(self, points, leaf_size=LEAF_SIZE):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        count = len(points)
+        if not count:
+            raise ValueError('a KDTree needs at least one point')
+        self.points = points
+        self.depth = max(int(np.ceil(np.log2(count / float(leaf_size)))), 0)
+        inner = 2 ** self.depth - 1
+        self.split_axes = np.zeros(inner, dtype=np.int64)
+        self.split_values = np.zeros(inner)
+        order = np.arange(count)
+        for level in range(self.depth):
+            nodes = 2 ** level
+            starts = np.arange(nodes) * count // nodes
+            node_of = np.repeat(np.arange(nodes), np.diff(np.r_[starts, count]))
+            ordered = points[order]
+            extent = np.maximum.reduceat(ordered, starts) - np.minimum.reduceat(ordered, starts)
+            axes = np.argmax(extent, axis=1)
+            # sort every node's points along its own widest axis, the right half becomes the right child.
+            # One sort for all the nodes, on the node number plus the place of the point inside its node
+            lows = np.minimum.reduceat(ordered, starts)[np.arange(nodes), axes]
+            spans = np.maximum(extent[np.arange(nodes), axes], 1e-300) * (1.0 + 1e-9)
+            place = (ordered[np.arange(count), axes[node_of]] - lows[node_of]) / spans[node_of]
+            order = order[np.argsort(node_of + place, kind='stable')]
+            middles = (2 * np.arange(nodes) + 1) * count // (2 * nodes)
+            self.split_axes[nodes - 1:2 * nodes - 1] = axes
+            self.split_values[nodes - 1:2 * nodes - 1] = points[order[middles], axes]
+
+        # the points of every leaf, padded with an index past the end that stands for a point at infinity
+        leaves = 2 ** self.depth
+        starts = np.arange(leaves) * count // leaves
+        sizes = np.diff(np.r_[starts, count])
+        slots = np.arange(sizes.max())
+        self.leaf_points = np.where(slots < sizes[:, None], order[np.minimum(starts[:, None] + slots, count - 1)], count)
+        self._padded = np.r_[points, np.full((1, 3), np.inf)]
+
+        # bounding boxes of every node, the leaves from their points and then up to the root
+        ordered = points[order]
+        lows = np.zeros((inner + leaves, 3))
+        highs = np.zeros((inner + leaves, 3))
+        lows[inner:] = np.minimum.reduceat(ordered, starts)
+        highs[inner:] = np.maximum.reduceat(ordered, starts)
+        for level in range(self.depth - 1, -1, -1):
+            nodes = np.arange(2 ** level - 1, 2 ** (level + 1) - 1)
+            lows[nodes] = np.minimum(lows[2 * nodes + 1], lows[2 * nodes + 2])
+            highs[nodes] = np.maximum(highs[2 * nodes + 1], highs[2 * nodes + 2])
+        self._lows, self._highs = lows, highs
+
+    def __len__(self):
+        return len(self.points)
+
+    def _scan(self, queries, leaves):
+        '''squared distance and index of the nearest point of a leaf, for every (query, leaf) pair
+        '''
+        candidates = self.leaf_points[leaves]
+        squared = ((self._padded[candidates] - queries[:, None, :]) ** 2).sum(axis=2)
+        nearest = np.argmin(squared, axis=1)
+        rows = np.arange(len(candidates))
+        return squared[rows, nearest], candidates[rows, nearest]
+
+    def _query_chunk(self, queries):
+        count = len(queries)
+        first_leaf = 2 ** self.depth - 1
+        # walk down to the leaf every query falls in
+        node = np.zeros(count, dtype=np.int64)
+        for level in range(self.depth):
+            right = queries[np.arange(count), self.split_axes[node]] >= self.split_values[node]
+            node = 2 * node + 1 + right
+        own_leaf = node - first_leaf
+        best, best_index = self._scan(queries, own_leaf)
+
+        # every other leaf with a box closer than the first nearest point, for the queries whose nearest
+        # point is further away than the side of their own leaf
+        inside = np.minimum(queries - self._lows[node], self._highs[node] - queries).min(axis=1)
+        pairs = np.flatnonzero((inside < 0) | (inside ** 2 < best))
+        nodes = np.zeros(len(pairs), dtype=np.int64)
+        for level in range(self.depth):
+            pairs = np.repeat(pairs, 2)
+            nodes = (2 * np.repeat(nodes, 2) + 1) + np.tile([0, 1], len(nodes))
+            points = queries[pairs]
+            gap = np.maximum(np.maximum(self._lows[nodes] - points, points - self._highs[nodes]), 0.0)
+            closer = (gap ** 2).sum(axis=1) < best[pairs]
+            pairs, nodes = pairs[closer], nodes[closer]
+        leaves = nodes - first_leaf
+        other = leaves != own_leaf[pairs]
+        pairs, leaves = pairs[other], leaves[other]
+        if len(pairs):
+            squared, index = self._scan(queries[pairs], leaves)
+            # the closest found per query, nearest first then one per query
+            order = np.lexsort((squared, pairs))
+            pairs, squared, index = pairs[order], squared[order], index[order]
+            first = np.r_[True, pairs[1:] != pairs[:-1]]
+            pairs, squared, index = pairs[first], squared[first], index[first]
+            better = squared < best[pairs]
+            best[pairs[better]] = squared[better]
+            best_index[pairs[better]] = index[better]
+        return np.sqrt(best), best_index
+
+    def query(self, queries):
+        '''distance to and index of the nearest point of every query point
+        '''
+        queries = np.asarray(queries, dtype=np.float64).reshape(-1, 3)
+        distances = np.empty(len(queries))
+        indices = np.empty(len(queries), dtype=np.int64)
+        for start in range(0, len(queries), QUERY_CHUNK):
+            chunk = slice(start, start + QUERY_CHUNK)
+            distances[chunk], indices[chunk] = self._query_chunk(queries[chunk])
+        return distances, indices
+
+    def _radius_chunk(self, queries, radius):
+        # every leaf with a box within the radius, one tree level at a time
+        pairs = np.arange(len(queries))
+        nodes = np.zeros(len(queries), dtype=np.int64)
+        for level in range(self.depth):
+            pairs = np.repeat(pairs, 2)
+            nodes = (2 * np.repeat(nodes, 2) + 1) + np.tile([0, 1], len(nodes))
+            points = queries[pairs]
+            gap = np.maximum(np.maximum(self._lows[nodes] - points, points - self._highs[nodes]), 0.0)
+            near = (gap ** 2).sum(axis=1) <= radius[pairs] ** 2
+            pairs, nodes = pairs[near], nodes[near]
+        candidates = self.leaf_points[nodes - (2 ** self.depth - 1)]
+        squared = ((self._padded[candidates] - queries[pairs][:, None, :]) ** 2).sum(axis=2)
+        # pairs stay in query order, so the hits do too
+        hit_rows, hit_slots = np.nonzero(squared <= (radius[pairs] ** 2)[:, None])
+        return np.bincount(pairs[hit_rows], minlength=len(queries)), candidates[hit_rows, hit_slots]
+
+    def query_radius(self, queries, radius):
+        '''the points within radius of every query point, radius is one value or one per query.
+        Returns a CSR: the points of query i are indices[offsets[i]:offsets[i + 1]], in no particular order
+        '''
+        queries = np.asarray(queries, dtype=np.float64).reshape(-1, 3)
+        radius = np.broadcast_to(np.asarray(radius, dtype=np.float64), (len(queries),))
+        counts, indices = [], []
+        for start in range(0, len(queries), QUERY_CHUNK):
+            chunk = slice(start, start + QUERY_CHUNK)
+            chunk_counts, chunk_indices = self._radius_chunk(queries[chunk], radius[chunk])
+            counts.append(chunk_counts)
+            indices.append(chunk_indices)
+        offsets = np.zeros(len(queries) + 1, dtype=np.int64)
+        if counts:
+            np.cumsum(np.concatenate(counts), out=offsets[1:])
+        return offsets, np.concatenate(indices) if indices else np.zeros(0, dtype=np.int64)
+
+
+def scan_nearest(points, queries, lengths=None):
+    '''distance to and index of the nearest of points for every query, by scanning all the points.
+    Cheaper than a tree for a few queries. lengths are the squared lengths of the points, when known
+    '''
+    points = np.asarray(points)
+    if lengths is None:
+        lengths = (np.asarray(points, dtype=np.float64) ** 2).sum(axis=1)
+    queries = np.asarray(queries, dtype=np.float64).reshape(-1, 3)
+    best = np.full(len(queries), np.inf)
+    best_index = np.zeros(len(queries), dtype=np.int64)
+    query_lengths = (queries ** 2).sum(axis=1)
+    for start in range(0, len(points), SCAN_CHUNK):
+        chunk = np.asarray(points[start:start + SCAN_CHUNK], dtype=np.float64)
+        table = lengths[start:start + SCAN_CHUNK, None] - 2.0 * chunk.dot(queries.T) + query_lengths
+        nearest = np.argmin(table, axis=0)
+        squared = table[nearest, np.arange(len(queries))]
+        better = squared < best
+        best[better] = squared[better]
+        best_index[better] = nearest[better] + start
+    return np.sqrt(np.maximum(best, 0.0)), best_index
+
+
+def symmetry_map(tree, points=None, tolerance=0.0):
+    '''index of the mirror image across the YZ plane of every point of a tree, or of the given points,
+    among the points of the tree. -1 where no point is within tolerance of the mirror image
+    '''
+    points = tree.points if points is None else np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    distances, indices = tree.query(points * REFLECTION)
+    indices[distances > tolerance] = -1
+    return indices
+
+
+class _Scan(object):
+    '''stands in for the KDTree of a mesh that has none yet, for a few queries
+    '''
+    def __init__(self, points):
+        self.points = points
+        self.lengths = (np.asarray(points, dtype=np.float64) ** 2).sum(axis=1)
+
+    def query(self, queries):
+        return scan_nearest(self.points, queries, self.lengths)
+
+
+class MeshIndex(object):
+    '''the spatial lookups of one mesh, every tree and map built the first time it is used.
+    Up to SCAN_QUERIES nearest queries are scanned while a tree is not built yet
+    '''
+    def __init__(self, mesh):
+        self.mesh = mesh
+        self._vertex_tree = None
+        self._face_tree = None
+        self._face_centroids = None
+        self._scans = {}
+        self._size = None
+        self._symmetry = {}
+        self._face_symmetry = {}
+
+    def __repr__(self):
+        return 'MeshIndex(%r)' % self.mesh
+
+    @property
+    def vertex_tree(self):
+        if self._vertex_tree is None:
+            self._vertex_tree = KDTree(self.mesh.points)
+        return self._vertex_tree
+
+    @property
+    def face_centroids(self):
+        if self._face_centroids is None:
+            self._face_centroids = self.mesh.face_centroids()
+        return self._face_centroids
+
+    @property
+    def face_tree(self):
+        if self._face_tree is None:
+            self._face_tree = KDTree(self.face_centroids)
+        return self._face_tree
+
+    def _scan(self, key, points):
+        scan = self._scans.get(key)
+        if scan is None:
+            scan = self._scans[key] = _Scan(points)
+        return scan
+
+    def _vertex_lookup(self, count):
+        if self._vertex_tree is None and count <= SCAN_QUERIES:
+            return self._scan('vertices', self.mesh.points)
+        return self.vertex_tree
+
+    def _face_lookup(self, count):
+        if self._face_tree is None and count <= SCAN_QUERIES:
+            return self._scan('faces', self.face_centroids)
+        return self.face_tree
+
+    def _tolerance(self, tolerance):
+        if tolerance is None:
+            if self._size is None:
+                self._size = float(np.ptp(np.asarray(self.mesh.points), axis=0).max())
+            tolerance = SYMMETRY_TOLERANCE * self._size
+        return tolerance
+
+    def nearest_vertices(self, positions):
+        '''index of the vertex nearest to each position
+        '''
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        return self._vertex_lookup(len(positions)).query(positions)[1]
+
+    def nearest_faces(self, positions):
+        '''index of the face whose centre is nearest to each position
+        '''
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        return self._face_lookup(len(positions)).query(positions)[1]
+
+    def vertices_within(self, positions, radius):
+        '''(offsets, vertices) CSR of the vertices within radius of each position
+        '''
+        return self.vertex_tree.query_radius(positions, radius)
+
+    def symmetry(self, tolerance=None):
+        '''the mirror vertex of every vertex across the YZ plane, -1 for a vertex without one.
+        tolerance defaults to SYMMETRY_TOLERANCE times the size of the mesh
+        '''
+        tolerance = self._tolerance(tolerance)
+        mirrored = self._symmetry.get(tolerance)
+        if mirrored is None:
+            mirrored = self._symmetry[tolerance] = symmetry_map(self.vertex_tree, tolerance=tolerance)
+            mirrored.setflags(write=False)
+        return mirrored
+
+    def mirror_vertices(self, vertices, tolerance=None):
+        '''the mirror vertex of some vertices, from the symmetry map when it is built, -1 for a vertex without one
+        '''
+        tolerance = self._tolerance(tolerance)
+        mirrored = self._symmetry.get(tolerance)
+        if mirrored is not None:
+            return mirrored[vertices]
+        points = self.mesh.points[vertices]
+        return symmetry_map(self._vertex_lookup(len(points)), points, tolerance)
+
+    def face_symmetry(self, tolerance=None):
+        '''the mirror face of every face across the YZ plane, matched by their centres, -1 for a face without one
+        '''
+        tolerance = self._tolerance(tolerance)
+        mirrored = self._face_symmetry.get(tolerance)
+        if mirrored is None:
+            mirrored = self._face_symmetry[tolerance] = symmetry_map(self.face_tree, tolerance=tolerance)
+            mirrored.setflags(write=False)
+        return mirrored
+
+
+def mesh_index(mesh):
+    '''the MeshIndex of a Mesh, made once and kept for as long as the Mesh is
+    '''
+    index = _mesh_indexes.get(mesh)
+    if index is None:
+        index = _mesh_indexes[mesh] = MeshIndex(mesh)
+    return index
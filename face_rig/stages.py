@@ -0,0 +1,736 @@
+'''The rig stages of the Auto Face Rig tool.
+
+Every stage is a plain function that works on the active scene (see
+face_rig.scene), so the stages can run from the UI buttons, from the batch
+driver or against a stand-in scene without Maya. The stages behind the UI
+buttons each run as one transaction (see face_rig.transaction), a single undo
+step that is rolled back if the stage fails.
+'''
+from face_rig import transaction
+from face_rig.lazy import lazy_import
+from face_rig.scene import cmds, get_scene
+
+# the modules doing the work of the stages, imported when a stage first needs them so importing the
+# stages does no work, see face_rig.lazy
+build_graph = lazy_import('face_rig.build_graph')
+connections = lazy_import('face_rig.connections')
+controls = lazy_import('face_rig.controls')
+edge_loops = lazy_import('face_rig.edge_loops')
+expressions = lazy_import('face_rig.expressions')
+geometry = lazy_import('face_rig.geometry')
+landmarks = lazy_import('face_rig.landmarks')
+mirror = lazy_import('face_rig.mirror')
+preview = lazy_import('face_rig.preview')
+proxy = lazy_import('face_rig.proxy')
+scheduler = lazy_import('face_rig.scheduler')
+selection = lazy_import('face_rig.selection')
+skinning = lazy_import('face_rig.skinning')
+spatial = lazy_import('face_rig.spatial')
+template = lazy_import('face_rig.template')
+weights_io = lazy_import('face_rig.weights_io')
+
+
+selected_faces = []
+generated_joints = []
+# the (mesh, face) of every pick joint as the joints were generated, and the build graph made from them
+built_picks = []
+rig_graph = None
+
+
+def _save_state():
+    '''the state of the stages and the registered controls when a transaction opens, put back when it
+    rolls back, see transaction.keep_state
+    '''
+    saved = list(selected_faces), list(generated_joints), list(built_picks), list(controls.registry)
+
+    def restore():
+        global selected_faces, generated_joints, built_picks, rig_graph
+        selected_faces, generated_joints, built_picks = list(saved[0]), list(saved[1]), list(saved[2])
+        controls.registry[:] = saved[3]
+        # the graph may hold a pick of the undone transaction, it is made again from built_picks
+        rig_graph = None
+    return restore
+
+transaction.keep_state(_save_state)
+
+@transaction.stage
+def auto_skin(*args):
+    '''Gets all children of the root joint, filters out joints
+    that are not needed and binds the joints to the mesh,
+    then replaces the bind weights with heat diffusion weights (see face_rig.skinning)
+    '''
+    plan = template.active_plan()
+    root_joint = plan.roles['head']
+    mesh_name = plan.mesh
+    child_joints = cmds.listRelatives(root_joint, allDescendents=True, type='joint')
+    filtered_joints = [j for j in child_joints if j not in [plan.roles['left_eye'], plan.roles['right_eye']]]
+    # Select all remaining joints
+    cmds.select(filtered_joints+[mesh_name])
+    # Skin bind the selected joints to the selected mesh
+    skin_cluster = cmds.skinCluster(filtered_joints, mesh_name, toSelectedBones=True,  normalizeWeights=1, bindMethod=1, skinMethod=1, ignoreHierarchy=True)
+    # solve the weights on the mesh arrays and write them all in one go
+    mesh = geometry.get_mesh(mesh_name)
+    joint_positions = [geometry.position(joint) for joint in filtered_joints]
+    if mesh.num_points > proxy.PROXY_POINTS:
+        # a dense head is solved on its proxy and the weights carried back to every point
+        head_proxy = proxy.mesh_proxy(mesh)
+        weights = proxy.transfer_weights(head_proxy, skinning.heat_weights(head_proxy.mesh, filtered_joints, joint_positions),
+                                         mesh.points)
+    else:
+        weights = skinning.heat_weights(mesh, filtered_joints, joint_positions)
+    get_scene().set_skin_weights(skin_cluster[0], weights)
+    
+def find_skin_cluster(mesh_name):
+    '''the skin cluster deforming a mesh
+    '''
+    skin_clusters = cmds.ls(cmds.listHistory(mesh_name), type='skinCluster')
+    if not skin_clusters:
+        raise ValueError('%s is not skinned, run Auto Skin first' % mesh_name)
+    return skin_clusters[0]
+    
+def save_skin_weights(path, mesh_name=None):
+    '''save the skin weights of the head to a binary weights file, see face_rig.weights_io
+    '''
+    mesh_name = mesh_name or template.active_plan().mesh
+    weights = get_scene().get_skin_weights(find_skin_cluster(mesh_name))
+    weights_io.save_weights(path, weights, geometry.get_mesh(mesh_name).points, mesh_name)
+    
+@transaction.stage
+def load_skin_weights(path, mesh_name=None):
+    '''put saved skin weights back on the head, matched to the joints by name and to the vertices
+    by position when the mesh changed, and written in one go
+    '''
+    mesh_name = mesh_name or template.active_plan().mesh
+    skin_cluster = find_skin_cluster(mesh_name)
+    weights, saved_points, header = weights_io.load_weights(path)
+    influences = cmds.skinCluster(skin_cluster, query=True, influence=True)
+    weights = weights_io.remap_weights(weights, influences, saved_points, geometry.get_mesh(mesh_name).points)
+    get_scene().set_skin_weights(skin_cluster, weights)
+    
+@transaction.stage
+def mirror_skin_weights(*args):
+    '''copy the skin weights of the left side of the head to the right side, vertex by mirror vertex
+    '''
+    plan = template.active_plan()
+    mesh = geometry.get_mesh(plan.mesh)
+    skin_cluster = find_skin_cluster(plan.mesh)
+    weights = skinning.mirror_weights(get_scene().get_skin_weights(skin_cluster), mesh.points,
+                                      spatial.mesh_index(mesh).symmetry(), plan.mirror['search'], plan.mirror['replace'])
+    get_scene().set_skin_weights(skin_cluster, weights)
+    
+def save_skin_weights_file(*args):
+    '''ask for a file and save the skin weights of the head to it
+    '''
+    paths = cmds.fileDialog2(fileFilter='Skin Weights (*%s)' % weights_io.WEIGHTS_EXTENSION, fileMode=0)
+    if paths:
+        save_skin_weights(paths[0])
+    
+def load_skin_weights_file(*args):
+    '''ask for a saved weights file and put its weights on the head
+    '''
+    paths = cmds.fileDialog2(fileFilter='Skin Weights (*%s)' % weights_io.WEIGHTS_EXTENSION, fileMode=1)
+    if paths:
+        load_skin_weights(paths[0])
+    
+def expression_poses(presets_path=None):
+    '''the expression presets by name, with the mirrored right side poses, see face_rig.expressions
+    '''
+    presets, mirror_names = expressions.load_presets(presets_path or expressions.DEFAULT_PRESETS)
+    return expressions.expand_presets(presets, mirror_names['search'], mirror_names['replace'])
+    
+@transaction.stage
+def pose_expression(name, weight=1.0, presets_path=None):
+    '''pose the controls as an expression preset, weight scales the pose
+    '''
+    pose = expression_poses(presets_path).get(name)
+    if pose is None:
+        raise ValueError('there is no expression preset called %s' % name)
+    # the presets move the controls in control diameters
+    unit = control_unit()
+    for control, channels in pose.items():
+        if 'translate' in channels:
+            cmds.setAttr(control + '.translate', *[value * unit * weight for value in channels['translate']])
+        if 'rotate' in channels:
+            cmds.setAttr(control + '.rotate', *[value * weight for value in channels['rotate']])
+    
+@transaction.stage
+def reset_expression(*args, **kwargs):
+    '''put every control an expression preset moves back to its rest pose
+    '''
+    posed = set(control for pose in expression_poses(kwargs.get('presets_path')).values() for control in pose)
+    for control in sorted(posed):
+        if cmds.objExists(control):
+            cmds.setAttr(control + '.translate', 0, 0, 0)
+            cmds.setAttr(control + '.rotate', 0, 0, 0)
+    
+def save_expression_shapes(path, presets_path=None):
+    '''deform the skinned head into every expression preset and save the sparse shapes, the right side
+    shapes mirrored from the left ones, see face_rig.expressions. Returns the ShapeLibrary
+    '''
+    plan = template.active_plan()
+    mesh = geometry.get_mesh(plan.mesh)
+    weights = get_scene().get_skin_weights(find_skin_cluster(plan.mesh))
+    presets, mirror_names = expressions.load_presets(presets_path or expressions.DEFAULT_PRESETS)
+    missing = sorted(set(control for pose in presets.values() for control in pose if not cmds.objExists(control)))
+    if missing:
+        raise ValueError('the expression presets move controls the rig does not have: %s' % ', '.join(missing))
+    unit = control_unit()
+    rig = expressions.PoseRig.from_scene(weights.joint_names, plan.control_suffix, unit)
+    library = expressions.generate(mesh.points, weights, rig, presets, spatial.mesh_index(mesh).symmetry(),
+                                   mirror_names['search'], mirror_names['replace'])
+    expressions.save_shapes(path, library)
+    return library
+    
+def save_expression_shapes_file(*args):
+    '''ask for a file and save the expression shapes of the head to it
+    '''
+    paths = cmds.fileDialog2(fileFilter='Expression Shapes (*%s)' % expressions.SHAPES_EXTENSION, fileMode=0)
+    if paths:
+        library = save_expression_shapes(paths[0])
+        cmds.warning('%d expression shapes saved, %d KB' % (len(library.names), library.nbytes // 1024))
+    
+def save_preview_rig(path, mesh_name=None):
+    '''save the joints, skin weights and bind points of the head to a preview rig file, to pose and
+    bake it without Maya, see face_rig.preview. The rig should be in its bind pose
+    '''
+    mesh_name = mesh_name or template.active_plan().mesh
+    rig = preview.PreviewRig.from_scene(mesh_name, find_skin_cluster(mesh_name))
+    rig.save(path)
+    return rig
+    
+def save_preview_rig_file(*args):
+    '''ask for a file and save the preview rig of the head to it
+    '''
+    paths = cmds.fileDialog2(fileFilter='Preview Rig (*%s)' % preview.RIG_EXTENSION, fileMode=0)
+    if paths:
+        save_preview_rig(paths[0])
+    
+def selected_face_sets():
+    '''the faces of every mesh in the selection as an ordered {mesh: FaceSet}, ranges such as f[10:250]
+    included, see face_rig.selection. None with a warning when no faces are selected
+    '''
+    faces, ignored = selection.parse_components(cmds.ls(selection=True),
+                                                lambda mesh_name: geometry.get_mesh(mesh_name).num_faces)
+    if not faces:
+        cmds.warning('Please select faces on the mesh in the format "mesh.f[#]", "mesh.f[#:#]" or "mesh.f[#,#,#]"')
+        return None
+    if ignored:
+        cmds.warning('Only faces are stored, %d other selected items were left out' % len(ignored))
+    return faces
+    
+def selected_face_indices():
+    '''the (mesh, FaceSet) of the selected faces of the first selected mesh, None with a warning when
+    no faces are selected
+    '''
+    faces = selected_face_sets()
+    if faces is None:
+        return None
+    return next(iter(faces.items()))
+    
+def add_face_selection(*args):
+    '''stores the selected faces when the user adds the face selection, one selection for every
+    mesh they are on, kept as runs of faces so a region pick stays small
+    '''
+    faces = selected_face_sets()
+    if faces is None:
+        return
+
+    # Store the selected faces
+    global selected_faces
+    selected_faces += list(faces.items())
+    cmds.warning('Selected face stored')
+    
+def replace_face_selection(joint_name):
+    '''give the pick of one joint the selected face instead, moving what depends on it when the rig is built
+    '''
+    selection = selected_face_indices()
+    if selection is None:
+        return
+    mesh, face_indices = selection
+    update_face_pick(joint_name, mesh, face_indices[0])
+    cmds.warning('Face selection of %s replaced' % joint_name)
+    
+def current_rig_graph():
+    '''the build graph of the generated joints, made the first time a pick changes after they were generated
+    '''
+    global rig_graph
+    plan = template.active_plan()
+    if rig_graph is None or rig_graph.plan is not plan:
+        rig_graph = build_graph.RigGraph(plan, built_picks, geometry.get_mesh(plan.mesh), calculate_mesh_width(plan.mesh))
+    return rig_graph
+    
+@transaction.stage
+def update_face_pick(joint_name, mesh_name, face):
+    '''give one pick joint a new face. When the joints are generated only the joints and controls that depend
+    on the pick are moved, in place, instead of building the rig again. Returns the moved nodes
+    '''
+    global selected_faces
+    plan = template.active_plan()
+    if joint_name not in plan.picks:
+        raise ValueError('%s is not a pick of the %s template' % (joint_name, plan.name))
+    index = plan.picks.index(joint_name)
+    picks = [(mesh, pick) for mesh, faces in selected_faces for pick in faces]
+    if index < len(picks):
+        picks[index] = (mesh_name, face)
+        selected_faces = [(mesh, [pick]) for mesh, pick in picks]
+    if len(built_picks) != len(plan.picks) or not cmds.objExists(joint_name):
+        return []
+    graph = current_rig_graph()
+    moved = build_graph.apply(graph, graph.set_pick(joint_name, (mesh_name, face)), plan.control_suffix)
+    built_picks[index] = (mesh_name, face)
+    if cmds.ls(cmds.listHistory(plan.mesh), type='skinCluster') and moved:
+        cmds.warning('The joints moved after skinning, run Auto Skin Joints again')
+    return moved
+    
+def auto_place_faces(*args):
+    '''finds the faces to place the joints on automatically and stores them as the face selection,
+    in the same order the user would select them by hand
+    '''
+    geometry.cache.invalidate()
+    plan = template.active_plan()
+    head = geometry.get_mesh(plan.mesh)
+    # on a dense head the landmarks are found on its proxy, the picks are still faces of the head
+    search_mesh = proxy.mesh_proxy(head).mesh if head.num_points > proxy.PROXY_POINTS else None
+    left_eye, right_eye = plan.eye_meshes
+    picks = landmarks.detect_face_picks(head, geometry.get_mesh(left_eye), geometry.get_mesh(right_eye),
+                                        names=plan.picks, search_mesh=search_mesh)
+    global selected_faces
+    selected_faces = [(plan.mesh, [face]) for face in picks]
+    cmds.warning('Face selections placed automatically')
+    
+@transaction.stage
+def create_joints(*args):
+    '''Generates joints on the face from the stored face selection
+    '''
+    global selected_faces
+    if not selected_faces:
+        cmds.warning('Please select the specified faces on the mesh')
+        return
+    
+    # a new build, forget everything read from the scene before
+    geometry.cache.invalidate()
+    global built_picks, rig_graph
+    built_picks = [(mesh, face) for mesh, faces in selected_faces for face in faces]
+    rig_graph = None
+    plan = template.active_plan()
+    radius=calculate_mesh_width(plan.mesh)
+    global generated_joints
+    delete_existing(generated_joints)
+    generated_joints = []
+    cmds.select(clear=True)
+    # Read each mesh once and find the middle of every stored face in one pass
+    face_centres = geometry.selection_centroids(selected_faces)
+    if sum(len(centres) for centres in face_centres) != len(plan.picks):
+        cmds.warning('The %s template expects %d faces' % (plan.name, len(plan.picks)))
+    for centres in face_centres:
+        for avg_pos in centres:
+            # Create the joint at the average position with the calculated automatic radius,
+            # named after the template pick it stands for
+            names = {}
+            if len(generated_joints) < len(plan.picks):
+                names['name'] = plan.picks[len(generated_joints)]
+            jnt = cmds.joint(position=(avg_pos[0],avg_pos[1],avg_pos[2]), radius=radius, **names)
+            generated_joints.append(jnt)
+        cmds.select(clear=True)
+
+    cmds.warning('Joints generated')
+    for joint_name, mesh_name in plan.centre_joints('create_joints'):
+        create_joint_at_center(joint_name, mesh_name)
+        cmds.select(clear=True)
+    
+def delete_existing(nodes):
+    '''delete the nodes that still exist with one command. A joint goes with the parent it was put
+    under, and Maya fails on a name that no longer exists
+    '''
+    # ls of no names at all would list the whole scene
+    existing = cmds.ls(nodes) if nodes else []
+    if existing:
+        cmds.delete(existing)
+
+def clear_face_selections(*args):
+    '''clears out the list of stored faces
+    '''
+    global selected_faces
+    selected_faces = []
+    cmds.warning('Face selections cleared')
+
+@transaction.stage
+def delete_generated_joints(*args):
+    '''deletes all generated joints
+    '''
+    global generated_joints, built_picks, rig_graph
+    delete_existing(generated_joints)
+    generated_joints = []
+    built_picks = []
+    rig_graph = None
+    geometry.cache.invalidate_joints()
+    cmds.warning('Generated joints deleted')
+    
+def select_all_joints(*args):
+    cmds.select(generated_joints)
+    
+@transaction.stage
+def mirror_joints(*args):
+    '''Mirrors the _L joints of the rig to the other side and renames them
+    parents the joints as the rig template says
+    '''
+    plan = template.active_plan()
+    # the left joints come from the template, the rest of the scene is never listed
+    mirrored_joints = mirror.mirror_joints(plan.left_joints(), plan.parents_before('mirror_joints'),
+                                           plan.mirror['search'], plan.mirror['replace'],
+                                           radius=calculate_mesh_width(plan.mesh), mesh=geometry.get_mesh(plan.mesh))
+    generated_joints.extend(mirrored_joints)
+    geometry.cache.invalidate_joints()
+    # the joints along the lips and eyelids of the template, on both sides now
+    generated_joints.extend(edge_loops.create_loop_joints(plan.edge_loops, geometry.get_mesh(plan.mesh),
+                                                          radius=calculate_mesh_width(plan.mesh)))
+    geometry.cache.invalidate_joints()
+    
+    #parent the joints
+    parent_joints('mirror_joints')
+            
+def create_joint_at_center(joint_name, mesh_name):
+    '''using the world bounding box of the mesh, it creates a joint at the centre of the mesh
+    '''
+    from face_rig.mesh import bounding_box_center
+    bbox = geometry.bounding_box(mesh_name)
+    center = bounding_box_center(bbox)
+    radius=calculate_mesh_width(template.active_plan().mesh)
+    joint = cmds.joint(name = joint_name,position=center, radius=radius)
+    generated_joints.append(joint)
+    geometry.cache.invalidate_joints()
+    
+@transaction.stage
+def create_head_joint(*args):
+    '''create the head, jaw and mouth joints and parent the joints under the head
+    '''
+    for joint_name, mesh_name in template.active_plan().centre_joints('create_head_joint'):
+        create_joint_at_center(joint_name,mesh_name)
+    create_jaw()
+    create_mouth_joints()
+    
+    #parent the eyes and the rest of the joints, parenting keeps the joints where they are
+    parent_joints('create_head_joint')
+    geometry.cache.invalidate_joints()
+    
+def create_jaw(*args):
+    '''get the average  Y and Z pos of the cheek and head joint, use that to create the jaw joint between them
+    '''
+    cmds.select(clear=True)
+    radius=calculate_mesh_width(template.active_plan().mesh)
+    roles = template.active_plan().roles
+    cheek_joint_position = geometry.position(roles['cheek'])
+    head_joint_position = geometry.position(roles['head'])
+    jaw_position = build_graph.jaw_position(head_joint_position, cheek_joint_position)
+    cmds.joint(name=template.active_plan().jaw_joint,position=jaw_position, radius=radius)
+    geometry.cache.invalidate_joints()
+    
+def create_mouth_joints(*args):
+    '''get the average Z pos of the cheek and jaw joint, use that to create a mouth joint between them
+    '''
+    cmds.select(clear=True)
+    radius=calculate_mesh_width(template.active_plan().mesh)
+    roles = template.active_plan().roles
+    cheek_joint_position = geometry.position(roles['cheek'])
+    mouth_top_middle_joint_position = geometry.position(roles['mouth_top'])
+    jaw_joint_position = geometry.position(template.active_plan().jaw_joint)
+    mouth_position = build_graph.mouth_inside_position(cheek_joint_position, mouth_top_middle_joint_position,
+                                                      jaw_joint_position)
+    #loop through to create the mouth inside joints, 5 for the bottom lip, 5 for the top in the default template
+    for joint_name in template.active_plan().mouth_inside_joints:
+        cmds.joint(name=joint_name,position=mouth_position, radius=radius)
+        cmds.select(clear=True)
+    geometry.cache.invalidate_joints()
+    
+def create_eye_controls(*args):
+    '''use the eye joint positions and the calculated mesh width to create and position eye controls
+    '''
+    plan = template.active_plan()
+    named = plan.named_controls
+    radius=calculate_mesh_width(plan.mesh)
+    pos_right_eye = geometry.position(plan.roles['right_eye'])
+    pos_left_eye = geometry.position(plan.roles['left_eye'])
+    # the eye circles float in front of the eyes, the figure eight around both of them
+    controls.create([named['right_eye'], named['left_eye']], 'circle',
+                    [(pos_right_eye[0], pos_right_eye[1], pos_right_eye[2]+(2*radius)),
+                     (pos_left_eye[0], pos_left_eye[1], pos_left_eye[2]+(2*radius))], radius/2)
+    controls.create([named['eyes']], 'eyes', [(0, pos_left_eye[1], pos_left_eye[2]+(2*radius))], 1.5*radius)
+    colour_red(named['right_eye'])
+    colour_blue(named['left_eye'])
+    colour_yellow(named['eyes'])
+    
+def contrain_eyes(*args):
+    '''aim the eye joints at their controls and skin them, with aim constraints or aimMatrix nodes
+    as the rig template says
+    '''
+    plan = template.active_plan()
+    left_joint, right_joint = plan.roles['left_eye'], plan.roles['right_eye']
+    #clean up unwanted controls
+    cmds.delete(right_joint + plan.control_suffix, left_joint + plan.control_suffix)
+    controls.forget(right_joint + plan.control_suffix, left_joint + plan.control_suffix)
+    connections.aim_eye(plan.named_controls['left_eye'], left_joint, plan.connections)
+    connections.aim_eye(plan.named_controls['right_eye'], right_joint, plan.connections)
+    left_eye, right_eye = plan.eye_meshes
+    
+    cmds.select(left_joint)
+    cmds.skinCluster(left_joint, left_eye, toSelectedBones=True)
+    cmds.select(right_joint)
+    cmds.skinCluster(right_joint, right_eye, toSelectedBones=True)
+    cmds.select(clear=True)
+
+    
+def parent_joints(stage_name):
+    '''parent the joints the rig template parents in the given stage, each parent takes all its children at once
+    '''
+    for parent_object, children in template.active_plan().joint_parents(stage_name):
+        transaction.parent(children, parent_object)
+    cmds.select(clear=True)
+    
+def control_units():
+    '''the work units of create_controls in order, (label, function) pairs for face_rig.scheduler
+    '''
+    return [('face controls', create_face_controls),
+            ('arrow circles', create_arrow_circle),
+            ('eye controls', create_eye_controls),
+            ('head and jaw controls', adjust_controls),
+            ('parent controls', parent_face_controls),
+            ('constrain eyes', contrain_eyes)]
+
+@transaction.stage
+def create_controls(*args):
+    '''create all the face controls from the control shapes, with an automatic radius to match the face.
+    Every control is made with its final CVs, see face_rig.shapes
+    '''
+    for label, unit in control_units():
+        unit()
+
+def start_create_controls(progress_bar=None, status_text=None, queue=None):
+    '''run create_controls a unit at a time while Maya is idle, see face_rig.scheduler.
+    The progress bar and the status text of the UI follow the units when they are given
+    '''
+    if scheduler.current() is not None:
+        cmds.warning('%s is still running, wait for it or cancel it' % scheduler.current().name)
+        return None
+    units = control_units()
+    if progress_bar:
+        cmds.progressBar(progress_bar, edit=True, maxValue=len(units), progress=0)
+
+    def show_progress(job, label, seconds):
+        if progress_bar:
+            cmds.progressBar(progress_bar, edit=True, progress=job.done)
+        if status_text:
+            cmds.text(status_text, edit=True, label='%s  %.2f s, leave the scene until it is done' % (label, seconds))
+
+    def finished(job):
+        if job.status == 'finished':
+            message = 'Controls created in %.2f s' % sum(seconds for label, seconds in job.timings)
+        elif job.status == 'cancelled':
+            message = 'Create Controls cancelled, the controls were removed'
+        else:
+            message = 'Create Controls failed and was undone: %s' % job.error
+            cmds.warning(message)
+        if progress_bar:
+            cmds.progressBar(progress_bar, edit=True, progress=job.done if job.status == 'finished' else 0)
+        if status_text:
+            cmds.text(status_text, edit=True, label=message)
+
+    return scheduler.start(scheduler.Job('create_controls', units, show_progress, finished), queue)
+
+def set_connections(mode):
+    '''choose how the controls Create Controls makes drive the joints, "constraints" or "matrix",
+    see face_rig.connections
+    '''
+    if mode not in template.CONNECTIONS:
+        raise ValueError('the controls can not connect with %s, use %s'
+                         % (mode, ' or '.join(template.CONNECTIONS)))
+    template.active_plan().connections = mode
+
+def report_rig_stats(*args):
+    '''print the nodes, the connections and the graph depth of the built rig and return them
+    '''
+    stats = connections.rig_stats(controls=controls.registry)
+    print(connections.format_stats(stats))
+    return stats
+
+def cancel_running_stage(*args):
+    '''cancel the stage started with start_create_controls, what it built is removed
+    '''
+    job = scheduler.current()
+    if job is not None:
+        job.cancel()
+
+def create_face_controls(*args):
+    '''the circle controls on the face joints, coloured by side
+    '''
+    plan = template.active_plan()
+    # a new set of controls, the registry tracks them for the cleanup
+    controls.clear()
+    # List of joint names, read with their positions in one query
+    joint_list = geometry.cache.joint_names()
+    diameter=control_unit()
+    # the head and jaw controls have shapes of their own, made in adjust_controls
+    circle_joints = [joint for joint in joint_list if joint not in (plan.roles['head'], plan.jaw_joint)]
+    circle_names = [joint + plan.control_suffix for joint in circle_joints]
+    control_positions = [geometry.position(joint) for joint in circle_joints]
+    # every circle sits on its joint, turned to fit the face and moved slightly away from the mesh
+    controls.create_placed(circle_names, [build_graph.face_control(position, plan.control_rotations.get(name, (0, 0, 0)),
+                                                                   diameter)
+                                          for name, position in zip(circle_names, control_positions)])
+     
+    for j, control_pos in zip(circle_names, control_positions):
+        '''iterate through the creatd controls. If they are located on the +X axis, colour them red
+        if they're located on the -X axis, colour them blue
+        the controls sit on their joints, so the joint positions are used
+        '''
+        if control_pos[0]>0:
+            colour_blue(j)
+        else:
+            colour_red(j)
+    
+    #colour the middle joints yellow, the template names them
+    for control in plan.centre_controls:
+        colour_yellow(control)
+    
+def create_arrow_circle(*args):
+    '''creates a circle with four arrows on the sides. Used to control the whole eyebrow movement, and mouth movement
+    '''
+    plan = template.active_plan()
+    named = plan.named_controls
+    mouth_pos = geometry.position(plan.roles['mouth_tip'])
+    eyebrow_pos_R = geometry.position(plan.roles['eyebrow'])
+    eyebrow_pos_L = geometry.position(plan.mirrored(plan.roles['eyebrow']))
+    # the pivot of a joint is its position
+    mouth_pivot = geometry.position(build_graph.mouth_inside_joint(plan))
+    
+    diameter=control_unit()
+    
+    #create the controls at the correct scale and in the correct places, then assign a colour
+    controls.create_placed([named['mouth']], [build_graph.mouth_control(mouth_pos, mouth_pivot, diameter)])
+    controls.create_placed([named['eyebrow_left'], named['eyebrow_right']],
+                           build_graph.eyebrow_controls(eyebrow_pos_R, eyebrow_pos_L, diameter))
+    colour_blue(named['eyebrow_left'])
+    colour_red(named['eyebrow_right'])
+    colour_yellow(named['mouth'])
+    cmds.select(clear=True)
+    
+def adjust_controls(*args):
+    '''create the head and jaw controls in shape to fit the face, then clean up all the controls
+    '''
+    plan = template.active_plan()
+    diameter=calculate_mesh_width(plan.mesh)
+    # Get the position of the head pivot
+    head_joint = plan.roles['head']
+    head_pivot = geometry.position(head_joint)
+    #a flat circle above the head using the calculated distance based on the mesh width, pivoting at the head
+    controls.create_placed([head_joint + plan.control_suffix], [build_graph.head_control(head_pivot, diameter)])
+    colour_green(head_joint + plan.control_suffix)
+    
+    #create jaw joint control in front of the chin, pivoting at the jaw
+    jaw_pivot = geometry.position(plan.jaw_joint)
+    chin_pivot = geometry.position(plan.roles['chin'])
+    controls.create_placed([plan.jaw_joint + plan.control_suffix], [build_graph.jaw_control(chin_pivot, jaw_pivot, diameter)])
+    colour_yellow(plan.jaw_joint + plan.control_suffix)
+    
+    # delete the history of the build's own controls and freeze them, all at once
+    controls.cleanup(template.active_plan().control_suffix)
+    clean_up()
+    return 0
+    
+def parent_face_controls(*args):
+    '''drive the joints by their controls and parent the controls as the rig template says
+    '''
+    plan = template.active_plan()
+    joint_list = geometry.cache.joint_names()
+    parent_controls([joint + plan.control_suffix for joint in joint_list], joint_list)
+    
+def parent_controls(face_controls_list,joint_list):
+    '''make every joint follow its control, parent constraints or matrix connections as the rig
+    template says, see face_rig.connections
+    '''
+    connections.drive_joints(face_controls_list, joint_list, template.active_plan().connections)
+    
+    #parent the controls as the rig template says, controls it does not mention go under the head control
+    for parent_object, children in template.active_plan().control_parents(face_controls_list):
+        transaction.parent(children, parent_object)
+    
+def parent_them(child_object,parent_object):
+    transaction.parent(child_object, parent_object)
+    
+def parent_constraint_them(parent_object,child_object):
+    cmds.parentConstraint(child_object, parent_object,maintainOffset=True)
+         
+def control_unit():
+    '''the control diameter of the build, measured between the ear joints of the template
+    '''
+    ear_joint = template.active_plan().roles['ear']
+    return measure_joint_distance(ear_joint, template.active_plan().mirrored(ear_joint))
+    
+def measure_joint_distance(joint_01, joint_02):
+    '''using the two ear joints and the distance between them, the diameter of a nurbs circle is calculated
+    then divided by 12, making the face 12 circles wide. This gives a unique circle diameter
+    the joints can also be given as positions
+    '''
+    joint1_pos = geometry.position(joint_01)
+    joint2_pos = geometry.position(joint_02)
+    # the distance between the two joints, twelve circles wide
+    return build_graph.control_diameter(joint1_pos, joint2_pos)
+    
+def calculate_mesh_width(mesh_name):
+    ''' Get the bounding box of the mesh and calculate its width
+    mesh_name can also be a face_rig.mesh.Mesh, to size joints without a scene
+    the bounding box is read once per build, see face_rig.geometry.cache
+    '''
+    bbox = geometry.bounding_box(mesh_name)
+    width = bbox[3] - bbox[0]
+    joint_size=4*(width/21)
+    
+    return joint_size
+    
+def colour_red(anim_control):
+    # Set the override color to red
+    cmds.setAttr(anim_control + '.overrideEnabled', 1)
+    cmds.setAttr(anim_control + '.overrideRGBColors', 1)
+    cmds.setAttr(anim_control + '.overrideColorRGB', 1, 0, 0)
+    
+def colour_blue(anim_control):
+    # Set the override color to blue 
+    cmds.setAttr(anim_control + '.overrideEnabled', 1)
+    cmds.setAttr(anim_control + '.overrideRGBColors', 1)
+    cmds.setAttr(anim_control + '.overrideColorRGB', 0, 0, 1)
+    
+def colour_yellow(anim_control):
+    # Set the override color to yellow
+    cmds.setAttr(anim_control + '.overrideEnabled', 1)
+    cmds.setAttr(anim_control + '.overrideRGBColors', 1)
+    cmds.setAttr(anim_control + '.overrideColorRGB', 1, 1, 0)
+    
+def colour_green(anim_control):
+    # Set the override color to green
+    cmds.setAttr(anim_control + '.overrideEnabled', 1)
+    cmds.setAttr(anim_control + '.overrideRGBColors', 1)
+    cmds.setAttr(anim_control + '.overrideColorRGB', 0, 1, 0)
+    
+def clean_up(*args):
+    '''Create a new display layer and clean up scene
+    '''
+    cmds.select(clear=True)
+    layer_name = "joints"
+    layer = cmds.createDisplayLayer(name=layer_name, noRecurse=True)
+    joints = cmds.ls('*', type="joint")
+    cmds.editDisplayLayerMembers(layer, joints)
+    cmds.setAttr(layer + ".visibility", False)
+    
+@transaction.stage
+def scale_rig_setup(*args):
+    ''''Make the head uniformly scalable
+    Create the Head_All_Grp group
+    '''
+    plan = template.active_plan()
+    head_joint = plan.roles['head']
+    head_all_grp = cmds.group(empty=True, name='Head_All_Grp')
+    rig_grp = cmds.group(empty=True, name='Rig_Grp')
+    transaction.parent(head_joint, rig_grp)
+    transaction.parent(rig_grp, head_all_grp)
+    transaction.parent(head_joint + plan.control_suffix, head_all_grp)
+    connections.follow_scale(head_joint + plan.control_suffix, rig_grp, plan.connections)
+    cmds.select(clear=True)
@@ -0,0 +1,88 @@
+'''Synthetic character heads for benchmarks.
+
+make_head builds a 'Head', 'Left_eye' and 'Right_eye' set of meshes at any
+density. The head is an ellipsoid with eye sockets, brow ridge, nose, lips,
+chin and ears added as smooth bumps, so the landmark detection and the rig
+stages have real features to work on. It faces +Z with Y up and its left
+side, where the Left_eye sits, on +X, like a head modelled in Maya.
+'''
+import numpy as np
+
+from face_rig.mesh import Mesh
+
+# ellipsoid radii of the head along X, Y and Z
+HEAD_RADII = (7.5, 10.0, 9.0)
+EYE_RADIUS = 1.2
+EYE_CENTRE = (3.2, 1.5)
+
+# (x, y, amplitude, sigma x, sigma y) of the face features, placed on the front of the head
+_FRONT_FEATURES = [
+    (3.2, 1.5, -0.9, 1.5, 1.2),      # eye sockets
+    (-3.2, 1.5, -0.9, 1.5, 1.2),
+    (2.8, 3.4, 0.45, 1.8, 0.6),      # brow ridge
+    (-2.8, 3.4, 0.45, 1.8, 0.6),
+    (0.0, -0.4, 1.2, 0.55, 1.6),     # nose bridge
+    (0.0, -2.1, 1.6, 0.75, 0.75),    # nose tip
+    (0.0, -4.3, 0.5, 1.7, 0.4),      # upper lip
+    (0.0, -5.4, 0.55, 1.6, 0.45),    # lower lip
+    (0.0, -7.4, 0.6, 1.3, 0.9),      # chin
+]
+# (y, z, amplitude, sigma) of the ears, mirrored onto both sides of the head
+_EAR = (0.0, -0.5, 1.4, 1.1)
+
+
+def uv_sphere(rows, columns):
+    '''unit sphere with poles on Y, returns the points, face counts and face connects.
+    It has rows * columns faces, triangles at the poles and quads everywhere else
+    '''
+    theta = np.linspace(0.0, np.pi, rows + 1)[1:-1]
+    phi = np.linspace(0.0, 2.0 * np.pi, columns, endpoint=False)
+    t, p = np.meshgrid(theta, phi, indexing='ij')
+    ring_points = np.c_[(np.sin(t) * np.sin(p)).ravel(), np.cos(t).ravel(), (np.sin(t) * np.cos(p)).ravel()]
+    points = np.r_[[[0.0, 1.0, 0.0]], ring_points, [[0.0, -1.0, 0.0]]]
+    bottom = len(points) - 1
+
+    column = np.arange(columns)
+    following = (column + 1) % columns
+    top_cap = np.c_[np.zeros(columns, dtype=np.int64), 1 + column, 1 + following]
+    ring = np.arange(rows - 2)[:, None] * columns + 1
+    quads = np.stack([ring + column, ring + columns + column, ring + columns + following, ring + following], axis=-1)
+    last = 1 + (rows - 2) * columns
+    bottom_cap = np.c_[last + column, np.full(columns, bottom), last + following]
+
+    face_counts = np.r_[np.full(columns, 3), np.full(quads.shape[0] * columns, 4), np.full(columns, 3)]
+    face_connects = np.r_[top_cap.ravel(), quads.ravel(), bottom_cap.ravel()]
+    return points, face_counts, face_connects
+
+
+def _front_z(x, y):
+    a, b, c = HEAD_RADII
+    return c * np.sqrt(np.clip(1.0 - (x / a) ** 2 - (y / b) ** 2, 0.0, None))
+
+
+def make_head(faces=10000):
+    '''returns a dict of 'Head', 'Left_eye' and 'Right_eye' Meshes, the head with about the given face count
+    '''
+    rows = max(8, int(round(np.sqrt(faces / 2.0))))
+    unit, face_counts, face_connects = uv_sphere(rows, 2 * rows)
+    points = unit * HEAD_RADII
+
+    # push the surface out along the sphere direction for every feature
+    offset = np.zeros(len(points))
+    front = points[:, 2] > 0
+    for x, y, amplitude, sigma_x, sigma_y in _FRONT_FEATURES:
+        falloff = ((points[:, 0] - x) / sigma_x) ** 2 + ((points[:, 1] - y) / sigma_y) ** 2
+        offset += np.where(front, amplitude * np.exp(-0.5 * falloff), 0.0)
+    ear_y, ear_z, amplitude, sigma = _EAR
+    falloff = ((points[:, 1] - ear_y) ** 2 + (points[:, 2] - ear_z) ** 2) / sigma ** 2
+    offset += amplitude * np.exp(-0.5 * falloff) * (np.abs(points[:, 0]) / HEAD_RADII[0]) ** 4
+    points = points + unit * offset[:, None]
+    meshes = {'Head': Mesh(points, face_counts, face_connects, name='Head')}
+
+    eye_unit, eye_counts, eye_connects = uv_sphere(8, 12)
+    for name, side in (('Left_eye', 1.0), ('Right_eye', -1.0)):
+        x, y = EYE_CENTRE[0] * side, EYE_CENTRE[1]
+        # sit the eye in its socket, its front just behind the undisturbed head surface
+        centre = np.array([x, y, _front_z(x, y) - EYE_RADIUS * 0.9])
+        meshes[name] = Mesh(eye_unit * EYE_RADIUS + centre, eye_counts, eye_connects, name=name)
+    return meshes
@@ -0,0 +1,404 @@
+'''Rig templates: the joints, their hierarchy and the controls as data.
+
+A template is a JSON file (see templates/default_face.json) giving
+
+- picks: the joints placed on the picked faces, in pick order
+- mesh: the head mesh the faces are picked on, 'Head' by default
+- eye_meshes: the left and the right eye mesh, ['Left_eye', 'Right_eye'] by
+  default, which the landmarks are found from and the eye joints skin
+- centre_joints: per stage, the (joint, mesh) joints placed at a mesh centre
+- jaw_joint and mouth_inside_joints: the joints the head stage adds
+- mirror: which joints mirror_joints mirrors and how the names change
+- joint_parents: per stage, each parent with the list of joints it takes
+- roles: the joints the placement rules read, such as the head joint the
+  jaw is placed from or the ear joint the controls are sized by, ROLES by
+  default. The eyebrow and ear joints are left ones, their mirrored joints
+  are read too
+- controls: the control name suffix, the root control every other control
+  goes under, the extra control shapes, the xyz rotation of the controls
+  that are turned to fit the face, the control parents and how the
+  controls drive the joints, "constraints" or "matrix" (see
+  face_rig.connections). "named" gives the names of the mouth, eyebrow and
+  eye controls the stages make, NAMED_CONTROLS by default, and "centre" the
+  controls on the middle line coloured yellow, CENTRE_CONTROLS by default
+- edge_loops: optional loops of joints spread evenly along the mesh through
+  some joints, the lips or the eyelids at any density (see
+  face_rig.edge_loops). Every loop has a name, the joints it runs through in
+  order, the count of joints to place, whether it is closed, the pivot joint
+  and the parent joint. The mirror_joints stage makes <name>_01_joint and on,
+  each under a <name>_01_pivot_joint at the pivot under the parent, and
+  their controls go the same way under control_parent, the parent's control
+  by default
+
+compile_template checks a template before anything touches the scene: every
+node named in a hierarchy has to be created by then, a node has one parent
+per stage and the final hierarchy has no cycles. The result is a BuildPlan
+with the parent groups of every stage ordered from the root down, each group
+parented with a single call.
+
+    plan = template.compile_template(template.load_template('long_face.json'))
+    template.set_active_plan(plan)
+'''
+import collections
+import json
+import os
+
+# the stages that create nodes, in build order
+STAGES = ['create_joints', 'create_head_joint', 'mirror_joints', 'create_controls']
+
+# how the controls can drive the joints, the first is the default
+CONNECTIONS = ('constraints', 'matrix')
+
+# the left and the right eye mesh of a template that does not name them
+EYE_MESHES = ('Left_eye', 'Right_eye')
+
+# the joints the placement rules read, by role, for a template that does not name them
+ROLES = collections.OrderedDict([
+    ('head', 'head_joint'),
+    ('cheek', 'cheek_joint_L'),
+    ('chin', 'chin_joint'),
+    ('mouth_top', 'mouth_top_middle_joint'),
+    ('mouth_tip', 'mouth_top_tip_joint_L'),
+    ('eyebrow', 'eyebrow_03_joint_L'),
+    ('ear', 'ear_joint_L'),
+    ('left_eye', 'left_eye_joint'),
+    ('right_eye', 'right_eye_joint'),
+])
+# the roles of left joints whose mirrored joints the rules read too
+MIRRORED_ROLES = ('eyebrow', 'ear')
+
+# the controls the stages make themselves, by role
+NAMED_CONTROLS = collections.OrderedDict([
+    ('mouth', 'mouth_whole_anim'),
+    ('eyebrow_left', 'eyebrow_whole_anim_L'),
+    ('eyebrow_right', 'eyebrow_whole_anim_R'),
+    ('eyes', 'eyes_control'),
+    ('left_eye', 'left_eye_control'),
+    ('right_eye', 'right_eye_control'),
+])
+
+# the controls on the middle line of the face, coloured yellow
+CENTRE_CONTROLS = ['brow_middle_joint_anim', 'nose_tip_joint_anim', 'mouth_top_middle_joint_anim',
+                   'mouth_bottom_middle_joint_anim', 'chin_joint_anim']
+
+DEFAULT_TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'default_face.json')
+
+_active_plan = None
+
+
+class TemplateError(ValueError):
+    '''a rig template that can not be built
+    '''
+
+
+class EdgeLoop(object):
+    '''a loop of joints of a template placed along the mesh, see face_rig.edge_loops
+    '''
+    def __init__(self, name, through, count, pivot=None, parent=None, closed=False, control_parent=None):
+        self.name = name
+        self.through = through
+        self.count = count
+        self.pivot = pivot
+        self.parent = parent
+        self.closed = closed
+        self.control_parent = control_parent
+
+    @property
+    def joints(self):
+        return ['%s_%02d_joint' % (self.name, number) for number in range(1, self.count + 1)]
+
+    @property
+    def pivots(self):
+        '''the pivot joints of the loop joints, none without a pivot
+        '''
+        if self.pivot is None:
+            return []
+        return ['%s_%02d_pivot_joint' % (self.name, number) for number in range(1, self.count + 1)]
+
+
+class BuildPlan(object):
+    '''a compiled template, what every stage creates and parents
+    '''
+    def __init__(self, name, mesh, picks, centre_joints, jaw_joint, mouth_inside_joints, mirror,
+                 joint_parents, parents_before, control_suffix, root_control, control_rotations, control_parents,
+                 created, connections=CONNECTIONS[0], edge_loops=(), eye_meshes=EYE_MESHES, roles=None,
+                 named_controls=None, centre_controls=None):
+        self.name = name
+        self.mesh = mesh
+        self.eye_meshes = tuple(eye_meshes)
+        self.roles = dict(ROLES if roles is None else roles)
+        self.named_controls = dict(NAMED_CONTROLS if named_controls is None else named_controls)
+        self.centre_controls = list(CENTRE_CONTROLS if centre_controls is None else centre_controls)
+        self.picks = picks
+        self.jaw_joint = jaw_joint
+        self.mouth_inside_joints = mouth_inside_joints
+        self.mirror = mirror
+        self.control_suffix = control_suffix
+        self.root_control = root_control
+        self.control_rotations = control_rotations
+        self.connections = connections
+        self.edge_loops = list(edge_loops)
+        self._centre_joints = centre_joints
+        self._joint_parents = joint_parents
+        self._parents_before = parents_before
+        self._control_parents = control_parents
+        self._created = created
+
+    def centre_joints(self, stage):
+        '''(joint, mesh) of the joints placed at a mesh centre in a stage
+        '''
+        return list(self._centre_joints.get(stage, []))
+
+    def mirrored(self, joint):
+        '''the name of the right joint mirror_joints makes from a left one
+        '''
+        return joint.replace(self.mirror['search'], self.mirror['replace'])
+
+    def joint_parents(self, stage):
+        '''(parent, children) groups to parent in a stage, parents before their descendants
+        '''
+        return list(self._joint_parents.get(stage, []))
+
+    def parents_before(self, stage):
+        '''{joint: parent} of the joint hierarchy as the stages before the given one leave it
+        '''
+        return dict(self._parents_before.get(stage, {}))
+
+    def left_joints(self):
+        '''the joints mirror_joints mirrors, in the order they are created
+        '''
+        made = self._created['create_joints'] + self._created['create_head_joint']
+        return [joint for joint in made if joint.endswith(self.mirror['suffix'])]
+
+    def control_parents(self, controls):
+        '''(parent, children) groups for the controls. Controls the template gives no parent go
+        under the root control, the groups come parents first
+        '''
+        placed = set(child for parent, children in self._control_parents for child in children)
+        loose = [c for c in controls if c not in placed and c != self.root_control]
+        groups = list(self._control_parents)
+        if loose:
+            if groups and groups[0][0] == self.root_control:
+                groups[0] = (self.root_control, loose + groups[0][1])
+            else:
+                groups.insert(0, (self.root_control, loose))
+        return groups
+
+    def created_by(self, stage):
+        '''names of the nodes a stage creates
+        '''
+        return list(self._created.get(stage, []))
+
+
+def load_template(path=DEFAULT_TEMPLATE):
+    with open(path) as template_file:
+        return json.load(template_file, object_pairs_hook=collections.OrderedDict)
+
+
+def _ordered_groups(groups, where):
+    '''sort a {parent: children} dict so every parent comes before the groups of its children,
+    raises TemplateError on a cycle
+    '''
+    parent_of = {}
+    for parent, children in groups.items():
+        for child in children:
+            if child == parent:
+                raise TemplateError('%s: %s can not be its own parent' % (where, child))
+            if child in parent_of and parent_of[child] != parent:
+                raise TemplateError('%s: %s has two parents, %s and %s' % (where, child, parent_of[child], parent))
+            parent_of[child] = parent
+    depth = {}
+    for parent in groups:
+        chain = [parent]
+        node = parent
+        while node in parent_of and node not in depth:
+            node = parent_of[node]
+            if node in chain:
+                raise TemplateError('%s: parenting cycle %s' % (where, ' > '.join(chain + [node])))
+            chain.append(node)
+        base = depth.get(node, 0)
+        for offset, name in enumerate(reversed(chain)):
+            depth.setdefault(name, base + offset)
+    # a stable sort keeps the template order between groups of the same depth
+    return [(parent, list(groups[parent])) for parent in sorted(groups, key=lambda p: depth[p])]
+
+
+def _check_exists(names, existing, where):
+    missing = [name for name in names if name not in existing]
+    if missing:
+        raise TemplateError('%s: %s not created by this stage or an earlier one' % (where, ', '.join(missing)))
+
+
+def compile_template(template):
+    '''check a template and turn it into a BuildPlan, raises TemplateError when it can not be built
+    '''
+    try:
+        picks = list(template['picks'])
+        mirror = dict(template['mirror'])
+        controls = template['controls']
+    except KeyError as error:
+        raise TemplateError('the template has no %s entry' % error)
+    name = template.get('name', 'template')
+    if not picks:
+        raise TemplateError('%s: the template has no picks' % name)
+
+    centre_joints = dict((stage, [tuple(pair) for pair in pairs])
+                         for stage, pairs in template.get('centre_joints', {}).items())
+    jaw_joint = template.get('jaw_joint', 'jaw_joint')
+    mouth_inside_joints = list(template.get('mouth_inside_joints', []))
+    created = collections.OrderedDict((stage, []) for stage in STAGES)
+    created['create_joints'] = picks + [joint for joint, mesh in centre_joints.get('create_joints', [])]
+    created['create_head_joint'] = [joint for joint, mesh in centre_joints.get('create_head_joint', [])] + \
+        [jaw_joint] + mouth_inside_joints
+    unknown = [stage for stage in list(centre_joints) + list(template.get('joint_parents', {})) if stage not in STAGES]
+    if unknown:
+        raise TemplateError('%s: unknown stages %s' % (name, ', '.join(unknown)))
+    made_before_mirror = created['create_joints'] + created['create_head_joint']
+    created['mirror_joints'] = [joint.replace(mirror['search'], mirror['replace'])
+                                for joint in made_before_mirror if joint.endswith(mirror['suffix'])]
+    suffix = controls.get('suffix', '_anim')
+    edge_loops = _edge_loops(template.get('edge_loops', []), made_before_mirror + created['mirror_joints'],
+                             suffix, name)
+    for loop in edge_loops:
+        created['mirror_joints'].extend(loop.pivots + loop.joints)
+    joints = made_before_mirror + created['mirror_joints']
+    named_controls = collections.OrderedDict(NAMED_CONTROLS)
+    named_controls.update(controls.get('named', {}))
+    created['create_controls'] = [joint + suffix for joint in joints] + \
+        list(controls.get('shapes', named_controls.values()))
+
+    seen = set()
+    for stage, names in created.items():
+        for node in names:
+            if node in seen:
+                raise TemplateError('%s: %s is created twice' % (name, node))
+            seen.add(node)
+
+    existing = set()
+    final_parent = {}
+    joint_parents = {}
+    parents_before = {}
+    for stage in STAGES:
+        parents_before[stage] = dict(final_parent)
+        existing.update(created[stage])
+        groups = template.get('joint_parents', {}).get(stage)
+        if stage == 'mirror_joints' and edge_loops:
+            groups = _with_groups(groups, _loop_groups(edge_loops, ''))
+        if not groups:
+            continue
+        where = '%s, %s' % (name, stage)
+        _check_exists(list(groups) + [child for children in groups.values() for child in children], existing, where)
+        joint_parents[stage] = _ordered_groups(groups, where)
+        for parent, children in groups.items():
+            final_parent.update(dict.fromkeys(children, parent))
+
+    root_control = controls.get('root', '')
+    control_groups = _with_groups(controls.get('parents', {}), _loop_groups(edge_loops, suffix))
+    where = '%s, controls' % name
+    _check_exists([root_control] + list(control_groups) +
+                  [child for children in control_groups.values() for child in children], existing, where)
+    if any(root_control in children for children in control_groups.values()):
+        raise TemplateError('%s: the root control %s can not have a parent' % (where, root_control))
+    control_parents = _ordered_groups(control_groups, where)
+    control_rotations = dict((control, [float(angle) for angle in rotation])
+                             for control, rotation in controls.get('rotations', {}).items())
+    _check_exists(control_rotations, existing, where)
+    if any(len(rotation) != 3 for rotation in control_rotations.values()):
+        raise TemplateError('%s: a control rotation is not an xyz rotation' % where)
+    connections = controls.get('connections', CONNECTIONS[0])
+    if connections not in CONNECTIONS:
+        raise TemplateError('%s: the controls can not connect with %s, use %s'
+                            % (where, connections, ' or '.join(CONNECTIONS)))
+    # the stages read these joints and make these controls, a template without them is never built
+    roles = collections.OrderedDict(ROLES)
+    roles.update(template.get('roles', {}))
+    unknown = [role for role in roles if role not in ROLES]
+    if unknown:
+        raise TemplateError('%s: unknown roles %s' % (name, ', '.join(unknown)))
+    # the head stage places the jaw and the mouth from them, they are there before the mirror
+    _check_exists(roles.values(), set(made_before_mirror), '%s, roles' % name)
+    _check_exists([joint.replace(mirror['search'], mirror['replace']) for role, joint in roles.items()
+                   if role in MIRRORED_ROLES], set(joints), '%s, mirrored roles' % name)
+    unknown = [role for role in named_controls if role not in NAMED_CONTROLS]
+    if unknown:
+        raise TemplateError('%s: unknown named controls %s' % (name, ', '.join(unknown)))
+    centre_controls = list(controls.get('centre', CENTRE_CONTROLS))
+    _check_exists(list(named_controls.values()) + centre_controls, set(created['create_controls']), where)
+
+    eye_meshes = template.get('eye_meshes', EYE_MESHES)
+    if len(eye_meshes) != 2 or not all(isinstance(mesh, str) and mesh for mesh in eye_meshes):
+        raise TemplateError('%s: eye_meshes names the left and the right eye mesh' % name)
+    # the joint hierarchy as it stands after the last stage must be a tree too
+    _ordered_groups(_invert(final_parent), '%s, joints' % name)
+
+    return BuildPlan(name, template.get('mesh', 'Head'), picks, centre_joints, jaw_joint, mouth_inside_joints,
+                     mirror, joint_parents, parents_before, suffix, root_control, control_rotations, control_parents,
+                     created, connections, edge_loops, eye_meshes, roles, named_controls, centre_controls)
+
+
+def _edge_loops(entries, joints, suffix, name):
+    '''the EdgeLoops of a template's edge_loops entry, joints are the joints made before they are
+    '''
+    loops = []
+    for entry in entries:
+        try:
+            loop = EdgeLoop(entry['name'], list(entry['through']), int(entry['joints']), entry.get('pivot'),
+                            entry.get('parent'), bool(entry.get('closed', False)), entry.get('control_parent'))
+        except KeyError as error:
+            raise TemplateError('%s: an edge loop has no %s entry' % (name, error))
+        where = '%s, edge loop %s' % (name, loop.name)
+        if len(loop.through) < 2 or loop.count < 2:
+            raise TemplateError('%s: a loop runs through two joints or more and places two joints or more' % where)
+        _check_exists(loop.through + [joint for joint in (loop.pivot, loop.parent) if joint], set(joints), where)
+        if loop.control_parent is None and loop.parent:
+            loop.control_parent = loop.parent + suffix
+        loops.append(loop)
+    return loops
+
+
+def _loop_groups(edge_loops, suffix):
+    '''{parent: children} of the joints, or with a suffix of the controls, of edge loops
+    '''
+    groups = collections.OrderedDict()
+    for loop in edge_loops:
+        parent = loop.control_parent if suffix else loop.parent
+        tops = loop.pivots or loop.joints
+        if parent:
+            groups.setdefault(parent, []).extend(top + suffix for top in tops)
+        for pivot, joint in zip(loop.pivots, loop.joints):
+            groups[pivot + suffix] = [joint + suffix]
+    return groups
+
+
+def _with_groups(groups, extra):
+    '''the parent groups of a template with more children added
+    '''
+    merged = collections.OrderedDict((parent, list(children)) for parent, children in (groups or {}).items())
+    for parent, children in extra.items():
+        merged.setdefault(parent, []).extend(children)
+    return merged
+
+
+def _invert(parent_of):
+    groups = collections.OrderedDict()
+    for child, parent in parent_of.items():
+        groups.setdefault(parent, []).append(child)
+    return groups
+
+
+def active_plan():
+    '''the plan the stages build, the default template until another one is set
+    '''
+    global _active_plan
+    if _active_plan is None:
+        _active_plan = compile_template(load_template())
+    return _active_plan
+
+
+def set_active_plan(plan):
+    '''make plan the one the stages build and return the previous one
+    '''
+    global _active_plan
+    previous = _active_plan
+    _active_plan = plan
+    return previous
@@ -0,0 +1,263 @@
+'''Tracing every scene command the tool sends.
+
+A slow build spends its time in scene commands: xform queries, the setAttr
+calls colouring the controls, parent, skinCluster. While a trace runs, every
+command sent through face_rig.scene's cmds, and every bulk call of the scene
+backend (create_joints, create_curves, set_skin_weights, ...), is timed and
+recorded with
+
+- the stack of tool functions it was sent from, from the stage down, such as
+  create_controls > parent_face_controls > connections.drive_joints
+- the stage, the outermost face_rig.stages function of that stack
+- the shape of its arguments, 'list[24], str; query, worldSpace'
+- its count, its cumulative time and its self time, the time it did not
+  spend in other traced commands
+
+Nothing is wrapped while no trace runs, cmds costs one more check per
+command. A trace is written as a JSON summary with the hottest commands
+first, and as folded stacks, one line per stack with its self time in
+microseconds, which flamegraph.pl and speedscope read as they are:
+
+    create_controls;parent_face_controls;connections.drive_joints;parentConstraint 7879
+
+A trace is started and stopped around a build:
+
+    with tracing.trace('hero') as build:
+        stages.create_joints()
+        ...
+    print(tracing.format_top(build))
+    tracing.write(build, 'traces/hero')  # traces/hero.trace.json and traces/hero.folded
+
+python -m face_rig.batch heads.json --trace traces writes them for every
+head of a batch.
+'''
+import collections
+import contextlib
+import json
+import sys
+import time
+
+from face_rig import scene
+
+# the bulk calls of the scene backend, see face_rig.scene.MayaScene
+BACKEND_METHODS = ('read_mesh', 'create_joints', 'create_curves', 'set_curve_points', 'get_skin_weights',
+                   'set_skin_weights')
+# modules in between the tool and the scene that are left out of the stacks
+PLUMBING = ('face_rig.lazy', 'face_rig.scene', 'face_rig.tracing', 'face_rig.transaction')
+# the different argument shapes kept for each command
+SHAPES_KEPT = 5
+
+_active = None
+
+
+class Trace(object):
+    '''the commands sent to a scene while a trace ran. stacks maps a stack of callers ending with the
+    command to [count, cumulative seconds, self seconds], shapes a command to a Counter of its argument
+    shapes and stage_of a stack to its stage
+    '''
+    def __init__(self, name, traced_scene=None):
+        self.name = name
+        self.scene = traced_scene
+        self.stacks = collections.OrderedDict()
+        self.shapes = collections.defaultdict(collections.Counter)
+        self.stage_of = {}
+        self.seconds = 0.0
+        self._started = time.perf_counter()
+        # the seconds the running commands spent in the commands they sent themselves
+        self._inner = []
+        # the frames below the one the trace started from, left out of every stack
+        self._outer = set()
+
+    def wrap(self, name, command):
+        def traced(*args, **kwargs):
+            return self.call(name, command, args, kwargs)
+        return traced
+
+    def call(self, name, command, args, kwargs):
+        '''run a command, recording it under the stack of tool functions it was sent from
+        '''
+        callers = _callers(sys._getframe(2), self._outer)
+        self._inner.append(0.0)
+        start = time.perf_counter()
+        try:
+            return command(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            inner = self._inner.pop()
+            if self._inner:
+                self._inner[-1] += seconds
+            key = tuple(_label(module, function) for module, function in callers) + (name,)
+            entry = self.stacks.get(key)
+            if entry is None:
+                entry = self.stacks[key] = [0, 0.0, 0.0]
+                stages_called = [function for module, function in callers if module == 'face_rig.stages']
+                self.stage_of[key] = stages_called[0] if stages_called else None
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] += seconds - inner
+            self.shapes[name][_shape(args, kwargs)] += 1
+
+
+def _callers(frame, outer=()):
+    '''(module, function) of the tool functions on the stack from the outermost in, down from the
+    frames in outer, the plumbing and anything outside face_rig left out
+    '''
+    callers = []
+    while frame is not None and frame not in outer:
+        module = frame.f_globals.get('__name__', '')
+        if module == '__main__' and frame.f_globals.get('__spec__') is not None:
+            # a module run with python -m, such as face_rig.batch
+            module = frame.f_globals['__spec__'].name
+        if module.startswith('face_rig.') and module not in PLUMBING:
+            callers.append((module, frame.f_code.co_name))
+        frame = frame.f_back
+    callers.reverse()
+    return callers
+
+
+def _label(module, function):
+    if module == 'face_rig.stages':
+        return function
+    return '%s.%s' % (module[len('face_rig.'):], function)
+
+
+def _describe(value):
+    if isinstance(value, (list, tuple, dict)):
+        return '%s[%d]' % (type(value).__name__, len(value))
+    shape = getattr(value, 'shape', None)
+    if shape is not None:
+        return 'array%s' % (tuple(shape),)
+    return type(value).__name__
+
+
+def _shape(args, kwargs):
+    '''the types and lengths of the arguments of a call and the names of its flags
+    '''
+    shape = ', '.join(_describe(value) for value in args)
+    if kwargs:
+        shape += '; ' + ', '.join(sorted(kwargs))
+    return shape
+
+
+def active():
+    '''the running trace, None outside of one
+    '''
+    return _active
+
+
+def start(name='trace'):
+    '''start tracing the commands sent to the active scene, returns the Trace
+    '''
+    global _active
+    if _active is not None:
+        raise RuntimeError('the trace %s is already running' % _active.name)
+    _active = Trace(name, scene.get_scene())
+    frame = sys._getframe(1)
+    while frame is not None:
+        _active._outer.add(frame)
+        frame = frame.f_back
+    scene.set_command_wrapper(_active.wrap)
+    # the backend calls are wrapped on the scene object itself and unwrapped when the trace stops
+    for method in BACKEND_METHODS:
+        if hasattr(_active.scene, method):
+            setattr(_active.scene, method, _active.wrap('scene.' + method, getattr(_active.scene, method)))
+    return _active
+
+
+def stop():
+    '''stop the running trace and return it
+    '''
+    global _active
+    current = _active
+    if current is None:
+        raise RuntimeError('no trace is running')
+    scene.set_command_wrapper(None)
+    for method in BACKEND_METHODS:
+        current.scene.__dict__.pop(method, None)
+    current.scene = None
+    current._outer = set()
+    current.seconds = time.perf_counter() - current._started
+    _active = None
+    return current
+
+
+@contextlib.contextmanager
+def trace(name='trace'):
+    '''trace the commands sent in a with block
+    '''
+    current = start(name)
+    try:
+        yield current
+    finally:
+        stop()
+
+
+def command_totals(current):
+    '''{command: {'count', 'seconds', 'self_seconds', 'stages'}} of a trace, stages holding the count
+    and the seconds of the command per stage
+    '''
+    totals = collections.OrderedDict()
+    for key, (count, seconds, self_seconds) in current.stacks.items():
+        command = key[-1]
+        total = totals.setdefault(command, {'count': 0, 'seconds': 0.0, 'self_seconds': 0.0, 'stages': {}})
+        total['count'] += count
+        total['seconds'] += seconds
+        total['self_seconds'] += self_seconds
+        stage = total['stages'].setdefault(current.stage_of[key] or '-', {'count': 0, 'seconds': 0.0})
+        stage['count'] += count
+        stage['seconds'] += seconds
+    return totals
+
+
+def summary(current):
+    '''plain data of a trace, the commands with the most self time first
+    '''
+    totals = command_totals(current)
+    commands = []
+    for command in sorted(totals, key=lambda command: -totals[command]['self_seconds']):
+        total = totals[command]
+        commands.append({
+            'command': command,
+            'count': total['count'],
+            'seconds': round(total['seconds'], 6),
+            'self_seconds': round(total['self_seconds'], 6),
+            'stages': dict((stage, {'count': values['count'], 'seconds': round(values['seconds'], 6)})
+                           for stage, values in total['stages'].items()),
+            'shapes': [[shape, count] for shape, count in current.shapes[command].most_common(SHAPES_KEPT)],
+        })
+    return {'name': current.name,
+            'seconds': round(current.seconds, 6),
+            'calls': sum(entry[0] for entry in current.stacks.values()),
+            'command_seconds': round(sum(entry[2] for entry in current.stacks.values()), 6),
+            'commands': commands}
+
+
+def folded(current):
+    '''the folded stacks of a trace, one 'caller;caller;command microseconds' line per stack with the
+    self time of the command
+    '''
+    return ['%s %d' % (';'.join(key), int(round(entry[2] * 1e6))) for key, entry in current.stacks.items()]
+
+
+def format_top(current, count=10):
+    '''a table of the commands with the most self time, for the console
+    '''
+    data = summary(current)
+    lines = ['%d commands in %.3f of %.3f seconds' % (data['calls'], data['command_seconds'], data['seconds']),
+             '%-24s %7s %9s %9s  %s' % ('command', 'count', 'self', 'total', 'slowest stage')]
+    for command in data['commands'][:count]:
+        stage = max(command['stages'], key=lambda name: command['stages'][name]['seconds'])
+        lines.append('%-24s %7d %9.4f %9.4f  %s' % (command['command'][:24], command['count'],
+                                                   command['self_seconds'], command['seconds'], stage))
+    return '\n'.join(lines)
+
+
+def write(current, path):
+    '''write a trace to path.trace.json and path.folded, returns the two paths
+    '''
+    json_path, folded_path = path + '.trace.json', path + '.folded'
+    with open(json_path, 'w') as json_file:
+        json.dump(summary(current), json_file, indent=2)
+    with open(folded_path, 'w') as folded_file:
+        folded_file.write('\n'.join(folded(current)) + '\n')
+    return json_path, folded_path
@@ -0,0 +1,169 @@
+'''Running the stages as transactions.
+
+Every command a stage sends is its own undo step and, in the UI, its own
+viewport redraw. A stage run inside a transaction instead:
+
+- is a single undo chunk, the whole stage undoes in one step
+- suspends the viewport refresh until it ends
+- holds back the parent calls made through transaction.parent and sends them
+  as one cmds.parent call per parent, just before the next other command goes
+  out or when the transaction ends
+- rolls back when it fails, undoing everything it did before the error is raised,
+  and puts back the module state registered with keep_state
+
+Transactions nest, a stage run from inside another one joins it, so a build
+run as one transaction is also rolled back as a whole:
+
+    @transaction.stage
+    def create_controls(*args):
+        ...
+
+    with transaction.run('build'):
+        create_joints()
+        create_head_joint()
+'''
+import collections
+import contextlib
+import functools
+
+from face_rig import scene
+from face_rig.lazy import lazy_import
+
+# only a failed transaction needs the scene query cache, see face_rig.lazy
+geometry = lazy_import('face_rig.geometry')
+# the scheduler runs its jobs in transactions itself
+scheduler = lazy_import('face_rig.scheduler')
+
+_active = None
+# the functions saving module state when a transaction opens, see keep_state
+_state_keepers = []
+
+
+class Transaction(object):
+    '''the commands a running transaction holds back, with counts of what it recorded and sent
+    '''
+    def __init__(self, name):
+        self.name = name
+        self.recorded = 0
+        self.issued = 0
+        self._children = collections.OrderedDict()
+        self._parent_of = {}
+
+    def parent(self, children, parent_object):
+        self.recorded += 1
+        for child in children:
+            previous = self._parent_of.get(child)
+            if previous is not None:
+                # parented again before it was sent, only the last parent matters
+                self._children[previous].remove(child)
+            self._parent_of[child] = parent_object
+            self._children.setdefault(parent_object, []).append(child)
+
+    def flush(self):
+        '''send the held back parent calls, one per parent, in the order the parents were first used
+        '''
+        if not self._children:
+            return
+        pending = self._children
+        self._children = collections.OrderedDict()
+        self._parent_of = {}
+        # sent around scene.cmds, which would flush again, but traced like any other command
+        parent_command = scene.wrap_command('parent', scene.get_scene().cmds.parent)
+        for parent_object, children in pending.items():
+            if children:
+                parent_command(children, parent_object)
+                self.issued += 1
+
+    def discard(self):
+        self._children = collections.OrderedDict()
+        self._parent_of = {}
+
+
+def active():
+    '''the running transaction, None outside of one
+    '''
+    return _active
+
+
+def parent(children, parent_object):
+    '''cmds.parent, merged with the other parent calls of a running transaction
+    '''
+    children = [children] if isinstance(children, str) else list(children)
+    if _active is None:
+        scene.cmds.parent(children, parent_object)
+    else:
+        _active.parent(children, parent_object)
+
+
+def keep_state(save):
+    '''save() is called when a transaction opens and returns a function putting back what it saved,
+    which is called when the transaction rolls back, so module state naming scene nodes never outlives
+    the nodes the rollback undid
+    '''
+    _state_keepers.append(save)
+
+
+@contextlib.contextmanager
+def run(name):
+    '''run the body of a with block as one transaction, or as part of the one already running
+    '''
+    global _active
+    if _active is not None:
+        yield _active
+        return
+    commands = scene.cmds
+    current = Transaction(name)
+    restores = [save() for save in _state_keepers]
+    undoable = commands.undoInfo(query=True, state=True)
+    commands.undoInfo(openChunk=True, chunkName=name)
+    commands.refresh(suspend=True)
+    _active = current
+    previous = scene.set_before_command(current.flush)
+    try:
+        yield current
+        current.flush()
+    except BaseException:
+        current.discard()
+        _close(current, previous)
+        if undoable:
+            # the chunk just closed holds everything the transaction did
+            commands.undo()
+        for restore in restores:
+            restore()
+        geometry.cache.invalidate()
+        raise
+    _close(current, previous)
+
+
+def _close(current, previous):
+    global _active
+    scene.set_before_command(previous)
+    _active = None
+    commands = scene.cmds
+    commands.refresh(suspend=False)
+    commands.undoInfo(closeChunk=True, chunkName=current.name)
+
+
+def suspend_refresh(suspend=True):
+    '''suspend or resume the viewport refresh a running transaction suspended, a job of face_rig.scheduler
+    resumes it while it waits for its next slice so Maya draws the build in between
+    '''
+    if _active is not None:
+        scene.cmds.refresh(suspend=suspend)
+
+
+def stage(function):
+    '''decorator running a stage function in a transaction named after it. While a job of
+    face_rig.scheduler waits for its next slice the stage warns and does not run, it would join the
+    job's transaction and be rolled back with it
+    '''
+    @functools.wraps(function)
+    def run_stage(*args, **kwargs):
+        job = scheduler.current()
+        if job is not None and not job.in_slice:
+            scene.cmds.warning('%s is still running, wait for it or cancel it before %s'
+                               % (job.name, function.__name__))
+            return None
+        with run(function.__name__):
+            return function(*args, **kwargs)
+    return run_stage
@@ -0,0 +1,145 @@
+'''Saving and loading skin weights.
+
+Skin weights are stored in a compact binary file that is memory-mapped when
+it is read back, so hand-painted weights survive a rebind:
+
+    weights_io.save_weights('hero.frskin', weights, mesh.points, mesh_name='Head')
+    weights, points, header = weights_io.load_weights('hero.frskin')
+    weights = weights_io.remap_weights(weights, joint_names, points, new_mesh.points)
+
+The weights are the CSR of face_rig.skinning.SkinWeights. Loading matches the
+joints by name, so the joints may come in another order or be missing, a
+vertex weighted only to missing joints takes the weights of its nearest
+weighted vertex. When the mesh changed every vertex takes the weights of the
+nearest saved vertex.
+
+File layout, the same as face_rig.mesh_io's cache: the 8 byte magic, a
+little endian uint32 header length, a JSON header with the joint names and
+the byte offset and length of every array, then the arrays themselves (int64
+offsets, int32 joint indices, float32 weights and float32 points), each
+starting on a 16 byte boundary.
+'''
+import json
+import os
+import struct
+
+import numpy as np
+
+from face_rig.skinning import SkinWeights
+from face_rig.spatial import KDTree
+
+WEIGHTS_MAGIC = b'FRSKIN01'
+WEIGHTS_EXTENSION = '.frskin'
+_ALIGN = 16
+
+
+def save_weights(path, weights, points=None, mesh_name=None):
+    '''write SkinWeights to a binary weights file, with the points of the mesh they belong to
+    so they can be moved to a changed mesh later
+    '''
+    arrays = [('offsets', weights.offsets.astype(np.int64)),
+              ('joint_indices', weights.joint_indices.astype(np.int32)),
+              ('weights', weights.weights.astype(np.float32))]
+    if points is not None:
+        arrays.append(('points', np.asarray(points, dtype=np.float32).reshape(-1, 3)))
+    table = {}
+    offset = 0
+    for key, array in arrays:
+        table[key] = [offset, array.shape[0]]
+        offset += -(-array.nbytes // _ALIGN) * _ALIGN
+    header = json.dumps({'version': 1, 'mesh': mesh_name, 'points': weights.num_points,
+                         'joints': weights.joint_names, 'arrays': table}).encode('utf8')
+    data_start = -(-(len(WEIGHTS_MAGIC) + 4 + len(header)) // _ALIGN) * _ALIGN
+    temp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(temp_path, 'wb') as weights_file:
+        weights_file.write(WEIGHTS_MAGIC + struct.pack('<I', len(header)) + header)
+        for key, array in arrays:
+            weights_file.seek(data_start + table[key][0])
+            weights_file.write(np.ascontiguousarray(array).tobytes())
+        weights_file.truncate(data_start + offset)
+    os.replace(temp_path, path)
+
+
+def load_weights(path):
+    '''memory-map a weights file, returns the SkinWeights, the saved points (None when the file has
+    none) and the header
+    '''
+    with open(path, 'rb') as weights_file:
+        if weights_file.read(len(WEIGHTS_MAGIC)) != WEIGHTS_MAGIC:
+            raise ValueError('%s is not a skin weights file' % path)
+        header_length = struct.unpack('<I', weights_file.read(4))[0]
+        header = json.loads(weights_file.read(header_length).decode('utf8'))
+    data_start = -(-(len(WEIGHTS_MAGIC) + 4 + header_length) // _ALIGN) * _ALIGN
+    data = np.memmap(path, dtype=np.uint8, mode='r')
+
+    def view(key, dtype, columns=1):
+        offset, rows = header['arrays'][key]
+        start = data_start + offset
+        array = data[start:start + rows * columns * np.dtype(dtype).itemsize].view(dtype)
+        return array.reshape(rows, columns) if columns > 1 else array
+
+    weights = SkinWeights(header['joints'], view('offsets', np.int64), view('joint_indices', np.int32),
+                          view('weights', np.float32))
+    points = view('points', np.float32, 3) if 'points' in header['arrays'] else None
+    return weights, points, header
+
+
+def _gather(offsets, source):
+    '''offsets and entry indices of the weight entries of the source vertex of every vertex, one run each
+    '''
+    counts = np.diff(offsets)[source]
+    new_offsets = np.zeros(len(source) + 1, dtype=np.int64)
+    np.cumsum(counts, out=new_offsets[1:])
+    entries = np.arange(new_offsets[-1]) + np.repeat(offsets[source] - new_offsets[:-1], counts)
+    return new_offsets, entries
+
+
+def remap_weights(weights, joint_names, saved_points=None, points=None):
+    '''SkinWeights for the joints named in joint_names, in their order, and for the given points.
+    Weights of joints that are not in joint_names are dropped and every vertex is normalized again, a
+    vertex left without weights takes the weights of the nearest vertex that has some. When the points
+    differ from the saved ones every point takes the weights of the nearest saved point, which needs
+    the saved points
+    '''
+    joint_names = list(joint_names)
+    column = dict((name, index) for index, name in enumerate(joint_names))
+    columns = np.array([column.get(name, -1) for name in weights.joint_names], dtype=np.int64)
+    offsets = weights.offsets
+    joint_indices = columns[weights.joint_indices]
+    values = np.asarray(weights.weights, dtype=np.float32)
+
+    if points is not None:
+        points = np.asarray(points).reshape(-1, 3)
+        if saved_points is None:
+            if len(points) != weights.num_points:
+                raise ValueError('the weights are for %d points, not %d, and have no points to match them by'
+                                 % (weights.num_points, len(points)))
+        elif not np.array_equal(saved_points, points.astype(np.float32)):
+            # the points are saved as float32, an unchanged mesh matches them exactly
+            offsets, entries = _gather(offsets, KDTree(saved_points).query(points)[1])
+            joint_indices, values = joint_indices[entries], values[entries]
+    positions = points if points is not None else saved_points
+
+    # drop the joints that are gone and normalize what is left
+    known = joint_indices >= 0
+    if not known.all():
+        rows = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))[known]
+        joint_indices, values = joint_indices[known], values[known]
+        offsets = np.zeros(len(offsets), dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(offsets) - 1), out=offsets[1:])
+        totals = np.bincount(rows, weights=values, minlength=len(offsets) - 1)
+        values = (values / np.where(totals == 0, 1.0, totals)[rows]).astype(np.float32)
+
+        # vertices weighted only to dropped joints take the weights of the nearest vertex that kept some
+        counts = np.diff(offsets)
+        empty = np.flatnonzero(counts == 0)
+        if len(empty) and len(empty) < len(counts):
+            if positions is None:
+                raise ValueError('%d points are weighted only to joints that are gone and there are no points '
+                                 'to find their nearest weighted points by' % len(empty))
+            weighted = np.flatnonzero(counts)
+            source = np.arange(len(counts))
+            source[empty] = weighted[KDTree(positions[weighted]).query(positions[empty])[1]]
+            offsets, entries = _gather(offsets, source)
+            joint_indices, values = joint_indices[entries], values[entries]
+    return SkinWeights(joint_names, offsets, joint_indices, values)
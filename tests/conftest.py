@@ -0,0 +1,114 @@
+'''Fixtures shared by the tests: a stand-in scene (see face_rig.fake_scene) holding a
+synthetic head with two eyes, and its picks for the default template.
+'''
+import numpy as np
+import pytest
+
+from face_rig import controls, geometry, mesh_io, scene, stages, template
+from face_rig.fake_scene import FakeScene
+from face_rig.mesh import Mesh
+
+HEAD_RADIUS = 10.0
+# where the picks of the default template sit on the head, in template order
+PICK_DIRECTIONS = [(1.5, 4, 9), (3, 4.5, 8.6), (5, 4, 8), (2.5, 3, 9), (3.5, 3.2, 9), (4.5, 3, 8.6),
+                   (2.5, 1, 9.4), (3.5, 0.8, 9.2), (4.5, 1, 8.8), (1.2, -1, 9.8), (2.5, -2.5, 9.3),
+                   (3.5, 0, 9), (5.5, 0.5, 8), (9.9, 0, 0), (0, -4, 9.1), (1.2, -4, 9), (2.2, -4.5, 8.8),
+                   (0, -5, 8.6), (1.2, -5, 8.5), (2, -4.8, 8.6), (0, -8, 6), (0, 4, 9.1), (0, -1, 10),
+                   (5, -2, 8.3)]
+
+
+def uv_sphere(centre, radius, around, down):
+    '''the points and faces of a sphere, triangles at the poles and quads in between
+    '''
+    theta = np.linspace(0, np.pi, down + 1)[1:-1]
+    phi = np.linspace(0, 2 * np.pi, around, endpoint=False)
+    theta, phi = np.meshgrid(theta, phi, indexing='ij')
+    ring = np.c_[np.sin(theta).ravel() * np.cos(phi).ravel(), np.cos(theta).ravel(),
+                 np.sin(theta).ravel() * np.sin(phi).ravel()]
+    points = np.r_[[[0, 1, 0]], ring, [[0, -1, 0]]] * radius + centre
+    faces = [[0, 1 + (j + 1) % around, 1 + j] for j in range(around)]
+    for i in range(down - 2):
+        for j in range(around):
+            a, b = 1 + i * around + j, 1 + i * around + (j + 1) % around
+            faces.append([a, b, b + around, a + around])
+    last = 1 + (down - 3) * around
+    faces.extend([last + j, last + (j + 1) % around, len(points) - 1] for j in range(around))
+    return points, faces
+
+
+def is_mapped(array):
+    '''whether an array is a view of a memory-mapped file
+    '''
+    while array is not None:
+        if isinstance(array, np.memmap):
+            return True
+        array = getattr(array, 'base', None)
+    return False
+
+
+def sphere_mesh(radius=HEAD_RADIUS, around=48, down=32):
+    '''a Mesh of a sphere around the origin, symmetric across the YZ plane
+    '''
+    points, faces = uv_sphere(np.zeros(3), radius, around, down)
+    return Mesh(points, [len(face) for face in faces], np.concatenate(faces), 'Head')
+
+
+def write_head(path, around=48, down=32):
+    '''write a head and its eyes to an OBJ file, returns the pick faces for the default template
+    '''
+    objects = [('Head',) + uv_sphere(np.zeros(3), HEAD_RADIUS, around, down),
+               ('Left_eye',) + uv_sphere(np.array([3.5, 2, 8]), 1.2, 12, 8),
+               ('Right_eye',) + uv_sphere(np.array([-3.5, 2, 8]), 1.2, 12, 8)]
+    offset = 0
+    with open(path, 'w') as obj_file:
+        for name, points, faces in objects:
+            obj_file.write('o %s\n' % name)
+            obj_file.write(''.join('v %.6f %.6f %.6f\n' % tuple(point) for point in points))
+            obj_file.write(''.join('f %s\n' % ' '.join(str(index + 1 + offset) for index in face)
+                                   for face in faces))
+            offset += len(points)
+    points, faces = objects[0][1], objects[0][2]
+    centres = np.array([points[face].mean(axis=0) for face in faces])
+    targets = np.array(PICK_DIRECTIONS, float)
+    targets *= HEAD_RADIUS / np.linalg.norm(targets, axis=1)[:, None]
+    return [int(np.argmin(((centres - target) ** 2).sum(axis=1))) for target in targets]
+
+
+@pytest.fixture
+def head(tmp_path):
+    '''(OBJ path, pick faces) of the synthetic head
+    '''
+    path = str(tmp_path / 'head.obj')
+    picks = write_head(path)
+    # every import reads the float32 mesh cache, not only the ones after the first
+    mesh_io.load_meshes(path)
+    return path, picks
+
+
+@pytest.fixture
+def fake_scene():
+    '''an empty FakeScene made active, with the stages, the controls and the template of a new build
+    '''
+    current = FakeScene()
+    previous = scene.set_scene(current)
+    previous_plan = template.set_active_plan(None)
+    stages.selected_faces = []
+    stages.generated_joints = []
+    stages.built_picks = []
+    stages.rig_graph = None
+    controls.clear()
+    geometry.cache.invalidate()
+    yield current
+    scene.set_scene(previous)
+    template.set_active_plan(previous_plan)
+    geometry.cache.invalidate()
+
+
+@pytest.fixture
+def head_scene(fake_scene, head):
+    '''the fake scene with the head imported and its picks stored as the face selection
+    '''
+    path, picks = head
+    fake_scene.file(path, i=True)
+    stages.selected_faces = [('Head', [face]) for face in picks]
+    return fake_scene
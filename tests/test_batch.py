@@ -0,0 +1,52 @@
+import pytest
+
+from face_rig import batch, stages, tracing
+
+
+def test_rig_head(fake_scene, head):
+    path, picks = head
+    result = batch.rig_head({'name': 'hero', 'mesh': path, 'faces': picks})
+    assert result['status'] == 'ok', result.get('traceback')
+    assert list(result['stages']) == [name for name, stage in batch.PIPELINE]
+    assert result['joints'] == len(fake_scene.ls('*', type='joint'))
+    assert result['rig']['mode'] == 'constraints'
+    assert result['rig']['types']['parentConstraint'] > 0
+    assert fake_scene.ls(type='skinCluster')
+
+
+def test_failed_stage_is_reported_and_rolled_back(fake_scene, head, monkeypatch):
+    path, picks = head
+
+    def fail(*args):
+        raise RuntimeError('no controls today')
+    pipeline = list(batch.PIPELINE)
+    pipeline[3] = ('create_controls', fail)
+    monkeypatch.setattr(batch, 'PIPELINE', pipeline)
+    result = batch.rig_head({'name': 'hero', 'mesh': path, 'faces': picks})
+    assert result['status'] == 'failed'
+    assert result['failed_stage'] == 'create_controls'
+    assert result['error'] == 'RuntimeError: no controls today'
+    assert list(result['stages']) == ['create_joints', 'create_head_joint', 'mirror_joints', 'create_controls']
+    # the whole build is rolled back, the imported meshes are left
+    assert fake_scene.ls(type='joint') == []
+    assert stages.generated_joints == []
+
+
+@pytest.mark.parametrize('faces', [5, None])
+def test_head_failing_before_the_first_stage(fake_scene, head, faces):
+    path, picks = head
+    result = batch.rig_head({'name': 'hero', 'mesh': path, 'faces': faces})
+    assert result['status'] == 'failed'
+    assert result['failed_stage'] == 'select_faces'
+    assert result['stages'] == {}
+
+
+def test_trace_stops_when_a_head_fails(fake_scene, head, tmp_path):
+    path, picks = head
+    trace_path = str(tmp_path / 'hero')
+    failed = batch.rig_head({'name': 'hero', 'mesh': path, 'faces': 5, 'trace': trace_path})
+    assert failed['status'] == 'failed'
+    assert tracing.active() is None
+    result = batch.rig_head({'name': 'hero', 'mesh': path, 'faces': picks, 'trace': trace_path})
+    assert result['status'] == 'ok', result.get('traceback')
+    assert result['trace']['json'] == trace_path + '.trace.json'
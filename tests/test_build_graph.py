@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from face_rig import build_graph, controls, geometry, scene, stages, template, transaction
+from face_rig.fake_scene import FakeScene
+
+
+def build(fake_scene, path, picks, mode):
+    '''build the joints and controls of the picks in a stand-in scene
+    '''
+    scene.set_scene(fake_scene)
+    template.set_active_plan(None)
+    stages.selected_faces = [('Head', [face]) for face in picks]
+    stages.generated_joints = []
+    stages.built_picks = []
+    stages.rig_graph = None
+    controls.clear()
+    geometry.cache.invalidate()
+    fake_scene.file(path, i=True)
+    stages.set_connections(mode)
+    with transaction.run('build'):
+        stages.create_joints()
+        stages.create_head_joint()
+        stages.mirror_joints()
+        stages.create_controls()
+
+
+def positions(fake_scene):
+    '''the world position of every joint and of the CVs of every control
+    '''
+    result = {}
+    for joint in fake_scene.ls(type='joint'):
+        result[joint] = np.array(fake_scene.xform(joint, query=True, worldSpace=True, translation=True))
+    for control in controls.registry:
+        if fake_scene.objExists(control):
+            result[control] = np.reshape(fake_scene.xform(control + '.cv[*]', query=True, worldSpace=True,
+                                                          translation=True), (-1, 3))
+    return result
+
+
+@pytest.mark.parametrize('mode', ['constraints', 'matrix'])
+@pytest.mark.parametrize('joint', ['cheek_joint_L', 'eyebrow_01_joint_L', 'chin_joint', 'ear_joint_L'])
+def test_changed_pick_matches_a_full_rebuild(head_scene, head, joint, mode):
+    path, picks = head
+    build(head_scene, path, picks, mode)
+    before = positions(head_scene)
+    index = template.active_plan().picks.index(joint)
+    new_picks = list(picks)
+    new_picks[index] += 3
+
+    graph = stages.current_rig_graph()
+    changed = graph.set_pick(joint, ('Head', new_picks[index]))
+    assert 'pick:' + joint in changed
+    with transaction.run('update'):
+        moved = build_graph.apply(graph, changed, template.active_plan().control_suffix)
+    assert joint in moved or joint + '_anim' in moved
+    updated = positions(head_scene)
+
+    build(FakeScene(), path, new_picks, mode)
+    rebuilt = positions(scene.get_scene())
+    assert sorted(updated) == sorted(rebuilt)
+    for name, position in rebuilt.items():
+        assert np.allclose(updated[name], position, atol=1e-4), name
+    # only the nodes downstream of the pick moved
+    for name, position in before.items():
+        if name not in changed and name + '_anim' not in changed:
+            assert np.allclose(updated[name], position, atol=1e-4), name
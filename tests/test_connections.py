@@ -0,0 +1,31 @@
+import os
+
+import numpy as np
+import pytest
+
+from face_rig import batch, template
+
+HERO_TEMPLATE = os.path.join(os.path.dirname(template.DEFAULT_TEMPLATE), 'hero_face.json')
+
+
+def rest_pose(fake_scene, head, mode, template_path):
+    path, picks = head
+    result = batch.rig_head({'name': mode, 'mesh': path, 'faces': picks, 'connections': mode,
+                             'template': template_path})
+    assert result['status'] == 'ok', result.get('traceback')
+    joints = fake_scene.ls(type='joint')
+    pose = dict((joint, np.array(fake_scene.xform(joint, query=True, matrix=True, worldSpace=True)))
+                for joint in joints)
+    return pose, result['rig']
+
+
+@pytest.mark.parametrize('template_path', [template.DEFAULT_TEMPLATE, HERO_TEMPLATE])
+def test_both_modes_build_the_same_rest_pose(fake_scene, head, template_path):
+    constrained, constraint_rig = rest_pose(fake_scene, head, 'constraints', template_path)
+    driven, matrix_rig = rest_pose(fake_scene, head, 'matrix', template_path)
+    assert sorted(driven) == sorted(constrained)
+    for joint, matrix in constrained.items():
+        assert np.allclose(driven[joint], matrix, atol=1e-5), joint
+    assert constraint_rig['types'].get('parentConstraint')
+    assert not matrix_rig['types'].get('parentConstraint')
+    assert matrix_rig['types'].get('aimMatrix') == 2
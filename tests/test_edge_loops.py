@@ -0,0 +1,87 @@
+import os
+
+import numpy as np
+
+from conftest import sphere_mesh
+from face_rig import batch, controls, edge_loops, scene, stages, template
+from face_rig.fake_scene import FakeScene
+
+HERO_TEMPLATE = os.path.join(os.path.dirname(template.DEFAULT_TEMPLATE), 'hero_face.json')
+
+
+def spacing(points, closed=False):
+    points = np.r_[points, points[:1]] if closed else points
+    return np.linalg.norm(np.diff(points, axis=0), axis=1)
+
+
+def test_sample_curves_spreads_the_points_evenly():
+    line = np.c_[[0.0, 1.0, 1.5, 4.0], np.zeros(4), np.zeros(4)]
+    square = np.array([(0, 0, 0), (2, 0, 0), (2, 2, 0), (0, 2, 0)], float)
+    placed_line, placed_square = edge_loops.sample_curves([line, square], [5, 8], [False, True])
+    assert np.allclose(placed_line[:, 0], [0, 1, 2, 3, 4]) and np.allclose(placed_line[:, 1:], 0)
+    # a closed curve wraps around, its last point stops a step short of the first
+    assert len(placed_square) == 8
+    assert np.allclose(placed_square[0], square[0]) and np.allclose(placed_square[2], square[1])
+    assert np.allclose(spacing(placed_square, closed=True), 1.0)
+
+
+def test_fit_curves_keeps_the_pinned_points():
+    zigzag = np.c_[np.arange(9.0), np.tile([0.0, 1.0], 5)[:9], np.zeros(9)]
+    curve, = edge_loops.fit_curves([zigzag], [[4]], [False])
+    assert np.allclose(curve[[0, 4, 8]], zigzag[[0, 4, 8]])
+    assert np.ptp(curve[1:4, 1]) < np.ptp(zigzag[1:4, 1])
+
+
+def test_place_loops_runs_over_the_surface():
+    mesh = sphere_mesh(around=64, down=48)
+    through = [edge_loops.nearest_vertices(mesh, positions) for positions in
+               [[(-5, -3, 8), (0, -4, 9), (5, -3, 8)], [(2, 2, 9.5), (3, 3, 9), (4, 2, 9)]]]
+    through = [mesh.points[vertices] for vertices in through]
+    lip, lid = edge_loops.place_loops(mesh, through, [11, 7])
+    assert lip.shape == (11, 3) and lid.shape == (7, 3)
+    # the loops start and end at the joints they run through and stay close to the sphere, the smoothed
+    # curve cuts across it between two joints by about the sagitta of their span, 0.3 for the lip
+    assert np.allclose(lip[[0, -1]], through[0][[0, -1]]) and np.allclose(lid[[0, -1]], through[1][[0, -1]])
+    for loop in (lip, lid):
+        assert np.abs(np.linalg.norm(loop, axis=1) - 10.0).max() < 0.4
+        steps = spacing(loop)
+        assert steps.max() < 1.5 * steps.min()
+
+
+def loop_positions(fake_scene, loop):
+    names = sorted(joint for joint in fake_scene.ls(type='joint')
+                   if joint.startswith(loop + '_') and not joint.endswith('pivot_joint'))
+    return dict((name, np.array(fake_scene.xform(name, query=True, worldSpace=True, translation=True)))
+                for name in names)
+
+
+def test_hero_template_build(fake_scene, head):
+    path, picks = head
+    result = batch.rig_head({'name': 'hero', 'mesh': path, 'faces': picks, 'template': HERO_TEMPLATE})
+    assert result['status'] == 'ok', result.get('traceback')
+    assert len(fake_scene.ls(type='joint')) == 157
+    top, bottom = loop_positions(fake_scene, 'lip_top'), loop_positions(fake_scene, 'lip_bottom')
+    assert len(top) == len(bottom) == 11
+    assert all(fake_scene.objExists(joint + '_anim') for joint in top)
+
+    # a lip pick moved in place moves the joints and controls of its loop only
+    index = template.active_plan().picks.index('mouth_top_side_joint_L')
+    new_picks = list(picks)
+    new_picks[index] += 3
+    before = dict((name, fake_scene.xform(name + '_anim.cv[*]', query=True, worldSpace=True, translation=True))
+                  for name in top)
+    moved = stages.update_face_pick('mouth_top_side_joint_L', 'Head', new_picks[index])
+    assert any(name + '_anim' in moved for name in top)
+    assert any(not np.allclose(fake_scene.xform(name + '_anim.cv[*]', query=True, worldSpace=True, translation=True),
+                               cvs) for name, cvs in before.items())
+    assert not any(name + '_anim' in moved for name in bottom)
+    updated = loop_positions(fake_scene, 'lip_top')
+
+    rebuilt_scene = FakeScene()
+    scene.set_scene(rebuilt_scene)
+    controls.clear()
+    result = batch.rig_head({'name': 'hero', 'mesh': path, 'faces': new_picks, 'template': HERO_TEMPLATE})
+    assert result['status'] == 'ok', result.get('traceback')
+    rebuilt = loop_positions(rebuilt_scene, 'lip_top')
+    for name, position in rebuilt.items():
+        assert np.allclose(updated[name], position, atol=1e-4), name
@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+
+from conftest import sphere_mesh
+from face_rig import batch, expressions, geometry, skinning, spatial, stages, template
+
+JOINTS = ['cheek_joint_L', 'cheek_joint_R', 'jaw_joint', 'top_joint']
+PRESETS = {
+    'puff_L': {'cheek_joint_L_anim': {'translate': [0.5, 0.2, 0.1], 'rotate': [0, 10, 0]}},
+    'jaw_open': {'jaw_joint_anim': {'rotate': [20, 0, 0]}},
+}
+
+
+@pytest.fixture
+def posed_sphere():
+    '''a sphere skinned to JOINTS with weights mirrored across the YZ plane, and the PoseRig of a
+    control over every joint
+    '''
+    mesh = sphere_mesh(around=32, down=16)
+    pivots = np.array([(7, 0, 7), (-7, 0, 7), (0, -4, 0), (0, 10, 0)], float)
+    weights = skinning.heat_weights(mesh, JOINTS, pivots)
+    symmetry = spatial.mesh_index(mesh).symmetry()
+    weights = skinning.mirror_weights(weights, mesh.points, symmetry)
+    # the vertices on the middle line keep their own weights, they are shared out evenly between the cheeks
+    dense = weights.dense()
+    middle = symmetry == np.arange(mesh.num_points)
+    dense[middle, :2] = dense[middle, :2].mean(axis=1)[:, None]
+    weights = skinning.from_dense(JOINTS, dense)
+    controls = [joint + '_anim' for joint in JOINTS]
+    rig = expressions.PoseRig(JOINTS, controls, dict((control, [control]) for control in controls),
+                              dict(zip(controls, pivots)), unit=2.0)
+    return mesh, weights, rig, symmetry
+
+
+def test_shape_library_is_a_csr(posed_sphere):
+    mesh, weights, rig, symmetry = posed_sphere
+    library = expressions.generate(mesh.points, weights, rig, PRESETS, symmetry)
+    assert library.names == ['puff_L', 'puff_R', 'jaw_open']
+    assert library.offsets[0] == 0 and library.offsets[-1] == len(library.indices) == len(library.deltas)
+    assert library.deltas.dtype == np.float32
+    for name in library.names:
+        indices, deltas = library.shape(name)
+        assert len(indices) and (np.diff(indices) > 0).all()
+        dense = library.dense(name)
+        assert np.array_equal(dense[indices], deltas)
+        assert np.count_nonzero(np.abs(dense).sum(axis=1)) == len(indices)
+    # the top of the head does not move with the jaw
+    assert library.shape('jaw_open')[0].size < mesh.num_points
+    assert 'puff_R' in library and 'puff' not in library
+    assert np.allclose(library.evaluate(mesh.points, {'jaw_open': 0.5}), mesh.points + 0.5 * library.dense('jaw_open'))
+
+
+def test_shapes_match_the_directly_posed_mesh(posed_sphere):
+    mesh, weights, rig, symmetry = posed_sphere
+    library = expressions.generate(mesh.points, weights, rig, PRESETS, symmetry)
+    posed = expressions.expand_presets(PRESETS)
+    assert list(posed) == library.names
+    directly = skinning.deform(mesh.points, weights, rig.skin_matrices(list(posed.values())))
+    size = np.ptp(mesh.points, axis=0).max()
+    for name, points in zip(posed, directly):
+        # float32 deltas, and the ones shorter than the tolerance are left out
+        error = np.abs(library.evaluate(mesh.points, {name: 1.0}) - points).max()
+        assert error < 2 * expressions.DELTA_TOLERANCE * size, name
+
+
+def test_right_shapes_are_mirrored_from_the_left(posed_sphere):
+    mesh, weights, rig, symmetry = posed_sphere
+    library = expressions.generate(mesh.points, weights, rig, PRESETS, symmetry)
+    left = library.dense('puff_L')
+    right = library.dense('puff_R')
+    assert np.array_equal(right[symmetry], left * spatial.REFLECTION.astype(np.float32))
+    indices, deltas = library.shape('puff_R')
+    assert np.array_equal(indices, np.sort(symmetry[library.shape('puff_L')[0]]))
+
+
+def test_save_and_load_shapes(tmp_path, posed_sphere):
+    mesh, weights, rig, symmetry = posed_sphere
+    library = expressions.generate(mesh.points, weights, rig, PRESETS, symmetry)
+    path = str(tmp_path / ('head' + expressions.SHAPES_EXTENSION))
+    expressions.save_shapes(path, library)
+    loaded = expressions.load_shapes(path)
+    assert loaded.names == library.names and loaded.num_points == library.num_points
+    for name in library.names:
+        assert np.array_equal(loaded.dense(name), library.dense(name))
+
+
+def test_expression_shapes_of_a_built_rig(fake_scene, head, tmp_path):
+    path, picks = head
+    result = batch.rig_head({'name': 'head', 'mesh': path, 'faces': picks})
+    assert result['status'] == 'ok', result.get('traceback')
+    library = stages.save_expression_shapes(str(tmp_path / 'head.frshapes'))
+    presets = expressions.load_presets()[0]
+    assert library.names == list(expressions.expand_presets(presets))
+    assert all(len(library.shape(name)[0]) for name in library.names)
+
+    # the shapes against the presets posed directly, the right side ones included. The heat weights of
+    # the head are only nearly symmetric, so the mirrored shapes are only close to the posed ones
+    plan = template.active_plan()
+    mesh = geometry.get_mesh(plan.mesh)
+    weights = fake_scene.get_skin_weights(stages.find_skin_cluster(plan.mesh))
+    rig = expressions.PoseRig.from_scene(weights.joint_names, plan.control_suffix, stages.control_unit())
+    posed = expressions.generate(mesh.points, weights, rig, expressions.expand_presets(presets))
+    size = np.ptp(mesh.points, axis=0).max()
+    for name in library.names:
+        error = np.abs(library.dense(name) - posed.dense(name)).max() / size
+        if name.endswith('_R'):
+            assert error < 0.03, name
+        else:
+            assert error == 0.0, name
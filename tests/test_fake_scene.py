@@ -0,0 +1,22 @@
+import pytest
+
+
+def test_delete_raises_on_a_missing_name(fake_scene):
+    fake_scene.joint(name='kept')
+    with pytest.raises(ValueError, match='No object matches name: missing'):
+        fake_scene.delete('kept', 'missing')
+    assert fake_scene.objExists('kept')
+
+
+def test_delete_takes_a_parent_and_its_child(fake_scene):
+    parent = fake_scene.group(empty=True, name='parent')
+    child = fake_scene.joint(name='child')
+    fake_scene.parent(child, parent)
+    fake_scene.delete(parent, child)
+    assert not fake_scene.objExists('parent') and not fake_scene.objExists('child')
+
+
+def test_ls_flattens_ranges(head_scene):
+    assert head_scene.ls('Head.f[10:12]', 'Head.vtx[3]', flatten=True) == [
+        'Head.f[10]', 'Head.f[11]', 'Head.f[12]', 'Head.vtx[3]']
+    assert len(head_scene.ls('Left_eye.f[*]', flatten=True)) == head_scene.read_mesh('Left_eye').num_faces
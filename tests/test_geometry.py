@@ -0,0 +1,78 @@
+import numpy as np
+
+from face_rig import geometry, stages, transaction
+
+
+def count_reads(fake_scene, monkeypatch):
+    '''the mesh names read_mesh of the scene is called with, as it is called
+    '''
+    reads = []
+    read_mesh = fake_scene.read_mesh
+
+    def counted(mesh_name):
+        reads.append(mesh_name)
+        return read_mesh(mesh_name)
+
+    monkeypatch.setattr(fake_scene, 'read_mesh', counted)
+    return reads
+
+
+def test_meshes_and_bounding_boxes_are_read_once(head_scene, monkeypatch):
+    reads = count_reads(head_scene, monkeypatch)
+    cache = geometry.cache
+    cache.reset_counters()
+    head = geometry.get_mesh('Head')
+    assert geometry.get_mesh('Head') is head
+    assert reads == ['Head'] and cache.stats() == {'hits': 1, 'misses': 1}
+    box = geometry.bounding_box('Head')
+    assert geometry.bounding_box('Head') == box
+    assert np.allclose(box, np.r_[head.points.min(axis=0), head.points.max(axis=0)], atol=1e-5)
+    assert cache.stats() == {'hits': 2, 'misses': 2}
+
+    # a Mesh is its own answer and never counted
+    assert geometry.get_mesh(head) is head
+    assert cache.stats() == {'hits': 2, 'misses': 2}
+
+    cache.invalidate('Left_eye')
+    assert geometry.get_mesh('Head') is head
+    cache.invalidate('Head')
+    assert geometry.get_mesh('Head') is not head
+    assert reads == ['Head', 'Head']
+    cache.invalidate()
+    geometry.bounding_box('Head')
+    assert cache.stats()['misses'] == 4
+
+
+def test_joint_snapshot(head_scene):
+    with transaction.run('joints'):
+        stages.create_joints()
+    cache = geometry.cache
+    cache.invalidate()
+    cache.reset_counters()
+    names = cache.joint_names()
+    assert sorted(names) == sorted(head_scene.ls(type='joint'))
+    for name in names:
+        assert np.allclose(geometry.position(name), head_scene.xform(name, query=True, worldSpace=True, translation=True))
+    # one snapshot answers every joint
+    assert cache.stats() == {'hits': len(names), 'misses': 1}
+    assert np.allclose(cache.joint_matrices()[:, 3, :3], [geometry.position(name) for name in names])
+
+    # a joint made after the snapshot is queried until the snapshot is taken again
+    head_scene.select(clear=True)
+    head_scene.joint(name='late_joint', position=(1, 2, 3))
+    assert np.allclose(geometry.position('late_joint'), (1, 2, 3))
+    assert cache.misses == 2
+    cache.invalidate_joints()
+    assert 'late_joint' in cache.joint_names()
+    assert cache.misses == 3
+    # a position that is not a node name is handed back
+    assert geometry.position((4, 5, 6)) == (4, 5, 6)
+
+
+def test_selection_centroids_keep_the_selection_order(head_scene):
+    head = geometry.get_mesh('Head')
+    eye = geometry.get_mesh('Left_eye')
+    centres = geometry.selection_centroids([('Head', [3]), ('Left_eye', [1, 2]), ('Head', [7])])
+    expected = [head.face_centroids([3]), eye.face_centroids([1, 2]), head.face_centroids([7])]
+    assert len(centres) == 3
+    assert all(np.allclose(centre, faces) for centre, faces in zip(centres, expected))
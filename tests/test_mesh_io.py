@@ -0,0 +1,87 @@
+import os
+
+import numpy as np
+import pytest
+
+from conftest import is_mapped
+from face_rig import mesh_io
+
+OBJ = b'''# two objects, a quad with texture and normal indices and a triangle with negative indices
+o Quad
+v 0 0 0
+v 1 0 0 1.0
+v 1 1 0
+v 0 1 0
+vt 0 0
+vn 0 0 1
+f 1/1/1 2/1/1 3/1/1 4/1/1
+g Triangle
+v 2 0 0
+v 3 0 0
+v 2 1 0
+f -3 -2 -1
+'''
+
+
+def test_parse_obj():
+    meshes = dict(mesh_io.parse_obj(OBJ))
+    assert list(meshes) == ['Quad', 'Triangle']
+    quad, triangle = meshes['Quad'], meshes['Triangle']
+    assert np.array_equal(quad.points, [(0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0)])
+    assert list(quad.face_counts) == [4] and list(quad.face_connects) == [0, 1, 2, 3]
+    # every object keeps only its own vertices
+    assert np.array_equal(triangle.points, [(2, 0, 0), (3, 0, 0), (2, 1, 0)])
+    assert list(triangle.face_counts) == [3] and list(triangle.face_connects) == [0, 1, 2]
+    assert mesh_io.parse_obj(b'') == []
+
+
+def test_parse_obj_without_objects():
+    (name, mesh), = mesh_io.parse_obj(b'v 0 0 0\nv 1 0 0\nv 0 1 0\nf 1 2 3')
+    assert name == 'polySurface1' and mesh.num_faces == 1
+
+
+def test_save_and_parse_round_trip(tmp_path):
+    meshes = dict(mesh_io.parse_obj(OBJ))
+    path = str(tmp_path / 'round.obj')
+    mesh_io.save_obj(meshes, path)
+    loaded = mesh_io.load_obj(path)
+    for name, mesh in meshes.items():
+        assert np.allclose(loaded[name].points, mesh.points)
+        assert np.array_equal(loaded[name].face_connects, mesh.face_connects)
+
+
+def test_cache_is_memory_mapped_and_follows_the_obj(tmp_path):
+    path = str(tmp_path / 'head.obj')
+    with open(path, 'wb') as obj_file:
+        obj_file.write(OBJ)
+    cached = mesh_io.cache_path(path)
+    assert cached.endswith(mesh_io.CACHE_EXTENSION)
+    parsed = mesh_io.load_meshes(path)
+    assert os.path.exists(cached)
+
+    mapped = mesh_io.load_meshes(path)
+    points = mapped['Quad'].points
+    assert is_mapped(points)
+    assert points.dtype == np.float32
+    for name, mesh in parsed.items():
+        assert np.array_equal(mapped[name].points, mesh.points.astype(np.float32))
+        assert np.array_equal(mapped[name].face_connects, mesh.face_connects)
+    assert list(mesh_io.load_meshes(cached)) == list(parsed)
+
+    # an OBJ newer than its cache is parsed again and the cache rewritten
+    with open(path, 'wb') as obj_file:
+        obj_file.write(OBJ.replace(b'v 1 1 0', b'v 1 5 0'))
+    stamp = os.path.getmtime(path) - 10
+    os.utime(cached, (stamp, stamp))
+    assert mesh_io.load_meshes(path)['Quad'].points[2].tolist() == [1, 5, 0]
+    assert os.path.getmtime(cached) >= os.path.getmtime(path)
+    assert mesh_io.load_meshes(path)['Quad'].points[2].tolist() == [1, 5, 0]
+    # without the cache the OBJ is parsed every time
+    assert mesh_io.load_meshes(path, use_cache=False)['Quad'].points.dtype == np.float64
+
+
+def test_not_a_cache(tmp_path):
+    path = tmp_path / ('head' + mesh_io.CACHE_EXTENSION)
+    path.write_bytes(b'not a mesh cache')
+    with pytest.raises(ValueError):
+        mesh_io.load_cache(str(path))
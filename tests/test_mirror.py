@@ -0,0 +1,67 @@
+import numpy as np
+
+from conftest import sphere_mesh
+from face_rig import mirror, spatial
+from face_rig.mesh import Mesh
+from face_rig.shapes import rotation_matrices
+
+
+def rigid(rotate, translate):
+    matrix = np.identity(4)
+    matrix[:3, :3] = rotation_matrices([rotate])[0]
+    matrix[3, :3] = translate
+    return matrix
+
+
+def test_reflected_matrices_mirror_the_same_rotation():
+    matrices = np.array([rigid((10, 20, 30), (3, 1, 2)), rigid((-40, 5, 70), (0.5, -2, 8))])
+    for behavior in (True, False):
+        reflected = mirror.reflect_matrices(matrices, behavior)
+        assert np.allclose(reflected[:, 3, :3], matrices[:, 3, :3] * spatial.REFLECTION)
+        # still right handed rotations, and reflecting twice comes back
+        assert np.allclose(np.linalg.det(reflected[:, :3, :3]), 1.0)
+        assert np.allclose(mirror.reflect_matrices(reflected, behavior), matrices)
+    # with mirror behaviour the same local rotation on both sides gives mirror images
+    turn = rigid((15, -25, 5), (0, 0, 0))
+    reflected = mirror.reflect_matrices(matrices)
+    assert np.allclose(mirror.reflect_matrices(np.matmul(turn, matrices)), np.matmul(turn, reflected))
+
+
+def test_follow_surface_keeps_the_offset_from_the_mirror_vertex():
+    mesh = sphere_mesh(around=32, down=16)
+    positions = np.array([(6.0, 2.0, 7.5), (3.0, -5.0, 8.2)])
+    mirrored = positions * spatial.REFLECTION
+    # on a symmetric mesh the surface changes nothing
+    assert np.allclose(mirror.follow_surface(mesh, positions, mirrored), mirrored)
+
+    # the right side of the head is a little wider, within the symmetry tolerance, the mirrored
+    # positions move out with it
+    wider = mesh.points.copy()
+    wider[wider[:, 0] < -1e-6, 0] *= 1.001
+    lopsided = Mesh(wider, mesh.face_counts, mesh.face_connects)
+    followed = mirror.follow_surface(lopsided, positions, mirrored)
+    vertices = spatial.mesh_index(mesh).nearest_vertices(positions)
+    counterparts = spatial.mesh_index(mesh).symmetry()[vertices]
+    assert np.array_equal(spatial.mesh_index(lopsided).symmetry()[vertices], counterparts)
+    expected = wider[counterparts] + (positions - wider[vertices]) * spatial.REFLECTION
+    assert np.allclose(followed, expected)
+    assert (followed[:, 0] < mirrored[:, 0]).all()
+
+
+def test_mirror_joints_in_the_scene(fake_scene):
+    fake_scene.select(clear=True)
+    fake_scene.joint(name='root_joint', position=(0, 0, 0))
+    fake_scene.select(clear=True)
+    fake_scene.joint(name='arm_joint_L', position=(2, 1, 0))
+    fake_scene.joint(name='hand_joint_L', position=(4, 1, 1))
+    parents = {'arm_joint_L': 'root_joint', 'hand_joint_L': 'arm_joint_L'}
+    created = mirror.mirror_joints(['hand_joint_L', 'arm_joint_L', 'missing_joint_L'], parents)
+    assert sorted(created) == ['arm_joint_R', 'hand_joint_R']
+    assert fake_scene.calls['create_joints'] == 1
+    assert fake_scene.listRelatives('arm_joint_R', parent=True) == ['root_joint']
+    assert fake_scene.listRelatives('hand_joint_R', parent=True) == ['arm_joint_R']
+    for joint in ('arm_joint_L', 'hand_joint_L'):
+        left = np.reshape(fake_scene.xform(joint, query=True, worldSpace=True, matrix=True), (4, 4))
+        right = np.reshape(fake_scene.xform(joint.replace('_L', '_R'), query=True, worldSpace=True, matrix=True), (4, 4))
+        assert np.allclose(right, mirror.reflect_matrices(left[None])[0])
+    assert mirror.mirror_joints(['missing_joint_L'], {}) == []
@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+
+from conftest import sphere_mesh
+from face_rig import batch, preview, skinning, stages
+
+
+def rotation_x(degrees):
+    '''row vector rotation matrix about X
+    '''
+    angle = np.radians(degrees)
+    matrix = np.identity(4)
+    matrix[1:3, 1:3] = [[np.cos(angle), np.sin(angle)], [-np.sin(angle), np.cos(angle)]]
+    return matrix
+
+
+@pytest.fixture
+def rig():
+    '''a sphere skinned to a chain of three joints up the Y axis
+    '''
+    mesh = sphere_mesh(around=16, down=12)
+    bind_local = np.tile(np.identity(4), (3, 1, 1))
+    bind_local[:, 3, :3] = [(0, -10, 0), (0, 10, 0), (0, 5, 0)]
+    skeleton = preview.Skeleton(['root', 'neck', 'head'], [-1, 0, 1], bind_local)
+    weights = skinning.heat_weights(mesh, skeleton.joint_names, skeleton.bind_world[:, 3, :3])
+    return preview.PreviewRig(skeleton, weights, mesh.points)
+
+
+def test_world_matrices_follow_the_hierarchy(rig):
+    skeleton = rig.skeleton
+    assert np.allclose(skeleton.bind_world[:, 3, :3], [(0, -10, 0), (0, 0, 0), (0, 5, 0)])
+    translate, rotate = skeleton.channels(2)
+    rotate[1, 0] = (90, 0, 0)
+    translate[1, 2] = (1, 0, 0)
+    world = skeleton.world_matrices(skeleton.local_matrices(translate, rotate))
+    assert np.allclose(world[0], skeleton.bind_world)
+    # the whole chain turns about the root, the head is also moved along X in the space of its parent
+    root = rotation_x(90).dot(skeleton.bind_local[0])
+    neck = skeleton.bind_local[1].dot(root)
+    head = skeleton.bind_local[2].copy()
+    head[3, :3] += (1, 0, 0)
+    assert np.allclose(world[1], [root, neck, head.dot(neck)])
+    assert np.allclose(world[1, 2, 3, :3], (1, -10, 15))
+
+
+def test_evaluate_matches_the_directly_posed_mesh(rig):
+    translate, rotate = rig.skeleton.channels(3)
+    rotate[1, 0] = (0, 30, 0)
+    translate[2, 1] = (0, 2, 0)
+    posed = rig.evaluate(translate, rotate)
+    assert np.allclose(posed[0], rig.points, atol=1e-5)
+    # turning the root turns every point about it
+    centre = rig.skeleton.bind_world[0, 3, :3]
+    angle = np.radians(30)
+    turn = np.array([[np.cos(angle), 0, -np.sin(angle)], [0, 1, 0], [np.sin(angle), 0, np.cos(angle)]])
+    assert np.allclose(posed[1], (rig.points - centre).dot(turn) + centre, atol=1e-4)
+    # moving the neck moves every point by its neck and head weights
+    dense = rig.weights.dense()
+    assert np.allclose(posed[2] - rig.points, np.outer(dense[:, 1] + dense[:, 2], (0, 2, 0)), atol=1e-5)
+
+
+def test_save_and_load(tmp_path, rig):
+    path = str(tmp_path / ('head' + preview.RIG_EXTENSION))
+    rig.save(path)
+    loaded = preview.PreviewRig.load(path)
+    assert loaded.skeleton.joint_names == rig.skeleton.joint_names
+    translate, rotate = preview.turntable(rig.skeleton, 4)
+    assert np.allclose(loaded.evaluate(translate, rotate), rig.evaluate(translate, rotate))
+
+
+def test_bake_in_worker_processes_writes_the_cache(tmp_path, rig):
+    frames = preview.POOL_FRAMES
+    translate, rotate = preview.turntable(rig.skeleton, frames)
+    rotate[:, 1, 0] = np.linspace(0, 45, frames)
+    expected = rig.evaluate(translate, rotate)
+
+    points, stats = preview.bake(rig, translate, rotate, workers=1)
+    assert stats['workers'] == 1 and stats['frames'] == frames
+    assert points.dtype == np.float32 and np.allclose(points, expected, atol=1e-4)
+
+    cache_path = str(tmp_path / 'turntable.npy')
+    points, stats = preview.bake(rig, translate, rotate, cache_path, workers=2, chunk=5)
+    assert points is None and stats['workers'] == 2
+    cache = np.load(cache_path, mmap_mode='r')
+    assert cache.shape == (frames, len(rig.points), 3) and cache.dtype == np.float32
+    assert np.allclose(cache, expected, atol=1e-4)
+
+
+def test_preview_rig_of_a_built_head(fake_scene, head, tmp_path):
+    path, picks = head
+    result = batch.rig_head({'name': 'head', 'mesh': path, 'faces': picks})
+    assert result['status'] == 'ok', result.get('traceback')
+    rig = stages.save_preview_rig(str(tmp_path / 'head.frrig'))
+    # the skeleton holds every skinned joint and the joints above them, parents first
+    assert set(rig.weights.joint_names) <= set(rig.skeleton.joint_names)
+    assert all(parent < joint for joint, parent in enumerate(rig.skeleton.parents))
+    # the bind pose is the scene's
+    for name in rig.weights.joint_names:
+        world = np.reshape(fake_scene.xform(name, query=True, worldSpace=True, matrix=True), (4, 4))
+        assert np.allclose(rig.skeleton.bind_world[rig.skeleton.index(name)], world, atol=1e-5), name
+    translate, rotate = rig.skeleton.channels(1)
+    assert np.allclose(rig.evaluate(translate, rotate)[0], rig.points, atol=1e-4)
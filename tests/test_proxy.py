@@ -0,0 +1,56 @@
+import numpy as np
+
+from conftest import sphere_mesh
+from face_rig import benchmark, proxy, skinning
+
+
+def test_decimate_keeps_the_surface():
+    mesh = sphere_mesh(around=96, down=64)
+    head_proxy = proxy.decimate(mesh, 500)
+    assert 500 / 1.5 <= head_proxy.mesh.num_points <= 500 * 1.5
+    assert len(head_proxy.clusters) == mesh.num_points
+    assert head_proxy.clusters.max() == head_proxy.mesh.num_points - 1
+    # the proxy points stay on the sphere
+    radii = np.linalg.norm(head_proxy.mesh.points, axis=1)
+    assert np.abs(radii - 10.0).max() < 0.2
+    corners, barycentric, distances = head_proxy.closest(mesh.points)
+    assert np.allclose(barycentric.sum(axis=1), 1.0)
+    assert (barycentric >= -1e-9).all()
+    nearest = np.einsum('ek,eka->ea', barycentric, head_proxy.mesh.points[corners])
+    assert np.allclose(np.linalg.norm(nearest - mesh.points, axis=1), distances)
+    assert distances.max() < 0.5 and distances.mean() < 0.05
+    assert proxy.mesh_proxy(mesh, 500) is proxy.mesh_proxy(mesh, 500)
+
+
+def test_transfer_weights_interpolates_the_proxy_weights():
+    mesh = sphere_mesh(around=64, down=48)
+    head_proxy = proxy.decimate(mesh, 400)
+    joints = [(0, 10, 0), (0, 0, 10), (7, 0, 7), (-7, 0, 7), (0, -7, 7)]
+    names = ['joint%d' % index for index in range(len(joints))]
+    proxy_weights = skinning.heat_weights(head_proxy.mesh, names, joints)
+    weights = proxy.transfer_weights(head_proxy, proxy_weights, mesh.points)
+    assert weights.num_points == mesh.num_points
+    assert np.diff(weights.offsets).max() <= skinning.MAX_INFLUENCES
+    assert np.allclose(np.bincount(weights.rows(), weights=weights.weights), 1.0, atol=1e-5)
+    assert proxy.last_transfer['points'] == mesh.num_points
+
+    # a head point takes the weights of its nearest point on the proxy
+    corners, barycentric, distances = head_proxy.closest(mesh.points)
+    expected = np.einsum('ek,ekj->ej', barycentric, proxy_weights.dense()[corners])
+    # of the five joints the smallest weight is dropped, points where it is a tie with the next are left out
+    ordered = np.sort(expected, axis=1)
+    clear = ordered[:, 1] - ordered[:, 0] > 1e-3
+    np.put_along_axis(expected, np.argmin(expected, axis=1)[:, None], 0.0, axis=1)
+    expected /= expected.sum(axis=1)[:, None]
+    assert clear.mean() > 0.9
+    assert np.allclose(weights.dense()[clear], expected[clear], atol=1e-5)
+
+
+def test_proxy_error_is_bounded():
+    # the picks and weights found on a proxy of a sixth of the points against the ones found on the head,
+    # distances are shares of the size of the head. 0.28 max and 0.054 mean weight error at the time of writing
+    result = benchmark.bench_proxy(60000, 10000)
+    assert result['pick_moved'] < 0.03
+    assert result['weight_error_max'] < 0.35
+    assert result['weight_error_mean'] < 0.06
+    assert result['surface_distance_max'] < 0.01
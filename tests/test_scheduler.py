@@ -0,0 +1,69 @@
+from face_rig import controls, scheduler, stages, transaction
+
+
+def build_joints():
+    with transaction.run('joints'):
+        stages.create_joints()
+        stages.create_head_joint()
+        stages.mirror_joints()
+
+
+def test_cancelled_job_restores_the_scene_and_the_state(head_scene):
+    build_joints()
+    before = head_scene.describe()
+    joints = list(stages.generated_joints)
+    queue = scheduler.IdleQueue()
+    job = stages.start_create_controls(queue=queue)
+    job.slice_seconds = 0
+    queue.run_once()
+    queue.run_once()
+    assert job.done == 2 and controls.registry
+    job.cancel()
+    queue.run()
+    assert job.status == 'cancelled'
+    assert scheduler.current() is None
+    assert head_scene.describe() == before
+    assert controls.registry == []
+    assert stages.generated_joints == joints
+
+    # the controls can be made again after the cancelled job
+    job = stages.start_create_controls(queue=queue)
+    queue.run()
+    assert job.status == 'finished'
+    assert len(controls.registry) > 0
+
+
+def test_stages_wait_for_a_running_job(head_scene):
+    build_joints()
+    queue = scheduler.IdleQueue()
+    job = stages.start_create_controls(queue=queue)
+    job.slice_seconds = 0
+    queue.run_once()
+    joints = list(stages.generated_joints)
+    assert stages.delete_generated_joints() is None
+    assert stages.generated_joints == joints
+    assert all(head_scene.objExists(joint) for joint in joints)
+    assert 'still running' in head_scene.warnings[-1]
+
+    job.cancel()
+    queue.run()
+    stages.delete_generated_joints()
+    assert not any(head_scene.objExists(joint) for joint in joints)
+
+
+def test_refresh_resumes_between_slices(head_scene):
+    build_joints()
+    queue = scheduler.IdleQueue()
+    suspended = []
+    job = stages.start_create_controls(queue=queue)
+    job.slice_seconds = 0
+    job.on_progress = lambda job, label, seconds: suspended.append(head_scene.refresh_suspended)
+    queue.run_once()
+    assert suspended == [True]
+    assert not head_scene.refresh_suspended
+    queue.run_once()
+    assert suspended == [True, True]
+    assert not head_scene.refresh_suspended
+    queue.run()
+    assert job.status == 'finished'
+    assert all(suspended) and not head_scene.refresh_suspended
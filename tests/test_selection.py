@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from face_rig.selection import FaceSet, faces_from_data, faces_to_data, parse_components
+
+
+def test_set_operations_match_python_sets():
+    rng = np.random.RandomState(0)
+    for _ in range(100):
+        a = rng.randint(0, 200, rng.randint(0, 80))
+        b = rng.randint(0, 200, rng.randint(0, 80))
+        first, second = FaceSet.from_indices(a), FaceSet.from_indices(b)
+        set_a, set_b = set(a.tolist()), set(b.tolist())
+        assert list(first | second) == sorted(set_a | set_b)
+        assert list(first & second) == sorted(set_a & set_b)
+        assert list(first - second) == sorted(set_a - set_b)
+        assert len(first) == len(set_a)
+        queries = rng.randint(-5, 210, 50)
+        assert (first.contains(queries) == np.isin(queries, a)).all()
+        # the runs are sorted and never touch
+        runs = first.runs
+        assert len(runs) < 2 or (runs[1:, 0] > runs[:-1, 1]).all()
+        assert FaceSet.from_ranges(first.ranges()) == first
+
+
+def test_runs_stay_small():
+    faces = FaceSet.from_ranges([(0, 999999)]) - FaceSet.from_ranges([(1000, 1999)])
+    assert len(faces) == 999000
+    assert faces.run_count == 2
+    assert 1000 not in faces and 2000 in faces
+    assert faces[-1] == 999999
+    assert faces_from_data(faces_to_data(faces)) == faces
+
+
+def test_parse_components():
+    faces, ignored = parse_components(['Head.f[10:250]', 'Head.f[3]', 'Left_eye.f[*]', 'Head', 'Head.vtx[3]',
+                                       'Head.f[1,5,7]'], lambda mesh: 400)
+    assert list(faces) == ['Head', 'Left_eye']
+    assert faces['Head'].components('Head') == ['Head.f[1]', 'Head.f[3]', 'Head.f[5]', 'Head.f[7]',
+                                                'Head.f[10:250]']
+    assert len(faces['Left_eye']) == 400
+    assert ignored == ['Head', 'Head.vtx[3]']
+
+
+def test_index_out_of_range():
+    with pytest.raises(IndexError):
+        FaceSet.from_indices([1, 2, 3])[3]
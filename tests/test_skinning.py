@@ -0,0 +1,77 @@
+import numpy as np
+
+from conftest import sphere_mesh
+from face_rig import skinning, spatial
+
+JOINTS = ['top_joint', 'nose_joint', 'cheek_joint_L', 'cheek_joint_R', 'chin_joint']
+
+
+def joint_vertices(mesh):
+    '''a vertex for every joint of JOINTS, the cheeks mirror images of each other
+    '''
+    index = spatial.mesh_index(mesh)
+    vertices = index.nearest_vertices([(0, 10, 0), (0, 0, 10), (7, 0, 7), (-7, 0, 7), (0, -7, 7)])
+    assert index.symmetry()[vertices[2]] == vertices[3]
+    return vertices
+
+
+def test_heat_weights_are_normalized_and_sparse():
+    mesh = sphere_mesh()
+    vertices = joint_vertices(mesh)
+    weights = skinning.heat_weights(mesh, JOINTS, mesh.points[vertices])
+    counts = np.diff(weights.offsets)
+    assert weights.num_points == mesh.num_points
+    assert counts.min() >= 1 and counts.max() <= skinning.MAX_INFLUENCES
+    assert np.allclose(np.bincount(weights.rows(), weights=weights.weights), 1.0, atol=1e-5)
+    assert (weights.weights > 0).all()
+    # the vertex at a joint belongs to that joint only
+    for joint, vertex in zip(JOINTS, vertices):
+        influences = weights.vertex(vertex)
+        assert max(influences, key=influences.get) == joint
+        assert influences[joint] > 0.99
+
+
+def test_mirrored_weights_match_the_symmetric_vertices():
+    mesh = sphere_mesh()
+    vertices = joint_vertices(mesh)
+    # only the left cheek is solved, the right one comes from the mirror
+    positions = mesh.points[vertices]
+    positions[3] = (-7, 0, -7)
+    weights = skinning.heat_weights(mesh, JOINTS, positions)
+    symmetry = spatial.mesh_index(mesh).symmetry()
+    mirrored = skinning.mirror_weights(weights, mesh.points, symmetry)
+
+    for vertex in np.flatnonzero((mesh.points[:, 0] > 1e-6) & (symmetry >= 0)):
+        expected = dict((name.replace('_L', '_R') if name.endswith('_L') else
+                         name.replace('_R', '_L') if name.endswith('_R') else name, weight)
+                        for name, weight in weights.vertex(vertex).items())
+        mirror = mirrored.vertex(symmetry[vertex])
+        assert sorted(mirror) == sorted(expected)
+        assert np.allclose([mirror[name] for name in sorted(mirror)], [expected[name] for name in sorted(mirror)])
+        # the left side keeps its own weights
+        assert mirrored.vertex(vertex) == weights.vertex(vertex)
+    # the middle line keeps its own weights too
+    middle = np.flatnonzero(np.abs(mesh.points[:, 0]) < 1e-6)
+    assert all(mirrored.vertex(vertex) == weights.vertex(vertex) for vertex in middle)
+
+
+def test_deform_blends_the_joint_matrices():
+    mesh = sphere_mesh(around=16, down=8)
+    vertices = joint_vertices(mesh)
+    weights = skinning.heat_weights(mesh, JOINTS, mesh.points[vertices])
+    matrices = np.tile(np.eye(4), (2, len(JOINTS), 1, 1))
+    # the second pose moves the nose joint 1 along Z, row vector matrices keep the translation in the last row
+    matrices[1, 1, 3, :3] = (0, 0, 1)
+    posed = skinning.deform(mesh.points, weights, matrices)
+    assert posed.shape == (2, mesh.num_points, 3)
+    # the weights are float32
+    assert np.allclose(posed[0], mesh.points, atol=1e-5)
+    nose = weights.dense()[:, 1]
+    assert np.allclose(posed[1] - mesh.points, np.c_[np.zeros((mesh.num_points, 2)), nose], atol=1e-5)
+    # a chunked deform gives the same points
+    chunk = skinning.DEFORM_CHUNK
+    try:
+        skinning.DEFORM_CHUNK = 7
+        assert np.allclose(skinning.deform(mesh.points, weights, matrices), posed)
+    finally:
+        skinning.DEFORM_CHUNK = chunk
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from conftest import sphere_mesh
+from face_rig import spatial
+
+
+def brute_nearest(points, queries):
+    squared = ((queries[:, None, :] - points[None, :, :]) ** 2).sum(axis=2)
+    nearest = np.argmin(squared, axis=1)
+    return np.sqrt(squared[np.arange(len(queries)), nearest]), nearest
+
+
+@pytest.mark.parametrize('count', [1, 15, 1000])
+def test_kd_tree_matches_brute_force(count):
+    random = np.random.RandomState(count)
+    points = random.normal(size=(count, 3)) * [3.0, 1.0, 0.2]
+    queries = random.normal(size=(300, 3)) * 4.0
+    tree = spatial.KDTree(points)
+    distances, indices = tree.query(queries)
+    expected_distances, expected = brute_nearest(points, queries)
+    assert np.allclose(distances, expected_distances)
+    assert np.allclose(distances, np.linalg.norm(points[indices] - queries, axis=1))
+
+    # the queries are split into chunks the same way
+    chunk = spatial.QUERY_CHUNK
+    try:
+        spatial.QUERY_CHUNK = 7
+        assert np.array_equal(tree.query(queries)[1], indices)
+    finally:
+        spatial.QUERY_CHUNK = chunk
+
+
+def test_kd_tree_with_repeated_points():
+    points = np.repeat(np.random.RandomState(0).uniform(size=(20, 3)), 10, axis=0)
+    distances, indices = spatial.KDTree(points).query(points)
+    assert np.allclose(distances, 0.0)
+    assert np.allclose(points[indices], points)
+
+
+def test_query_radius_matches_brute_force():
+    random = np.random.RandomState(1)
+    points = random.uniform(-1, 1, size=(2000, 3))
+    queries = random.uniform(-1, 1, size=(50, 3))
+    radius = random.uniform(0.05, 0.4, size=50)
+    offsets, indices = spatial.KDTree(points).query_radius(queries, radius)
+    for query, position in enumerate(queries):
+        expected = np.flatnonzero(np.linalg.norm(points - position, axis=1) <= radius[query])
+        assert sorted(indices[offsets[query]:offsets[query + 1]]) == list(expected)
+
+
+def test_scan_nearest_matches_brute_force():
+    random = np.random.RandomState(2)
+    points = random.normal(size=(500, 3))
+    queries = random.normal(size=(20, 3))
+    chunk = spatial.SCAN_CHUNK
+    try:
+        for spatial.SCAN_CHUNK in (chunk, 64):
+            distances, indices = spatial.scan_nearest(points, queries)
+            expected_distances, expected = brute_nearest(points, queries)
+            assert np.array_equal(indices, expected)
+            assert np.allclose(distances, expected_distances)
+    finally:
+        spatial.SCAN_CHUNK = chunk
+
+
+def test_symmetry_map():
+    mesh = sphere_mesh(around=24, down=12)
+    index = spatial.mesh_index(mesh)
+    symmetry = index.symmetry()
+    assert (symmetry >= 0).all()
+    assert np.allclose(mesh.points[symmetry], mesh.points * spatial.REFLECTION, atol=1e-6)
+    # mirroring twice comes back, the middle line mirrors to itself
+    assert np.array_equal(symmetry[symmetry], np.arange(mesh.num_points))
+    middle = np.abs(mesh.points[:, 0]) < 1e-6
+    assert np.array_equal(symmetry[middle], np.flatnonzero(middle))
+    assert np.array_equal(index.mirror_vertices([3, 40]), symmetry[[3, 40]])
+    assert spatial.mesh_index(mesh) is index
+
+    # a point without a mirror image has none
+    moved = mesh.points.copy()
+    moved[5] += (0.5, 0, 0)
+    lopsided = spatial.symmetry_map(spatial.KDTree(moved), tolerance=0.01)
+    assert lopsided[5] == -1 and lopsided[symmetry[5]] == -1
+    assert (np.delete(lopsided, [5, symmetry[5]]) >= 0).all()
+
+    faces = index.face_symmetry()
+    centroids = index.face_centroids
+    assert np.allclose(centroids[faces], centroids * spatial.REFLECTION, atol=1e-6)
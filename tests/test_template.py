@@ -0,0 +1,72 @@
+import pytest
+
+from face_rig import stages, template, transaction
+
+
+def test_eye_meshes_must_be_a_pair():
+    rig_template = template.load_template()
+    rig_template['eye_meshes'] = ['Left_eye']
+    with pytest.raises(template.TemplateError):
+        template.compile_template(rig_template)
+
+
+def test_build_on_renamed_meshes(head_scene):
+    names = {'Head': 'hero_head', 'Left_eye': 'hero_eye_L', 'Right_eye': 'hero_eye_R'}
+    for old_name, new_name in names.items():
+        head_scene.rename(old_name, new_name)
+    rig_template = template.load_template()
+    rig_template['mesh'] = 'hero_head'
+    rig_template['eye_meshes'] = ['hero_eye_L', 'hero_eye_R']
+    for pairs in rig_template['centre_joints'].values():
+        for pair in pairs:
+            pair[1] = names[pair[1]]
+    template.set_active_plan(template.compile_template(rig_template))
+    stages.selected_faces = [('hero_head', faces) for mesh, faces in stages.selected_faces]
+    with transaction.run('build'):
+        stages.create_joints()
+        stages.create_head_joint()
+        stages.mirror_joints()
+        stages.create_controls()
+    assert sorted(head_scene.ls(type='skinCluster')) == sorted(
+        head_scene.ls(head_scene.listHistory(mesh), type='skinCluster')[0] for mesh in ('hero_eye_L', 'hero_eye_R'))
+
+
+def without_joint(rig_template, joint):
+    '''the template with a pick joint taken out of its picks and its hierarchy
+    '''
+    rig_template['picks'].remove(joint)
+    for groups in rig_template['joint_parents'].values():
+        for children in groups.values():
+            if joint in children:
+                children.remove(joint)
+    return rig_template
+
+
+def test_missing_centre_control_is_rejected():
+    rig_template = without_joint(template.load_template(), 'brow_middle_joint')
+    with pytest.raises(template.TemplateError, match='brow_middle_joint_anim'):
+        template.compile_template(rig_template)
+
+
+def test_missing_role_joint_is_rejected():
+    rig_template = without_joint(template.load_template(), 'chin_joint')
+    rig_template['controls']['centre'].remove('chin_joint_anim')
+    rig_template['controls']['parents']['jaw_joint_anim'].remove('chin_joint_anim')
+    with pytest.raises(template.TemplateError, match='chin_joint'):
+        template.compile_template(rig_template)
+
+
+def test_build_without_a_joint(head_scene):
+    rig_template = without_joint(template.load_template(), 'brow_middle_joint')
+    rig_template['controls']['centre'].remove('brow_middle_joint_anim')
+    index = template.load_template()['picks'].index('brow_middle_joint')
+    template.set_active_plan(template.compile_template(rig_template))
+    del stages.selected_faces[index]
+    with transaction.run('build'):
+        stages.create_joints()
+        stages.create_head_joint()
+        stages.mirror_joints()
+        stages.create_controls()
+    assert not head_scene.objExists('brow_middle_joint')
+    assert head_scene.objExists('nose_tip_joint_anim')
+    assert head_scene.getAttr('nose_tip_joint_anim.overrideColorRGB') == (1, 1, 0)
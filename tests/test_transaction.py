@@ -0,0 +1,80 @@
+import pytest
+
+from face_rig import build_graph, controls, stages, transaction
+
+
+def fail(*args, **kwargs):
+    raise RuntimeError('failed on purpose')
+
+
+def test_failed_stage_is_rolled_back_and_runs_again(head_scene, monkeypatch):
+    before = head_scene.describe()
+    picks = list(stages.selected_faces)
+    monkeypatch.setattr(stages, 'create_joint_at_center', fail)
+    with pytest.raises(RuntimeError):
+        stages.create_joints()
+    assert head_scene.describe() == before
+    assert stages.generated_joints == []
+    assert stages.built_picks == []
+    assert stages.selected_faces == picks
+
+    monkeypatch.undo()
+    stages.create_joints()
+    # the picks and the eye joints
+    assert len(stages.generated_joints) == 26
+    assert all(head_scene.objExists(joint) for joint in stages.generated_joints)
+
+
+def test_rollback_puts_back_the_joints_of_the_previous_run(head_scene, monkeypatch):
+    stages.create_joints()
+    joints = list(stages.generated_joints)
+    built = head_scene.describe()
+    # the failing run deletes the joints of the first one before it fails
+    monkeypatch.setattr(stages, 'create_joint_at_center', fail)
+    with pytest.raises(RuntimeError):
+        stages.create_joints()
+    assert head_scene.describe() == built
+    assert stages.generated_joints == joints
+
+    monkeypatch.undo()
+    stages.create_joints()
+    stages.delete_generated_joints()
+    assert not any(head_scene.objExists(joint) for joint in joints)
+
+
+def test_rollback_forgets_the_controls_and_the_build_graph(head_scene, monkeypatch):
+    with transaction.run('build'):
+        stages.create_joints()
+        stages.create_head_joint()
+        stages.mirror_joints()
+        stages.create_controls()
+    registered = list(controls.registry)
+    built_picks = list(stages.built_picks)
+    moved_face = built_picks[0][1] + 1
+    monkeypatch.setattr(build_graph, 'apply', fail)
+    with pytest.raises(RuntimeError):
+        stages.update_face_pick(stages.generated_joints[0], 'Head', moved_face)
+    assert stages.built_picks == built_picks
+    assert stages.rig_graph is None
+    assert controls.registry == registered
+
+    monkeypatch.undo()
+    joint = stages.generated_joints[0]
+    position = head_scene.xform(joint, query=True, translation=True, worldSpace=True)
+    assert stages.update_face_pick(joint, 'Head', moved_face)
+    assert head_scene.xform(joint, query=True, translation=True, worldSpace=True) != position
+    assert stages.built_picks[0] == ('Head', moved_face)
+
+
+def test_joints_are_deleted_after_the_head_stage(head_scene):
+    with transaction.run('joints'):
+        stages.create_joints()
+        stages.create_head_joint()
+        stages.mirror_joints()
+    joints = list(stages.generated_joints)
+    stages.delete_generated_joints()
+    assert not any(head_scene.objExists(joint) for joint in joints)
+    assert head_scene.objExists('Head')
+    # nothing is left to delete and nothing else goes
+    stages.delete_generated_joints()
+    assert head_scene.objExists('Head')
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from conftest import is_mapped, sphere_mesh
+from face_rig import skinning, spatial, weights_io
+
+JOINTS = ['top_joint', 'nose_joint', 'cheek_joint_L', 'cheek_joint_R', 'chin_joint']
+
+
+@pytest.fixture
+def skinned():
+    '''a sphere and its heat weights
+    '''
+    mesh = sphere_mesh(around=32, down=16)
+    vertices = spatial.mesh_index(mesh).nearest_vertices([(0, 10, 0), (0, 0, 10), (7, 0, 7), (-7, 0, 7), (0, -7, 7)])
+    return mesh, skinning.heat_weights(mesh, JOINTS, mesh.points[vertices])
+
+
+def test_round_trip_is_memory_mapped(tmp_path, skinned):
+    mesh, weights = skinned
+    path = str(tmp_path / 'head.frskin')
+    weights_io.save_weights(path, weights, mesh.points, mesh_name='Head')
+    loaded, points, header = weights_io.load_weights(path)
+    assert is_mapped(loaded.weights) and is_mapped(points)
+    assert header['mesh'] == 'Head' and loaded.joint_names == JOINTS
+    assert np.array_equal(loaded.offsets, weights.offsets)
+    assert np.array_equal(loaded.joint_indices, weights.joint_indices)
+    assert np.array_equal(loaded.weights, weights.weights)
+    assert np.array_equal(points, mesh.points.astype(np.float32))
+
+    # an unchanged head keeps its weights as they are
+    remapped = weights_io.remap_weights(loaded, JOINTS, points, mesh.points)
+    assert np.array_equal(remapped.offsets, weights.offsets)
+    assert np.array_equal(remapped.weights, weights.weights)
+
+
+def test_not_a_weights_file(tmp_path):
+    path = tmp_path / 'head.frskin'
+    path.write_bytes(b'not weights')
+    with pytest.raises(ValueError):
+        weights_io.load_weights(str(path))
+
+
+def test_remap_by_joint_name(skinned):
+    mesh, weights = skinned
+    order = list(reversed(JOINTS))
+    remapped = weights_io.remap_weights(weights, order)
+    assert remapped.joint_names == order
+    assert np.allclose(remapped.dense(JOINTS), weights.dense())
+
+    # the nose joint is gone, its weights go to the other joints of each vertex
+    kept = [name for name in JOINTS if name != 'nose_joint']
+    remapped = weights_io.remap_weights(weights, kept, None, mesh.points)
+    dense = remapped.dense()
+    assert remapped.num_points == mesh.num_points
+    assert np.allclose(dense.sum(axis=1), 1.0, atol=1e-5)
+    # a vertex weighted only to the nose takes the weights of its nearest weighted vertex
+    only_nose = np.flatnonzero(weights.dense()[:, 1] > 1 - 1e-6)
+    assert len(only_nose)
+    nose_free = np.flatnonzero(weights.dense()[:, 1] < 1 - 1e-6)
+    nearest = nose_free[spatial.KDTree(mesh.points[nose_free]).query(mesh.points[only_nose])[1]]
+    assert np.allclose(dense[only_nose], dense[nearest])
+
+
+def test_remap_to_nearest_vertices(skinned):
+    mesh, weights = skinned
+    finer = sphere_mesh(around=48, down=24)
+    remapped = weights_io.remap_weights(weights, JOINTS, mesh.points.astype(np.float32), finer.points)
+    assert remapped.num_points == finer.num_points
+    nearest = spatial.KDTree(mesh.points).query(finer.points)[1]
+    assert np.allclose(remapped.dense(), weights.dense()[nearest])
+
+    # the same vertex count with moved points is remapped too
+    turned = mesh.points[:, [2, 1, 0]]
+    remapped = weights_io.remap_weights(weights, JOINTS, mesh.points.astype(np.float32), turned)
+    nearest = spatial.KDTree(mesh.points).query(turned)[1]
+    assert not np.array_equal(nearest, np.arange(mesh.num_points))
+    assert np.allclose(remapped.dense(), weights.dense()[nearest])
+
+    with pytest.raises(ValueError):
+        weights_io.remap_weights(weights, JOINTS, None, finer.points)